@@ -1,6 +1,13 @@
-import json
-import re
 from tqdm import tqdm
+from result_reader import iter_results
+from answer_parsing import parse_binary
+from score_store import SCORE_STORE_DIR, ScoreStore
+from stats import ItemScores, collect_item_scores, ratio_of, failure_rate, safe_divide, format_interval, format_groups
+
+
+RESULT_COLUMNS = ('generated_response', 'is_correct', 'type')  # Fields read from the result file
+ITEM_COLUMNS = ('parsed', 'correct', 'tp', 'fp', 'fn')          # Per-item values kept for bootstrapping
+METRIC_VERSION = '1'  # Bump when score_item changes, so stored item scores are recomputed
 
 
 def extract_binary_answer(generated_str):
@@ -16,36 +23,17 @@ def extract_binary_answer(generated_str):
     Raises:
         ValueError: If parsing fails or format is invalid.
     """
-    # Clean up prompt markers
-    if '</think>' in generated_str:
-        generated_str = generated_str.split("</think>")[-1]
-    if '[/INST]' in generated_str:
-        generated_str = generated_str.split("[/INST]")[-1]
-
-    # Try to extract answer from [ANSWER_START]...[ANSWER_END]
-    pattern = r"\[ANSWER_START\](.*?)\[ANSWER_END\]"
-    match = re.search(pattern, generated_str, re.DOTALL)
-
-    if match:
-        answer = match.group(1).strip()
-    else:
-        # Fall back to last line heuristics
-        generated_str = generated_str.strip()
-        last_line = generated_str.split('\n')[-1]
-        answer = last_line.strip()
-
-    # Interpret answer
-    if 'True' in answer or 'true' in answer:
-        return True
-    elif 'False' in answer or 'false' in answer:
-        return False
-    else:
-        raise ValueError("Invalid or unrecognized answer format")
+    result = parse_binary(generated_str)
+    if result.error:
+        raise ValueError(result.error)
+    return result.value
 
 
 def evaluate_correction_task(output_file_path):
     """
     Evaluates model performance on the correction task benchmark.
+    The results file (JSON or JSONL) is streamed one item at a time, and responses
+    are parsed as in score_item.
 
     Args:
         output_file_path (str): Absolute path to the JSON results file.
@@ -57,25 +45,96 @@ def evaluate_correction_task(output_file_path):
     preds, gts = [], []
     failed, total = 0, 0
 
-    with open(output_file_path, 'r') as f:
-        data = json.load(f)
-
-    for item in tqdm(data, desc="Evaluating"):
+    for item in tqdm(iter_results(output_file_path, columns=RESULT_COLUMNS), desc="Evaluating"):
         total += 1
-        try:
-            pred = extract_binary_answer(item["generated_response"])
-            gt = item["is_correct"]
-            preds.append(pred)
-            gts.append(gt)
-        except Exception:
+        result = parse_binary(item["generated_response"])
+        if result.error:
             failed += 1
+            continue
+        preds.append(result.value)
+        gts.append(item["is_correct"])
 
     return preds, gts, failed, total
 
 
+def precision(sums, n):
+    return safe_divide(sums['tp'], sums['tp'] + sums['fp'])
+
+
+def recall(sums, n):
+    return safe_divide(sums['tp'], sums['tp'] + sums['fn'])
+
+
+def f1(sums, n):
+    return safe_divide(2 * sums['tp'], 2 * sums['tp'] + sums['fp'] + sums['fn'])
+
+
+# Metric name -> function of the per-item column sums (see stats.py)
+METRICS = {
+    "Accuracy": ratio_of('correct', 'parsed'),
+    "Precision": precision,
+    "Recall": recall,
+    "F1": f1,
+    "Failed": failure_rate('parsed'),
+}
+
+
+def score_item(item):
+    """
+    Scores one item. An incorrect step (is_correct False) is the positive class.
+
+    Args:
+        item (dict): Result item with `generated_response` and `is_correct`.
+
+    Returns:
+        dict: Values of ITEM_COLUMNS (all 0 if the response cannot be parsed).
+    """
+    result = parse_binary(item["generated_response"])
+    if result.error:
+        return dict.fromkeys(ITEM_COLUMNS, 0)
+    return classification_scores(result.value, item["is_correct"])
+
+
+def classification_scores(pred, gt):
+    """
+    Per-item values of one parsed prediction. An incorrect step (False) is the positive class.
+
+    Args:
+        pred (bool): Predicted label.
+        gt (bool): Ground truth label.
+
+    Returns:
+        dict: Values of ITEM_COLUMNS.
+    """
+    return {
+        'parsed': 1,
+        'correct': int(pred == gt),
+        'tp': int(pred is False and gt is False),
+        'fp': int(pred is False and gt is True),
+        'fn': int(pred is True and gt is False),
+    }
+
+
+def item_scores(output_file_path, store_dir=SCORE_STORE_DIR):
+    """
+    Scores every item of a result file, keeping per-item values for confidence intervals.
+    Items whose scores are already in the score store are not scored again.
+
+    Args:
+        output_file_path (str): Path to the results file.
+        store_dir (str): Directory of the persistent item scores (None = score every item).
+
+    Returns:
+        ItemScores: Accuracy, Precision, Recall, F1 and Failed per item.
+    """
+    store = ScoreStore(store_dir, 'ERR', METRIC_VERSION, RESULT_COLUMNS) if store_dir else None
+    items = iter_results(output_file_path, columns=RESULT_COLUMNS)
+    return collect_item_scores(items, score_item, ITEM_COLUMNS, METRICS, desc="Evaluating", store=store)
+
+
 def compute_classification_metrics(preds, gts):
     """
-    Computes accuracy, precision, recall, and F1 score.
+    Computes accuracy, precision, recall, and F1 score from the same per-item values as item_scores.
 
     Args:
         preds (List[bool]): Predicted labels.
@@ -84,23 +143,16 @@ def compute_classification_metrics(preds, gts):
     Returns:
         dict: Dictionary with accuracy, precision, recall, and F1.
     """
-    TP = sum((p is False and g is False) for p, g in zip(preds, gts))  # Correctly predicted incorrect
-    FP = sum((p is False and g is True) for p, g in zip(preds, gts))   # Incorrectly flagged as incorrect
-    FN = sum((p is True and g is False) for p, g in zip(preds, gts))   # Missed incorrect
-
-    accuracy = sum(p == g for p, g in zip(preds, gts)) / len(preds) if preds else 0
-    precision = TP / (TP + FP) if (TP + FP) > 0 else 0
-    recall = TP / (TP + FN) if (TP + FN) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-
+    rows = [classification_scores(p, g) for p, g in zip(preds, gts)]
+    columns = {name: [row[name] for row in rows] for name in ITEM_COLUMNS}
+    values = ItemScores(range(len(rows)), columns, METRICS).point_estimates()
     return {
-        "accuracy": accuracy,
-        "precision": precision,
-        "recall": recall,
-        "f1": f1
+        "accuracy": values["Accuracy"],
+        "precision": values["Precision"],
+        "recall": values["Recall"],
+        "f1": values["F1"]
     }
 
-
 def main():
     """
     Main entry point for evaluating a correction task result file.
@@ -108,15 +160,13 @@ def main():
     output_file_path = "/absolute/path/to/LLM_output_file.json"
     print(f"Evaluating: {output_file_path}")
 
-    preds, gts, failed, total = evaluate_correction_task(output_file_path)
-    metrics = compute_classification_metrics(preds, gts)
-
-    print(f"Accuracy: {metrics['accuracy']:.4f}")
-    print(f"Precision: {metrics['precision']:.4f}")
-    print(f"Recall: {metrics['recall']:.4f}")
-    print(f"F1 Score: {metrics['f1']:.4f}")
-    print(f"Failed Parses: {failed}/{total} ({failed / total * 100:.2f}%)")
-    print(f"Total Samples: {total}")
+    scores = item_scores(output_file_path)
+    for metric, (value, low, high) in scores.bootstrap().items():
+        print(f"{metric}: {format_interval(value, low, high)}")
+    print(f"Total Samples: {len(scores)}")
+    print("Per type:")
+    for line in format_groups(scores):
+        print(line)
     print('----------------------')
 
 
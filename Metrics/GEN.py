@@ -1,34 +1,114 @@
 import os
 import json
 import re
+import tempfile
 import nltk
 import numpy as np
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 from nltk.translate.meteor_score import meteor_score
 from rouge_score import rouge_scorer
-from keybert import KeyBERT
-from sentence_transformers import SentenceTransformer, util
-from sklearn.metrics.pairwise import cosine_similarity
+from embedding_cache import EmbeddingCache, text_hash
+from result_reader import iter_results
+from answer_parsing import parse_text_response
+from score_store import SCORE_STORE_DIR, ScoreStore
+from stats import GROUP_FIELD, ItemScores, ratio_of, failure_rate, format_interval, format_groups
 
 
 ### Setup environment and models ###
-nltk.download('punkt')
-nltk.download('wordnet')
+# Models and NLTK data are loaded on first use (see get_embedding_model, get_keyword_model
+# and ensure_nltk_data), so importing this module is cheap and metrics that are not
+# selected never load their models.
+NLTK_RESOURCES = {'punkt': 'tokenizers/punkt', 'punkt_tab': 'tokenizers/punkt_tab', 'wordnet': 'corpora/wordnet'}
+NLTK_OFFLINE = os.environ.get('BIOPROBENCH_OFFLINE') == '1'  # Never call nltk.download (data must already be installed)
 
-EMBEDDING_MODEL = SentenceTransformer('all-mpnet-base-v2')  # For embedding-based metrics
-KEYWORD_MODEL = KeyBERT(SentenceTransformer('all-MiniLM-L6-v2')) #For keyword-based metrics
+EMBEDDING_MODEL_NAME = 'all-mpnet-base-v2'  # For embedding-based metrics
+KEYWORD_MODEL_NAME = 'all-MiniLM-L6-v2'  # For keyword-based metrics
+
+EMBEDDING_MODEL = None  # Loaded by get_embedding_model()
+KEYWORD_MODEL = None  # Loaded by get_keyword_model()
+NLTK_READY = False
+
+# Metric groups computed by evaluate_protocolgen_model
+ALL_METRICS = ('lexical', 'keyword', 'step')  # BLEU/METEOR/ROUGE, keyword overlap, step recall/redundancy
 
 SIMILARITY_THRESHOLD = 0.7
+KEYWORD_TOP_K = 64
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+# Step embeddings are memoized on disk per model and text, so reference steps are only embedded once
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, 'embeddings')  # None = no disk cache
+EMBEDDING_BATCH_SIZE = 256
+
+# Keywords are extracted for this many documents per KeyBERT call; reference keywords are
+# persisted in an index file, so only the generated side is extracted for a new model
+KEYWORD_BATCH_SIZE = 64
+REFERENCE_KEYWORD_INDEX = os.path.join(CACHE_DIR, 'keywords', f'{KEYWORD_MODEL_NAME}_top{KEYWORD_TOP_K}.json')  # None = no index
+
+# BLEU/METEOR/ROUGE are computed in a process pool with this many workers (1 = in the main process)
+LEXICAL_WORKERS = os.cpu_count() or 1
+LEXICAL_CHUNKSIZE = 16
+
+# Items are embedded and scored in chunks of this many new items, so only one chunk of
+# response texts and steps is held in memory however large the result file is
+SCORING_CHUNK_SIZE = 2048
+
+ROUGE_SCORER = None  # Built once per process by get_rouge_scorer()
+
+RESULT_COLUMNS = ('generated_response', 'output', 'type')  # Fields read from the result file
 
 
 def extract_text_response(text):
     """Extract the [ANSWER] section after stripping intermediate tags."""
-    return text.split('</think>')[-1].strip().split('</Structure>')[-1].strip()\
-               .split('[ANSWER_START]')[-1].strip().split('[ANSWER_END]')[0].strip()
+    return parse_text_response(text).value
+
+
+def ensure_nltk_data():
+    """Download the NLTK corpora used by the lexical metrics, unless they are already installed."""
+    global NLTK_READY
+    if NLTK_READY:
+        return
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            if NLTK_OFFLINE:
+                raise
+            nltk.download(name)
+    NLTK_READY = True
+
+
+def get_embedding_model():
+    """Return the sentence embedding model, loading it on first use."""
+    global EMBEDDING_MODEL
+    if EMBEDDING_MODEL is None:
+        from sentence_transformers import SentenceTransformer
+        EMBEDDING_MODEL = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return EMBEDDING_MODEL
+
+
+def get_keyword_model():
+    """Return the KeyBERT keyword model, loading it on first use."""
+    global KEYWORD_MODEL
+    if KEYWORD_MODEL is None:
+        from keybert import KeyBERT
+        from sentence_transformers import SentenceTransformer
+        KEYWORD_MODEL = KeyBERT(SentenceTransformer(KEYWORD_MODEL_NAME))
+    return KEYWORD_MODEL
+
+
+def get_rouge_scorer():
+    """Return this process's RougeScorer, building it on first use."""
+    global ROUGE_SCORER
+    if ROUGE_SCORER is None:
+        ROUGE_SCORER = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+    return ROUGE_SCORER
 
 
 def compute_text_generation_metrics(reference, generated):
+    ensure_nltk_data()
     ref_tokens = nltk.word_tokenize(reference.lower())
     gen_tokens = nltk.word_tokenize(generated.lower())
     
@@ -37,8 +117,7 @@ def compute_text_generation_metrics(reference, generated):
 
     meteor = meteor_score([ref_tokens], gen_tokens)
 
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
-    rouge_scores = scorer.score(reference, generated)
+    rouge_scores = get_rouge_scorer().score(reference, generated)
 
     return {
         "bleu": bleu,
@@ -49,10 +128,85 @@ def compute_text_generation_metrics(reference, generated):
     }
 
 
-def compute_keyword_overlap(ref_text, gen_text, top_k=64):
-    ref_kw = set([kw for kw, _ in KEYWORD_MODEL.extract_keywords(ref_text, top_n=top_k)])
-    gen_kw = set([kw for kw, _ in KEYWORD_MODEL.extract_keywords(gen_text, top_n=top_k)])
-    
+def _init_text_generation_worker():
+    ensure_nltk_data()
+    get_rouge_scorer()
+
+
+def _text_generation_metrics_worker(pair):
+    return compute_text_generation_metrics(*pair)
+
+
+def compute_text_generation_metrics_batch(pairs, num_workers=LEXICAL_WORKERS, chunksize=LEXICAL_CHUNKSIZE):
+    """
+    Compute BLEU/METEOR/ROUGE for a list of (reference, generated) pairs.
+
+    With num_workers > 1 the pairs are dispatched in chunks to a process pool whose
+    workers each build a single RougeScorer. Results are returned in input order.
+    """
+    if num_workers <= 1 or len(pairs) <= chunksize:
+        return [compute_text_generation_metrics(ref, gen) for ref, gen in tqdm(pairs, desc="Lexical metrics")]
+
+    ensure_nltk_data()  # Download once here rather than in every worker
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_text_generation_worker) as pool:
+        results = pool.map(_text_generation_metrics_worker, pairs, chunksize=chunksize)
+        return list(tqdm(results, total=len(pairs), desc="Lexical metrics"))
+
+
+def extract_keywords_batch(texts, top_k=KEYWORD_TOP_K, batch_size=KEYWORD_BATCH_SIZE):
+    """
+    Extract the top_k keywords of every text, passing batch_size documents to each KeyBERT call.
+    KeyBERT then embeds the candidate words of a whole batch at once instead of once per document.
+    """
+    keywords = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        results = get_keyword_model().extract_keywords(batch, top_n=top_k)
+        if len(batch) == 1:
+            results = [results]  # KeyBERT unwraps single-document results
+        elif not results:
+            results = [[] for _ in batch]  # No candidate words in the whole batch
+        keywords.extend(set(kw for kw, _ in doc_keywords) for doc_keywords in results)
+    return keywords
+
+
+def build_reference_keyword_index(ref_texts):
+    """
+    Return {text hash: keywords} for the reference texts.
+
+    Keywords already stored in REFERENCE_KEYWORD_INDEX are reused; missing ones are
+    extracted in batches and written back, so the index is built once per benchmark
+    version (e.g. from Data/GEN_test.json) and shared by every model scored afterwards.
+    """
+    index = {}
+    if REFERENCE_KEYWORD_INDEX and os.path.exists(REFERENCE_KEYWORD_INDEX):
+        with open(REFERENCE_KEYWORD_INDEX, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+
+    missing = [text for text in dict.fromkeys(ref_texts) if text_hash(text) not in index]
+    if missing:
+        for text, keywords in zip(missing, extract_keywords_batch(missing)):
+            index[text_hash(text)] = sorted(keywords)
+        if REFERENCE_KEYWORD_INDEX:
+            index_dir = os.path.dirname(REFERENCE_KEYWORD_INDEX)
+            os.makedirs(index_dir, exist_ok=True)
+            # A unique temporary name, so that processes scoring GEN files at once never write the same file
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(REFERENCE_KEYWORD_INDEX) + '.', suffix='.tmp',
+                                            dir=index_dir or '.')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, REFERENCE_KEYWORD_INDEX)
+    return index
+
+
+def precompute_reference_keywords(test_file_path):
+    """Build the reference keyword index for a benchmark split such as Data/GEN_test.json."""
+    with open(test_file_path, 'r', encoding='utf-8') as f:
+        test_set = json.load(f)
+    build_reference_keyword_index([reference_text(item['output']) for item in test_set])
+
+
+def keyword_overlap(ref_kw, gen_kw):
     if not ref_kw or not gen_kw:
         return 0.0, 0.0, 0.0
 
@@ -63,87 +217,252 @@ def compute_keyword_overlap(ref_text, gen_text, top_k=64):
     return precision, recall, f1
 
 
-def compute_step_recall_and_redundancy(reference_steps, generated_steps):
-    ref_embeds = EMBEDDING_MODEL.encode(reference_steps)
-    gen_embeds = EMBEDDING_MODEL.encode(generated_steps)
-
-    matched_refs = set()
-    matched_gens = set()
-
-    for i, ref_vec in enumerate(ref_embeds):
-        for j, gen_vec in enumerate(gen_embeds):
-            if cosine_similarity([ref_vec], [gen_vec])[0][0] >= SIMILARITY_THRESHOLD:
-                matched_refs.add(i)
-                break
-
-    for i, gen_vec in enumerate(gen_embeds):
-        for j, ref_vec in enumerate(ref_embeds):
-            if cosine_similarity([gen_vec], [ref_vec])[0][0] >= SIMILARITY_THRESHOLD:
-                matched_gens.add(i)
-                break
-
-    sr = len(matched_refs) / len(reference_steps) if reference_steps else 1.0
-    rp = 1.0 - ((len(generated_steps) - len(matched_gens)) / len(generated_steps)) if generated_steps else 1.0
+def compute_keyword_overlap(ref_text, gen_text, top_k=KEYWORD_TOP_K):
+    keyword_model = get_keyword_model()
+    ref_kw = set([kw for kw, _ in keyword_model.extract_keywords(ref_text, top_n=top_k)])
+    gen_kw = set([kw for kw, _ in keyword_model.extract_keywords(gen_text, top_n=top_k)])
+    return keyword_overlap(ref_kw, gen_kw)
+
+
+def compute_keyword_overlap_batch(pairs):
+    """
+    Keyword precision/recall/F1 for a list of (reference, generated) pairs.
+    Reference keywords come from the persisted index; generated keywords are extracted in batches.
+    """
+    ref_index = build_reference_keyword_index([ref for ref, _ in pairs])
+    gen_keywords = extract_keywords_batch([gen for _, gen in pairs])
+    return [keyword_overlap(set(ref_index[text_hash(ref)]), gen_kw)
+            for (ref, _), gen_kw in zip(pairs, gen_keywords)]
+
+
+def normalize_rows(embeds):
+    """L2-normalize each row, leaving all-zero rows unchanged (same as sklearn's cosine_similarity)."""
+    embeds = np.asarray(embeds)
+    norms = np.linalg.norm(embeds, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeds / norms
+
+
+def reference_text(ref):
+    """Join a step-by-step reference protocol into one text."""
+    return " ".join(ref) if isinstance(ref, list) else str(ref)
+
+
+def split_generated_steps(gen_clean):
+    """Split a cleaned generated protocol into non-empty steps, one per line."""
+    return [step.strip() for step in gen_clean.split('\n') if step.strip()]
+
+
+def embed_all_steps(items, cache=None):
+    """
+    Embed every unique reference and generated step of the given items in large batches.
+
+    Returns a function mapping a list of steps to their embeddings. With
+    EMBEDDING_CACHE_DIR set, vectors are looked up in (and added to) the on-disk
+    cache, so only steps never seen before by this embedding model are encoded.
+    `cache` is an EmbeddingCache already opened there, to reuse across calls.
+    """
+    steps = []
+    for item in items:
+        if isinstance(item.get('output'), list) and item.get('generated_response') is not None:
+            steps.extend(item['output'])
+            steps.extend(split_generated_steps(extract_text_response(item['generated_response'])))
+
+    if EMBEDDING_CACHE_DIR:
+        cache = cache or EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME)
+        if cache.missing(steps):  # Only load the embedding model if some step is new
+            cache.encode(steps, get_embedding_model(), batch_size=EMBEDDING_BATCH_SIZE)
+        return cache.get
+
+    unique_steps = list(dict.fromkeys(steps))
+    vectors = get_embedding_model().encode(unique_steps, batch_size=EMBEDDING_BATCH_SIZE) if unique_steps else []
+    lookup = dict(zip(unique_steps, vectors))
+    return lambda texts: np.stack([lookup[text] for text in texts])
+
+
+def compute_step_recall_and_redundancy(reference_steps, generated_steps, embed=None):
+    """
+    Match reference and generated steps through one R x G cosine similarity matrix.
+    A reference step is recalled if its row maximum reaches SIMILARITY_THRESHOLD,
+    and a generated step is non-redundant if its column maximum does.
+
+    `embed` maps a list of steps to their embeddings (defaults to the embedding model's encode).
+    """
+    embed = embed or get_embedding_model().encode
+    if reference_steps and generated_steps:
+        ref_embeds = normalize_rows(embed(reference_steps))
+        gen_embeds = normalize_rows(embed(generated_steps))
+        similarity = ref_embeds @ gen_embeds.T
+        matched_refs = int(np.count_nonzero(similarity.max(axis=1) >= SIMILARITY_THRESHOLD))
+        matched_gens = int(np.count_nonzero(similarity.max(axis=0) >= SIMILARITY_THRESHOLD))
+    else:
+        matched_refs = matched_gens = 0
+
+    sr = matched_refs / len(reference_steps) if reference_steps else 1.0
+    rp = 1.0 - ((len(generated_steps) - matched_gens) / len(generated_steps)) if generated_steps else 1.0
     return sr, rp
 
 
-def evaluate_protocolgen_model(result_path):
-    with open(result_path, 'r') as f:
-        json_list = json.load(f)
-
-    bleu_list, meteor_list, rouge1_list, rouge2_list, rougel_list = [], [], [], [], []
-    kw_precision_list, kw_recall_list, kw_f1_list = [], [], []
-    sr_list, rp_list = [], []
-
-    failed = 0
-
-    for item in tqdm(json_list, desc="Evaluating"):
-            ref = item['output']
-            gen = item['generated_response']
-
-            if gen is None:
-                failed += 1
-                continue
-
-            gen_clean = extract_text_response(gen)
-
-            if isinstance(ref, list):  # step-by-step protocol
-                gen_steps = [step.strip() for step in gen_clean.split('\n') if step.strip()]
-                sr, rp = compute_step_recall_and_redundancy(ref, gen_steps)
-                sr_list.append(sr)
-                rp_list.append(rp)
-                ref_text = " ".join(ref)
-            else:
-                ref_text = str(ref)
-
-            gen_text = str(gen_clean)
-            text_metrics = compute_text_generation_metrics(ref_text, gen_text)
-            bleu_list.append(text_metrics["bleu"])
-            meteor_list.append(text_metrics["meteor"])
-            rouge1_list.append(text_metrics["rouge1"])
-            rouge2_list.append(text_metrics["rouge2"])
-            rougel_list.append(text_metrics["rougeL"])
-
-            kw_p, kw_r, kw_f1 = compute_keyword_overlap(ref_text, gen_text)
-            kw_precision_list.append(kw_p)
-            kw_recall_list.append(kw_r)
-            kw_f1_list.append(kw_f1)
-
-    result = {
-        "BLEU": np.mean(bleu_list),
-        "METEOR": np.mean(meteor_list),
-        "ROUGE-1": np.mean(rouge1_list),
-        "ROUGE-2": np.mean(rouge2_list),
-        "ROUGE-L": np.mean(rougel_list),
-        "KW_Precision": np.mean(kw_precision_list),
-        "KW_Recall": np.mean(kw_recall_list),
-        "KW_F1": np.mean(kw_f1_list),
-        "Step_Recall": np.mean(sr_list) if sr_list else None,
-        "Redundancy_Penalty": np.mean(rp_list) if rp_list else None,
-        "Failed": failed / len(json_list),
-        "Total": len(json_list)
-    }
-
+# Metric groups -> metric name -> function of the per-item column sums (see stats.py)
+GROUP_METRICS = {
+    'lexical': {
+        "BLEU": ratio_of('bleu', 'parsed'),
+        "METEOR": ratio_of('meteor', 'parsed'),
+        "ROUGE-1": ratio_of('rouge1', 'parsed'),
+        "ROUGE-2": ratio_of('rouge2', 'parsed'),
+        "ROUGE-L": ratio_of('rougeL', 'parsed'),
+    },
+    'keyword': {
+        "KW_Precision": ratio_of('kw_precision', 'parsed'),
+        "KW_Recall": ratio_of('kw_recall', 'parsed'),
+        "KW_F1": ratio_of('kw_f1', 'parsed'),
+    },
+    'step': {
+        "Step_Recall": ratio_of('step_recall', 'has_steps'),
+        "Redundancy_Penalty": ratio_of('redundancy', 'has_steps'),
+    },
+}
+ITEM_COLUMNS = ('parsed', 'bleu', 'meteor', 'rouge1', 'rouge2', 'rougeL',
+                'kw_precision', 'kw_recall', 'kw_f1', 'step_recall', 'redundancy', 'has_steps')
+METRIC_VERSION = '1'  # Bump when the item scoring changes, so stored item scores are recomputed
+
+
+def score_chunk(chunk, columns, metrics, num_workers, store=None, embedding_cache=None):
+    """
+    Score a chunk of new items into `columns` and add their scores to the score store.
+
+    The steps of the whole chunk are embedded in one pass, and its keywords and
+    BLEU/METEOR/ROUGE are computed in batches.
+
+    Args:
+        chunk (list): (row, store key, item) of every item to score.
+        columns (dict): Per-item column lists, updated in place at each item's row.
+        metrics (Iterable[str]): Metric groups to compute.
+        num_workers (int): Processes used for BLEU/METEOR/ROUGE.
+        store (ScoreStore): Store receiving the new scores (None = not stored).
+        embedding_cache (EmbeddingCache): Step embedding cache shared by the chunks (see embed_all_steps).
+    """
+    embed = embed_all_steps((item for _, _, item in chunk), embedding_cache) if 'step' in metrics else None
+    text_pairs, parsed_rows = [], []
+    for row, _, item in chunk:
+        ref = item['output']
+        gen = item.get('generated_response')
+
+        if gen is None:
+            continue
+        columns['parsed'][row] = 1.0
+        gen_clean = extract_text_response(gen)
+
+        if isinstance(ref, list) and 'step' in metrics:  # step-by-step protocol
+            gen_steps = split_generated_steps(gen_clean)
+            sr, rp = compute_step_recall_and_redundancy(ref, gen_steps, embed)
+            columns['step_recall'][row] = sr
+            columns['redundancy'][row] = rp
+            columns['has_steps'][row] = 1.0
+
+        text_pairs.append((reference_text(ref), str(gen_clean)))
+        parsed_rows.append(row)
+
+    if 'keyword' in metrics and text_pairs:
+        for row, (kw_p, kw_r, kw_f1) in zip(parsed_rows, compute_keyword_overlap_batch(text_pairs)):
+            columns['kw_precision'][row] = kw_p
+            columns['kw_recall'][row] = kw_r
+            columns['kw_f1'][row] = kw_f1
+
+    if 'lexical' in metrics and text_pairs:
+        for row, text_metrics in zip(parsed_rows, compute_text_generation_metrics_batch(text_pairs, num_workers)):
+            for name in ('bleu', 'meteor', 'rouge1', 'rouge2', 'rougeL'):
+                columns[name][row] = text_metrics[name]
+
+    if store is not None:
+        for row, key, _ in chunk:
+            store.put(key, {name: columns[name][row] for name in ITEM_COLUMNS})
+        store.flush()
+
+
+def metric_version(metrics):
+    """
+    Version of the stored item scores: the scoring code, the models and thresholds it
+    depends on, and the metric groups computed.
+    """
+    return ':'.join([METRIC_VERSION, EMBEDDING_MODEL_NAME, KEYWORD_MODEL_NAME, str(SIMILARITY_THRESHOLD),
+                     str(KEYWORD_TOP_K), ','.join(group for group in ALL_METRICS if group in metrics)])
+
+
+def item_scores(result_path, num_workers=LEXICAL_WORKERS, metrics=ALL_METRICS, store_dir=SCORE_STORE_DIR):
+    """
+    Score every item of a GEN result file (JSON or JSONL), streaming it item by item.
+
+    Items whose scores are already in the score store are not embedded or scored again,
+    so only new or regenerated responses pay for the embedding and KeyBERT models. New
+    items are scored in chunks of SCORING_CHUNK_SIZE (see score_chunk), so apart from the
+    per-item scores only one chunk of items is held in memory.
+
+    Args:
+        result_path (str): Path to the result file.
+        num_workers (int): Processes used for BLEU/METEOR/ROUGE.
+        metrics (Iterable[str]): Metric groups to compute ('lexical', 'keyword', 'step');
+                                 models needed only by unselected groups are never loaded.
+        store_dir (str): Directory of the persistent item scores (None = score every item).
+
+    Returns:
+        ItemScores: Per-item columns (0 for unselected groups and failed items). The step
+                    metrics are left out if no reference is a list of steps.
+    """
+    unknown = set(metrics) - set(ALL_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown GEN metrics: {sorted(unknown)}")
+
+    store = ScoreStore(store_dir, 'GEN', metric_version(metrics), RESULT_COLUMNS) if store_dir else None
+    ids, groups = [], []
+    columns = {name: [] for name in ITEM_COLUMNS}
+    chunk = []  # (row, store key, item) of the new items not scored yet
+    embedding_cache = None
+    if 'step' in metrics and EMBEDDING_CACHE_DIR:
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME)
+
+    for item in tqdm(iter_results(result_path, columns=RESULT_COLUMNS), desc="Evaluating"):
+        ids.append(item['id'])
+        groups.append(item.get(GROUP_FIELD))
+        key = store.key(item) if store is not None else None
+        stored = store.get(key) if store is not None else None
+        for name in ITEM_COLUMNS:
+            columns[name].append(stored[name] if stored is not None else 0.0)
+        if stored is None:
+            chunk.append((len(ids) - 1, key, item))
+        if len(chunk) >= SCORING_CHUNK_SIZE:
+            score_chunk(chunk, columns, metrics, num_workers, store, embedding_cache)
+            chunk = []
+    score_chunk(chunk, columns, metrics, num_workers, store, embedding_cache)
+
+    if store is not None:
+        print(f"Scored {store.misses} items, reused {store.hits} stored item scores")
+        store.close()
+
+    selected = {}
+    for group in ALL_METRICS:
+        if group in metrics:
+            selected.update(GROUP_METRICS[group])
+    if not any(columns['has_steps']):  # No reference given as a list of steps
+        for name in GROUP_METRICS['step']:
+            selected.pop(name, None)
+    selected["Failed"] = failure_rate('parsed')
+    return ItemScores(ids, columns, selected, groups)
+
+
+def evaluate_protocolgen_model(result_path, num_workers=LEXICAL_WORKERS, metrics=ALL_METRICS, store_dir=SCORE_STORE_DIR):
+    """
+    Score a GEN result file (JSON or JSONL), streaming it item by item.
+
+    `metrics` selects the metric groups to compute ('lexical', 'keyword', 'step');
+    models needed only by unselected groups are never loaded.
+    """
+    scores = item_scores(result_path, num_workers, metrics, store_dir)
+    result = scores.point_estimates()
+    if 'step' in metrics:
+        for name in GROUP_METRICS['step']:
+            result.setdefault(name, None)
+    result["Total"] = len(scores)
     return result
 
 
@@ -151,7 +470,10 @@ if __name__ == "__main__":
     output_file_path = "/absolute/path/to/LLM_output_file.json"
     print(f"Evaluating: {output_file_path}")
 
-    results = evaluate_protocolgen_model(output_file_path)
-
-    for key, value in results.items():
-        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    scores = item_scores(output_file_path)
+    for key, (value, low, high) in scores.bootstrap().items():
+        print(f"{key}: {format_interval(value, low, high)}")
+    print(f"Total: {len(scores)}")
+    print("Per type:")
+    for line in format_groups(scores):
+        print(line)
@@ -1,8 +1,14 @@
-import json
-import re
-import ast
-from itertools import combinations
+from collections import Counter, defaultdict, deque
 from tqdm import tqdm
+from result_reader import iter_results
+from answer_parsing import parse_index_list
+from score_store import SCORE_STORE_DIR, ScoreStore
+from stats import collect_item_scores, ratio_of, failure_rate, safe_divide, format_interval, format_groups
+
+
+RESULT_COLUMNS = ('generated_response', 'wrong_steps', 'correct_steps', 'type')  # Fields read from the result file
+ITEM_COLUMNS = ('parsed', 'exact', 'discordant', 'pairs', 'item_tau', 'has_tau')  # Per-item values kept for bootstrapping
+METRIC_VERSION = '1'  # Bump when score_item changes, so stored item scores are recomputed
 
 
 def extract_predicted_order(generated_str, wrong_steps, correct_steps):
@@ -20,23 +26,11 @@ def extract_predicted_order(generated_str, wrong_steps, correct_steps):
     Raises:
         ValueError: If output is malformed or indices are invalid.
     """
-    generated_str = generated_str.split("</think>")[-1]
-    pattern = r"\[ANSWER_START\](.*?)\[ANSWER_END\]"
-    match = re.findall(pattern, generated_str, re.DOTALL)
-
-    if not match:
-        raise ValueError("Missing [ANSWER_START]/[ANSWER_END]")
+    result = parse_index_list(generated_str, len(correct_steps))
+    if result.error:
+        raise ValueError(result.error)
 
-    index_str = match[-1].strip()
-    try:
-        generated_indices = ast.literal_eval(index_str)
-    except Exception:
-        raise ValueError("Cannot parse step indices as list")
-
-    if set(generated_indices) != set(range(len(correct_steps))):
-        raise ValueError("Invalid or incomplete index set")
-
-    predicted_steps = [wrong_steps[i] for i in generated_indices]
+    predicted_steps = [wrong_steps[i] for i in result.value]
     return predicted_steps, correct_steps
 
 
@@ -55,39 +49,122 @@ def calculate_exact_match(gts, preds):
     return correct / len(gts) if gts else 0
 
 
+def map_to_gt_positions(gt, pr):
+    """
+    Maps each predicted step to its position in the ground truth sequence.
+
+    Steps with identical text are matched in order of occurrence, so every
+    position is used exactly once even when step texts repeat.
+
+    Args:
+        gt (List[str]): Ground truth step sequence.
+        pr (List[str]): Predicted step sequence (a permutation of gt).
+
+    Returns:
+        List[int]: Ground truth position of each predicted step.
+
+    Raises:
+        ValueError: If pr is not a permutation of gt.
+    """
+    positions = defaultdict(deque)
+    for i, step in enumerate(gt):
+        positions[step].append(i)
+    try:
+        return [positions[step].popleft() for step in pr]
+    except IndexError:
+        raise ValueError("Predicted steps are not a permutation of the ground truth")
+
+
+def count_inversions(seq):
+    """
+    Counts pairs i < j with seq[i] > seq[j] using merge sort in O(n log n).
+
+    Args:
+        seq (List[int]): Sequence of distinct integers.
+
+    Returns:
+        int: Number of inversions.
+    """
+    seq = list(seq)
+    inversions = 0
+    width = 1
+    while width < len(seq):
+        merged = []
+        for start in range(0, len(seq), 2 * width):
+            left = seq[start:start + width]
+            right = seq[start + width:start + 2 * width]
+            i = j = 0
+            while i < len(left) and j < len(right):
+                if left[i] <= right[j]:
+                    merged.append(left[i])
+                    i += 1
+                else:
+                    merged.append(right[j])
+                    inversions += len(left) - i
+                    j += 1
+            merged.extend(left[i:])
+            merged.extend(right[j:])
+        seq = merged
+        width *= 2
+    return inversions
+
+
+def kendall_tau_pairs(gt, pr):
+    """
+    Counts discordant and comparable step pairs for a single item.
+
+    Pairs of steps with identical text cannot be ordered and are left out.
+
+    Args:
+        gt (List[str]): Ground truth step sequence.
+        pr (List[str]): Predicted step sequence.
+
+    Returns:
+        Tuple[int, int]: Number of discordant pairs and number of comparable pairs.
+    """
+    n = len(gt)
+    tied = sum(c * (c - 1) // 2 for c in Counter(gt).values())
+    total = n * (n - 1) // 2 - tied
+    discordant = count_inversions(map_to_gt_positions(gt, pr))
+    return discordant, total
+
+
 def calculate_kendall_tau(gts, preds):
     """
     Computes Kendall's Tau between predicted and ground truth sequences.
 
+    The original version returned only the pooled value; callers that used it as
+    a float now take the first element of the returned tuple.
+
     Args:
         gts (List[List[str]]): Ground truth step sequences.
         preds (List[List[str]]): Predicted step sequences.
 
     Returns:
-        float: Average Kendall's Tau score.
+        Tuple[float, List[float]]: Kendall's Tau pooled over the pairs of all items,
+                                   and the Tau of each item (NaN for items with
+                                   fewer than two comparable steps).
     """
     total_pairs = 0
-    concordant_pairs = 0
+    discordant_pairs = 0
+    per_item = []
 
     for gt, pr in zip(gts, preds):
-        gt_rank = {step: i for i, step in enumerate(gt)}
-        pr_rank = {step: i for i, step in enumerate(pr)}
-
-        for a, b in combinations(gt_rank.keys(), 2):
-            gt_order = gt_rank[a] - gt_rank[b]
-            pr_order = pr_rank[a] - pr_rank[b]
-            if gt_order * pr_order > 0:
-                concordant_pairs += 1
-            total_pairs += 1
+        discordant, total = kendall_tau_pairs(gt, pr)
+        discordant_pairs += discordant
+        total_pairs += total
+        per_item.append((total - 2 * discordant) / total if total else float('nan'))
 
     if total_pairs == 0:
-        return 0
-    return (2 * concordant_pairs - total_pairs) / total_pairs
+        return 0, per_item
+    return (total_pairs - 2 * discordant_pairs) / total_pairs, per_item
 
 
 def evaluate_sorting_predictions(output_file_path):
     """
     Evaluates the sorting performance of a model using a benchmark output JSON.
+    The file (JSON or JSONL) is streamed one item at a time, and responses are
+    parsed as in score_item.
 
     Args:
         output_file_path (str): Absolute path to the JSON file.
@@ -96,13 +173,10 @@ def evaluate_sorting_predictions(output_file_path):
         Tuple[List, List, int, int]: predicted sequences, ground truth sequences,
                                      number of failed parses, and total samples.
     """
-    with open(output_file_path, 'r') as f:
-        data = json.load(f)
-
     preds, gts = [], []
     failed, total = 0, 0
 
-    for item in tqdm(data, desc="Evaluating"):
+    for item in tqdm(iter_results(output_file_path, columns=RESULT_COLUMNS), desc="Evaluating"):
         total += 1
         try:
             pr, gt = extract_predicted_order(item["generated_response"], item["wrong_steps"], item["correct_steps"])
@@ -114,6 +188,71 @@ def evaluate_sorting_predictions(output_file_path):
     return preds, gts, failed, total
 
 
+def pooled_kendall_tau(sums, n):
+    """
+    Kendall's Tau pooled over the comparable pairs of all items.
+
+    Args:
+        sums (Dict[str, ndarray]): Column sums (one value per resample).
+        n (int): Number of items (unused).
+
+    Returns:
+        ndarray: Pooled Tau (0 if no item has comparable pairs).
+    """
+    return safe_divide(sums['pairs'] - 2 * sums['discordant'], sums['pairs'])
+
+
+# Metric name -> function of the per-item column sums (see stats.py)
+METRICS = {
+    "Exact_Match": ratio_of('exact', 'parsed'),
+    "Kendall_Tau": pooled_kendall_tau,
+    "Mean_Item_Tau": ratio_of('item_tau', 'has_tau'),
+    "Failed": failure_rate('parsed'),
+}
+
+
+def score_item(item):
+    """
+    Scores one item.
+
+    Args:
+        item (dict): Result item with `generated_response`, `wrong_steps` and `correct_steps`.
+
+    Returns:
+        dict: Values of ITEM_COLUMNS (all 0 if the response cannot be parsed).
+    """
+    try:
+        pr, gt = extract_predicted_order(item["generated_response"], item["wrong_steps"], item["correct_steps"])
+        discordant, total = kendall_tau_pairs(gt, pr)
+    except Exception:
+        return dict.fromkeys(ITEM_COLUMNS, 0)
+    return {
+        'parsed': 1,
+        'exact': int(gt == pr),
+        'discordant': discordant,
+        'pairs': total,
+        'item_tau': (total - 2 * discordant) / total if total else 0,
+        'has_tau': int(total > 0),
+    }
+
+
+def item_scores(output_file_path, store_dir=SCORE_STORE_DIR):
+    """
+    Scores every item of a result file, keeping per-item values for confidence intervals.
+    Items whose scores are already in the score store are not scored again.
+
+    Args:
+        output_file_path (str): Path to the JSON (or JSONL) file.
+        store_dir (str): Directory of the persistent item scores (None = score every item).
+
+    Returns:
+        ItemScores: Exact_Match, Kendall_Tau, Mean_Item_Tau and Failed per item.
+    """
+    store = ScoreStore(store_dir, 'ORD', METRIC_VERSION, RESULT_COLUMNS) if store_dir else None
+    items = iter_results(output_file_path, columns=RESULT_COLUMNS)
+    return collect_item_scores(items, score_item, ITEM_COLUMNS, METRICS, desc="Evaluating", store=store)
+
+
 def main():
     """
     Main entry point for evaluating a sorting model.
@@ -121,15 +260,13 @@ def main():
     output_file_path = "/absolute/path/to/LLM_output_file.json"
     print(f"Evaluating: {output_file_path}")
 
-    preds, gts, failed, total = evaluate_sorting_predictions(output_file_path)
-
-    exact_match = calculate_exact_match(gts, preds)
-    kendall_tau = calculate_kendall_tau(gts, preds)
-
-    print(f"Exact Match: {exact_match:.4f}")
-    print(f"Kendall's Tau: {kendall_tau:.4f}")
-    print(f"Failed Parses: {failed}/{total} ({failed / total * 100:.2f}%)")
-    print(f"Total Samples: {total}")
+    scores = item_scores(output_file_path)
+    for metric, (value, low, high) in scores.bootstrap().items():
+        print(f"{metric}: {format_interval(value, low, high)}")
+    print(f"Total Samples: {len(scores)}")
+    print("Per type:")
+    for line in format_groups(scores):
+        print(line)
     print("---------------------------")
 
 
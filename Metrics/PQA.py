@@ -1,8 +1,20 @@
-import json
-import re
 from tqdm import tqdm
-import numpy as np
-from sklearn.metrics import brier_score_loss
+from result_reader import iter_results
+from answer_parsing import parse_answer_and_confidence
+from score_store import SCORE_STORE_DIR, ScoreStore
+from stats import collect_item_scores, ratio_of, failure_rate, format_interval, format_groups
+
+
+RESULT_COLUMNS = ('generated_response', 'answer', 'type')  # Fields read from the result file
+ITEM_COLUMNS = ('parsed', 'correct', 'squared_error')      # Per-item values kept for bootstrapping
+METRIC_VERSION = '1'  # Bump when score_item changes, so stored item scores are recomputed
+# Metric name -> function of the per-item column sums (see stats.py)
+METRICS = {
+    "Accuracy": ratio_of('correct', 'parsed'),
+    "Brier_Score": ratio_of('squared_error', 'parsed'),
+    "Failed": failure_rate('parsed'),
+}
+
 
 def extract_answer_and_confidence(generated_str):
     """
@@ -17,44 +29,16 @@ def extract_answer_and_confidence(generated_str):
     Raises:
         ValueError: if parsing fails or confidence is invalid.
     """
-    # Remove intermediate thinking steps if present
-    if '</think>' in generated_str:
-        generated_str = generated_str.split("</think>")[-1]
-
-    # Extract content between [ANSWER_START] and [ANSWER_END]
-    pattern = r"\[ANSWER_START\](.*?)\[ANSWER_END\]"
-    match = re.search(pattern, generated_str, re.DOTALL)
-    if not match:
-        raise ValueError("Missing [ANSWER_START] or [ANSWER_END]")
-
-    content = match.group(1).strip()
-
-    # Handle possible answer-confidence formats
-    if '&' in content:
-        parts = content.split('&')
-        if len(parts) != 2:
-            raise ValueError("Expected one '&' to separate answer and confidence")
-    else:
-        parts = content.split(' ')
-        parts = [' '.join(parts[:-1]), parts[-1]]
-
-    answer = parts[0].strip()
-
-    # Extract numerical confidence
-    confidence_match = re.search(r"\d+", parts[-1])
-    if not confidence_match:
-        raise ValueError("Confidence value not found")
-    confidence = int(confidence_match.group())
-
-    if confidence > 100:
-        raise ValueError("Confidence cannot exceed 100")
-
-    return answer, confidence
+    result = parse_answer_and_confidence(generated_str)
+    if result.error:
+        raise ValueError(result.error)
+    return result.value
 
 
 def evaluate_predictions(output_file_path):
     """
-    Evaluates predictions from a JSON output file.
+    Evaluates predictions from a JSON (or JSONL) output file, streaming one item at a time.
+    Responses are parsed as in score_item; item_scores gives the metrics with confidence intervals.
 
     Args:
         output_file_path (str): Absolute path to the JSON file containing model outputs.
@@ -66,27 +50,57 @@ def evaluate_predictions(output_file_path):
             failed (int): Number of failed parses.
             total (int): Total number of examples processed.
     """
-    with open(output_file_path, 'r') as f:
-        data = json.load(f)
-
-    accs = []
-    cfds = []
-    failed = 0
-    total = 0
-
-    for item in tqdm(data, desc="Evaluating"):
-            total += 1
-            generated_str = item['generated_response']
-            try:
-                answer, confidence = extract_answer_and_confidence(generated_str)
-                cfds.append(confidence)
-                accs.append(1 if answer == item['answer'] else 0)
-            except Exception:
-                failed += 1
+    accs, cfds = [], []
+    failed, total = 0, 0
+
+    for item in tqdm(iter_results(output_file_path, columns=RESULT_COLUMNS), desc="Evaluating"):
+        total += 1
+        result = parse_answer_and_confidence(item['generated_response'])
+        if result.error:
+            failed += 1
+            continue
+        answer, confidence = result.value
+        accs.append(1 if answer == item['answer'] else 0)
+        cfds.append(confidence)
 
     return accs, cfds, failed, total
 
 
+def score_item(item):
+    """
+    Scores one item.
+
+    Args:
+        item (dict): Result item with `generated_response` and `answer`.
+
+    Returns:
+        dict: Values of ITEM_COLUMNS (all 0 if the response cannot be parsed).
+    """
+    result = parse_answer_and_confidence(item['generated_response'])
+    if result.error:
+        return dict.fromkeys(ITEM_COLUMNS, 0)
+    answer, confidence = result.value
+    correct = 1 if answer == item['answer'] else 0
+    return {'parsed': 1, 'correct': correct, 'squared_error': (confidence / 100 - correct) ** 2}
+
+
+def item_scores(output_file_path, store_dir=SCORE_STORE_DIR):
+    """
+    Scores every item of a result file, keeping per-item values for confidence intervals.
+    Items whose scores are already in the score store are not scored again.
+
+    Args:
+        output_file_path (str): Path to the JSON (or JSONL) file containing model outputs.
+        store_dir (str): Directory of the persistent item scores (None = score every item).
+
+    Returns:
+        ItemScores: Accuracy, Brier_Score and Failed per item.
+    """
+    store = ScoreStore(store_dir, 'PQA', METRIC_VERSION, RESULT_COLUMNS) if store_dir else None
+    items = iter_results(output_file_path, columns=RESULT_COLUMNS)
+    return collect_item_scores(items, score_item, ITEM_COLUMNS, METRICS, desc="Evaluating", store=store)
+
+
 def main():
     """
     Entry point for evaluation. Define the absolute path to the output JSON file here.
@@ -94,16 +108,13 @@ def main():
     output_file_path = "/absolute/path/to/LLM_output_file.json"
     print(f"Evaluating: {output_file_path}")
 
-    accs, cfds, failed, total = evaluate_predictions(output_file_path)
-
-    accuracy = sum(accs) / len(accs) if accs else 0
-    brier = brier_score_loss(accs, np.array(cfds) / 100) if accs else None
-
-    print(f'Failed parses: {failed}/{total} ({failed / total * 100:.2f}%)')
-    print(f'Total samples: {total}')
-    print(f'Accuracy: {accuracy:.4f}')
-    if brier is not None:
-        print(f'Brier Score: {brier:.4f}')
+    scores = item_scores(output_file_path)
+    for metric, (value, low, high) in scores.bootstrap().items():
+        print(f'{metric}: {format_interval(value, low, high)}')
+    print(f'Total samples: {len(scores)}')
+    print('Per type:')
+    for line in format_groups(scores):
+        print(line)
     print('-----------------------')
 
 
@@ -1,65 +1,121 @@
-import json
-import re
-from tqdm import tqdm
+from result_reader import iter_results
+from answer_parsing import parse_binary
+from score_store import SCORE_STORE_DIR, ScoreStore
+from stats import collect_item_scores, safe_divide, format_interval, format_groups
+import ERR
+
+
+RESULT_COLUMNS = ('LLM_judge',)  # Fields read from the result file
+# Per-item values kept for bootstrapping: the ERR columns plus the LLM-judge verdict
+ITEM_COLUMNS = ERR.ITEM_COLUMNS + ('judged', 'judge_parsed', 'consistent')
+METRIC_VERSION = ERR.METRIC_VERSION + '.1'  # Bump the last part when score_item changes
 
 
 def extract_binary_answer(generated_str):
     """Extract True/False answer from generated string."""
-    if '</think>' in generated_str:
-        generated_str = generated_str.split("</think>")[-1]
-
-    pattern = r"\[ANSWER_START\](.*?)\[ANSWER_END\]"
-    match = re.search(pattern, generated_str, re.DOTALL)
-    if match:
-        answer = match.group(1).strip()
-    else:
-        answer = generated_str.strip().split('\n')[-1]
-
-    if 'True' in answer or 'true' in answer:
-        return True
-    elif 'False' in answer or 'false' in answer:
-        return False
-    else:
-        raise ValueError("Invalid or unrecognized answer format.")
-
-
-def evaluate_step_reasoning_model(result_path):
-    llm_judge = 0
-    total = 0
-    failed = 0
-
-    with open(result_path, 'r') as f:
-        data = json.load(f)
-
-    for item in tqdm(data, desc="Evaluating Step Reasoning"):
-        if "LLM_judge" in item:
-            total += 1
-            try:
-                is_correct = extract_binary_answer(item['LLM_judge'])
-                llm_judge += int(is_correct)
-            except Exception:
-                failed += 1
-                continue
-
-    acc = llm_judge / (total - failed) * 100 if (total - failed) > 0 else 0
-    fail_rate = failed / total * 100 if total > 0 else 0
+    result = parse_binary(generated_str)
+    if result.error:
+        raise ValueError(result.error)
+    return result.value
 
+
+def evaluate_step_reasoning_model(result_path, store_dir=SCORE_STORE_DIR):
+    """
+    Evaluates the LLM-judge verdicts of a result file (see item_scores).
+
+    Args:
+        result_path (str): Path to the result file.
+        store_dir (str): Directory of the persistent item scores (None = score every item).
+
+    Returns:
+        dict: Consistency and Failure_Rate (in percent), the number of judged items (Total)
+              and the number of verdicts that could not be parsed (Failed).
+    """
+    scores = item_scores(result_path, store_dir)
+    values = scores.point_estimates()
+    judged = int(scores.column('judged').sum())
     return {
-        "Consistency": acc,
-        "Failure_Rate": fail_rate,
-        "Total": total,
-        "Failed": failed,
+        "Consistency": values.get("Consistency", 0),
+        "Failure_Rate": values.get("Failure_Rate", 0),
+        "Total": judged,
+        "Failed": judged - int(scores.column('judge_parsed').sum()),
     }
 
 
+def consistency(sums, n):
+    return 100 * safe_divide(sums['consistent'], sums['judge_parsed'])
+
+
+def judge_failure_rate(sums, n):
+    return 100 * safe_divide(sums['judged'] - sums['judge_parsed'], sums['judged'])
+
+
+# Metric name -> function of the per-item column sums (see stats.py).
+# The judge metrics are percentages of the judged items, as in the original script.
+JUDGE_METRICS = {
+    "Consistency": consistency,
+    "Failure_Rate": judge_failure_rate,
+}
+METRICS = {**ERR.METRICS, **JUDGE_METRICS}
+
+
+def score_item(item):
+    """
+    Scores one item: the ERR answer and, if the item was judged, the LLM-judge verdict.
+
+    Args:
+        item (dict): Result item with `generated_response`, `is_correct` and optionally `LLM_judge`.
+
+    Returns:
+        dict: Values of ITEM_COLUMNS.
+    """
+    scores = ERR.score_item(item)
+    scores.update(judged=0, judge_parsed=0, consistent=0)
+    if "LLM_judge" in item:
+        scores['judged'] = 1
+        result = parse_binary(item['LLM_judge'])
+        if not result.error:
+            scores['judge_parsed'] = 1
+            scores['consistent'] = int(result.value)
+    return scores
+
+
+def item_scores(result_path, store_dir=SCORE_STORE_DIR):
+    """
+    Scores every item of a result file, keeping per-item values for confidence intervals.
+    Items whose scores are already in the score store are not scored again.
+
+    The judge metrics (Consistency, Failure_Rate) are only included if some item was judged.
+
+    Args:
+        result_path (str): Path to the result file.
+        store_dir (str): Directory of the persistent item scores (None = score every item).
+
+    Returns:
+        ItemScores: The ERR metrics plus the LLM-judge metrics per item.
+    """
+    columns = ERR.RESULT_COLUMNS + RESULT_COLUMNS
+    store = ScoreStore(store_dir, 'REA-ERR', METRIC_VERSION, columns) if store_dir else None
+    items = iter_results(result_path, columns=columns)
+    scores = collect_item_scores(items, score_item, ITEM_COLUMNS, METRICS, desc="Evaluating Step Reasoning",
+                                 store=store)
+    if not scores.column('judged').any():
+        scores.metrics = ERR.METRICS
+    return scores
+
+
 if __name__ == "__main__":
     """
     Main entry point for evaluating a Reasoning for Error Correction task result file.
     """
     output_file_path = "/absolute/path/to/LLM_output_file.json"
     print(f"Evaluating: {output_file_path}")
-    results = evaluate_step_reasoning_model(output_file_path)
-    print(f"LLM_judge: {results['LLM_Judge_Accuracy']:.2f}%")
-    print(f"Failed: {results['Failure_Rate']:.2f}%")
-    print(f"Total: {results['Total']}")
+    scores = item_scores(output_file_path)
+    for metric, (value, low, high) in scores.bootstrap().items():
+        print(f"{metric}: {format_interval(value, low, high)}")
+    print(f"Total: {int(scores.column('judged').sum())}")  # Judged items, as in the original script
+    print(f"Items: {len(scores)}")
+    print("Per type:")
+    for line in format_groups(scores):
+        print(line)
     print('----------------------')
@@ -0,0 +1,224 @@
+import re
+import ast
+from collections import Counter, namedtuple
+
+
+# Everything up to the last of these markers is reasoning (or an echoed prompt), not the answer
+REASONING_MARKERS = ('</think>', '[/INST]')
+ANSWER_START = '[ANSWER_START]'
+ANSWER_END = '[ANSWER_END]'
+STRUCTURE_END = '</Structure>'  # End of the REA-GEN chain-of-thought block
+
+TRUE_PATTERN = re.compile(r"True|true")
+FALSE_PATTERN = re.compile(r"False|false")
+CONFIDENCE_PATTERN = re.compile(r"\d+")
+
+
+ParseResult = namedtuple('ParseResult', ['value', 'answer', 'error'])
+ParseResult.__doc__ = """
+Outcome of parsing one model response.
+
+Fields:
+    value: The parsed answer (bool, (answer, confidence), list of indices or text), or None on failure.
+    answer: The raw text the value was parsed from, or None if it could not be located.
+    error (str): Reason the parse failed, or None on success.
+"""
+
+
+def _failure(error, answer=None):
+    return ParseResult(None, answer, error)
+
+
+def answer_region(generated_str, markers=REASONING_MARKERS):
+    """
+    Returns the part of a response after the last reasoning marker.
+
+    The markers are searched from the right, so a multi-MB chain of thought is
+    scanned once and never split or copied.
+
+    Args:
+        generated_str (str): The raw output string from the model.
+        markers (Tuple[str]): Markers that end the reasoning part.
+
+    Returns:
+        str: The text after the last marker (the whole string if there is none).
+    """
+    start = 0
+    for marker in markers:
+        pos = generated_str.rfind(marker)
+        if pos != -1:
+            start = max(start, pos + len(marker))
+    return generated_str[start:] if start else generated_str
+
+
+def find_last_answer_block(text):
+    """
+    Returns the content of the last [ANSWER_START]...[ANSWER_END] block, or None.
+
+    Args:
+        text (str): Text to search (usually the output of answer_region).
+
+    Returns:
+        str or None: Content between the tags, not stripped.
+    """
+    end = text.rfind(ANSWER_END)
+    if end == -1:
+        return None
+    start = text.rfind(ANSWER_START, 0, end)
+    if start == -1:
+        return None
+    return text[start + len(ANSWER_START):end]
+
+
+def parse_binary(generated_str):
+    """
+    Parses a True/False answer (ERR, REA-ERR and LLM-judge outputs).
+
+    Falls back to the last line of the response if there is no answer block.
+
+    Args:
+        generated_str (str): The raw output string from the model.
+
+    Returns:
+        ParseResult: value is a bool.
+    """
+    if not isinstance(generated_str, str):
+        return _failure("missing response")
+
+    region = answer_region(generated_str)
+    block = find_last_answer_block(region)
+    if block is not None:
+        answer = block.strip()
+    else:
+        answer = region.strip().rsplit('\n', 1)[-1].strip()
+
+    if TRUE_PATTERN.search(answer):
+        return ParseResult(True, answer, None)
+    if FALSE_PATTERN.search(answer):
+        return ParseResult(False, answer, None)
+    return _failure("unrecognized answer", answer)
+
+
+def parse_answer_and_confidence(generated_str):
+    """
+    Parses a PQA answer of the form `choice & confidence` (or `choice confidence`).
+
+    Args:
+        generated_str (str): The raw output string from the model.
+
+    Returns:
+        ParseResult: value is a (answer: str, confidence: int) tuple.
+    """
+    if not isinstance(generated_str, str):
+        return _failure("missing response")
+
+    block = find_last_answer_block(answer_region(generated_str))
+    if block is None:
+        return _failure("missing answer block")
+    content = block.strip()
+
+    # Handle possible answer-confidence formats
+    if '&' in content:
+        parts = content.split('&')
+        if len(parts) != 2:
+            return _failure("expected one '&' to separate answer and confidence", content)
+    else:
+        parts = content.split(' ')
+        parts = [' '.join(parts[:-1]), parts[-1]]
+
+    confidence_match = CONFIDENCE_PATTERN.search(parts[-1])
+    if not confidence_match:
+        return _failure("confidence value not found", content)
+    confidence = int(confidence_match.group())
+    if confidence > 100:
+        return _failure("confidence exceeds 100", content)
+
+    return ParseResult((parts[0].strip(), confidence), content, None)
+
+
+def parse_index_list(generated_str, num_steps):
+    """
+    Parses an ORD answer: a permutation of the step indices 0..num_steps-1.
+
+    Args:
+        generated_str (str): The raw output string from the model.
+        num_steps (int): Number of steps to order.
+
+    Returns:
+        ParseResult: value is a list of int.
+    """
+    if not isinstance(generated_str, str):
+        return _failure("missing response")
+
+    block = find_last_answer_block(answer_region(generated_str))
+    if block is None:
+        return _failure("missing answer block")
+    content = block.strip()
+
+    try:
+        indices = ast.literal_eval(content)
+    except Exception:
+        return _failure("cannot parse step indices as list", content)
+    if not isinstance(indices, (list, tuple)) or not all(isinstance(i, int) for i in indices):
+        return _failure("cannot parse step indices as list", content)
+    if len(indices) != num_steps or set(indices) != set(range(num_steps)):
+        return _failure("invalid or incomplete index set", content)
+
+    return ParseResult(list(indices), content, None)
+
+
+def parse_text_response(generated_str):
+    """
+    Extracts a free-text answer (GEN, REA-GEN).
+
+    Drops the reasoning and the REA-GEN <Structure> block, then keeps the text after
+    the last [ANSWER_START] up to the next [ANSWER_END]. Responses without tags are
+    returned whole, so parsing only fails for a missing response.
+
+    Args:
+        generated_str (str): The raw output string from the model.
+
+    Returns:
+        ParseResult: value is the stripped answer text.
+    """
+    if not isinstance(generated_str, str):
+        return _failure("missing response")
+
+    region = answer_region(generated_str, REASONING_MARKERS + (STRUCTURE_END,))
+    start = region.rfind(ANSWER_START)
+    if start != -1:
+        region = region[start + len(ANSWER_START):]
+    end = region.find(ANSWER_END)
+    if end != -1:
+        region = region[:end]
+    text = region.strip()
+    return ParseResult(text, text, None)
+
+
+def parse_batch(parser, responses, *columns):
+    """
+    Parses a whole column of responses.
+
+    Args:
+        parser (Callable): One of the parse_* functions.
+        responses (Iterable[str]): Model responses.
+        *columns (Iterable): Extra per-response arguments of the parser
+                             (e.g. the number of steps for parse_index_list).
+
+    Returns:
+        List[ParseResult]: One result per response, in order.
+    """
+    return [parser(response, *args) for response, *args in zip(responses, *columns)]
+
+
+def failure_reasons(results):
+    """
+    Counts the failure reasons of a list of parse results.
+
+    Args:
+        results (Iterable[ParseResult]): Parse results.
+
+    Returns:
+        Counter: Number of failures per reason.
+    """
+    return Counter(result.error for result in results if result.error is not None)
@@ -0,0 +1,76 @@
+import os
+import glob
+import uuid
+import hashlib
+import numpy as np
+
+
+def text_hash(text):
+    """Stable key of a text in the embedding cache."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk memo of sentence embeddings, keyed by embedding model name and text hash.
+
+    Each call to add() writes one shard: a `.npy` matrix of vectors, memory-mapped
+    when it is read back, and a `.keys` file holding the text hash of every row. The
+    keys file is renamed into place only after the vectors are written, so several
+    evaluation processes can share a cache directory without a lock and a crashed
+    run never leaves a half-written shard behind.
+    """
+
+    def __init__(self, cache_dir, model_name):
+        self.dir = os.path.join(cache_dir, model_name.replace('/', '__'))
+        os.makedirs(self.dir, exist_ok=True)
+        self._shards = []
+        self._index = {}
+        for keys_file in sorted(glob.glob(os.path.join(self.dir, '*.keys'))):
+            self._load_shard(keys_file[:-len('.keys')])
+
+    def _load_shard(self, prefix):
+        shard = len(self._shards)
+        self._shards.append(np.load(prefix + '.npy', mmap_mode='r'))
+        with open(prefix + '.keys', 'r', encoding='utf-8') as f:
+            for row, key in enumerate(f):
+                self._index[key.strip()] = (shard, row)
+
+    def __len__(self):
+        return len(self._index)
+
+    def missing(self, texts):
+        """Return the unique texts that have no cached embedding, in first-seen order."""
+        seen = set()
+        missing = []
+        for text in texts:
+            key = text_hash(text)
+            if key not in self._index and key not in seen:
+                seen.add(key)
+                missing.append(text)
+        return missing
+
+    def add(self, texts, vectors):
+        """Store the embeddings of `texts` as a new shard."""
+        # Every shard gets a fresh uuid, so no two processes ever write the same (temporary) file
+        prefix = os.path.join(self.dir, uuid.uuid4().hex)
+        np.save(prefix + '.npy', np.asarray(vectors, dtype=np.float32))
+        with open(prefix + '.keys.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(text_hash(text) + '\n' for text in texts)
+        os.replace(prefix + '.keys.tmp', prefix + '.keys')
+        self._load_shard(prefix)
+
+    def get(self, texts):
+        """Return the cached embeddings of `texts` as a (len(texts), dim) array."""
+        rows = [self._index[text_hash(text)] for text in texts]
+        return np.stack([self._shards[shard][row] for shard, row in rows])
+
+    def encode(self, texts, model, batch_size=256, show_progress_bar=True):
+        """
+        Make sure every text in `texts` is cached, encoding the missing ones with `model` in large batches.
+        """
+        missing = self.missing(texts)
+        if missing:
+            vectors = model.encode(missing, batch_size=batch_size, show_progress_bar=show_progress_bar)
+            self.add(missing, vectors)
+        return len(missing)
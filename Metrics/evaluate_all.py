@@ -0,0 +1,272 @@
+import os
+import re
+import csv
+import json
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from result_reader import iter_results
+from score_store import SCORE_STORE_DIR
+from stats import N_RESAMPLES, paired_test, format_interval
+
+
+RESULT_FILE_PATTERN = re.compile(r"^(?P<task>[A-Z]+(?:-[A-Z]+)?)_test_(?P<model>.+)\.(?:jsonl?|parquet)$")
+ID_PATTERN = re.compile(r"^TEST-(?P<task>[A-Z]+)-")
+SHARD_FILE_PATTERN = re.compile(r"\.shard-\d+-of-\d+\.")  # Partial outputs of a sharded run (see Scripts/merge_shards.py)
+TASKS = ('PQA', 'ORD', 'ERR', 'REA-ERR', 'GEN', 'REA-GEN')
+
+
+def detect_task(file_path):
+    """
+    Detects the task of a result file from the id of its first item.
+
+    ERR and GEN ids are shared with the reasoning variants (REA-ERR, REA-GEN); these
+    are told apart by the file name prefix, or by an `LLM_judge` field for REA-ERR.
+
+    Args:
+        file_path (str): Path to the result file.
+
+    Returns:
+        str: One of TASKS.
+
+    Raises:
+        ValueError: If the file is empty or its ids do not look like benchmark ids.
+    """
+    first = next(iter_results(file_path), None)
+    if first is None:
+        raise ValueError("Empty result file")
+    match = ID_PATTERN.match(str(first.get('id', '')))
+    if not match:
+        raise ValueError(f"Unrecognized item id: {first.get('id')}")
+    task = match.group('task')
+
+    name = os.path.basename(file_path)
+    if name.startswith(f'REA-{task}_') or (task == 'ERR' and 'LLM_judge' in first):
+        task = f'REA-{task}'
+    if task not in TASKS:
+        raise ValueError(f"Unsupported task: {task}")
+    return task
+
+
+def score_pqa(file_path, num_workers, store_dir):
+    return importlib.import_module('PQA').item_scores(file_path, store_dir)
+
+
+def score_ord(file_path, num_workers, store_dir):
+    return importlib.import_module('ORD').item_scores(file_path, store_dir)
+
+
+def score_err(file_path, num_workers, store_dir):
+    return importlib.import_module('ERR').item_scores(file_path, store_dir)
+
+
+def score_rea_err(file_path, num_workers, store_dir):
+    # REA-ERR is scored with the ERR metrics plus the LLM-judge consistency, if judged
+    return importlib.import_module('REA-ERR').item_scores(file_path, store_dir)
+
+
+def score_gen(file_path, num_workers, store_dir):
+    return importlib.import_module('GEN').item_scores(file_path, num_workers=num_workers, store_dir=store_dir)
+
+
+SCORERS = {
+    'PQA': score_pqa,
+    'ORD': score_ord,
+    'ERR': score_err,
+    'REA-ERR': score_rea_err,
+    'GEN': score_gen,
+    'REA-GEN': score_gen,
+}
+
+
+def metric_values(scores, n_bootstrap=0):
+    """
+    Returns the metrics of ItemScores as table columns, with CI columns if n_bootstrap > 0.
+    """
+    if not n_bootstrap:
+        return scores.point_estimates()
+    values = {}
+    for metric, (value, low, high) in scores.bootstrap(n_bootstrap).items():
+        values.update({metric: value, f"{metric}_CI_low": low, f"{metric}_CI_high": high})
+    return values
+
+
+def evaluate_file(file_path, gen_workers, n_bootstrap=0, by_type=False, store_dir=SCORE_STORE_DIR):
+    """
+    Detects the task of one result file and scores it with the matching Metrics module.
+
+    Args:
+        file_path (str): Path to the result file.
+        gen_workers (int): Process count for GEN lexical metrics.
+        n_bootstrap (int): Bootstrap resamples for confidence intervals (0 = none).
+        by_type (bool): Also return one row per item `type` (operation, reagent, ...).
+        store_dir (str): Directory of the persistent item scores (None = score every item).
+
+    Returns:
+        List[Tuple[dict, ItemScores]]: Rows of the results table with their per-item scores;
+                                       the row of the whole file comes first.
+    """
+    task = detect_task(file_path)
+    match = RESULT_FILE_PATTERN.match(os.path.basename(file_path))
+    model = match.group('model') if match else os.path.splitext(os.path.basename(file_path))[0]
+    scores = SCORERS[task](file_path, gen_workers, store_dir)
+
+    def make_row(item_type, values, row_scores):
+        row = {"Model": model, "Task": task, "File": os.path.basename(file_path)}
+        if by_type:
+            row["Type"] = item_type
+        row.update(values)
+        row["Total"] = len(row_scores)
+        if 'judged' in row_scores.column_names:
+            # REA-ERR judge metrics are over the judged items only (the original script's "Total")
+            row["Judged"] = int(row_scores.column('judged').sum())
+        return row
+
+    results = [(make_row('all', metric_values(scores, n_bootstrap), scores), scores)]
+    if by_type:
+        # All groups come from one pass over the item matrix; bootstrapping needs the items of each group
+        groups = scores.by_group()
+        for item_type in scores.group_names:
+            group_scores = scores.group(item_type)
+            values = metric_values(group_scores, n_bootstrap) if n_bootstrap else groups[item_type]
+            results.append((make_row(item_type, values, group_scores), group_scores))
+    return results
+
+
+def add_paired_tests(rows, scores, baseline, n_resamples):
+    """
+    Compares every model with a baseline model on each task (and item type) the baseline was scored on.
+
+    Adds `{metric}_diff` (model - baseline) and `{metric}_p` (paired permutation test)
+    columns to the rows of the other models.
+
+    Args:
+        rows (List[dict]): Rows of the results table.
+        scores (List[ItemScores]): Per-item scores of each row.
+        baseline (str): Model name of the baseline.
+        n_resamples (int): Number of permutations.
+    """
+    def key(row):
+        return row['Task'], row.get('Type')
+
+    baseline_scores = {key(row): item for row, item in zip(rows, scores) if row['Model'] == baseline}
+    if not baseline_scores:
+        print(f"Baseline model {baseline} not found, skipping paired tests")
+    for row, item in zip(rows, scores):
+        if row['Model'] == baseline or key(row) not in baseline_scores:
+            continue
+        tests = paired_test(item, baseline_scores[key(row)], n_resamples)
+        for metric, test in tests.items():
+            row[f"{metric}_diff"] = test['diff']
+            row[f"{metric}_p"] = test['p_value']
+
+
+def find_result_files(result_dir):
+    """Lists the `{TASK}_test_{MODEL}.json(l)` and `.parquet` files of a directory."""
+    return sorted(
+        os.path.join(result_dir, name) for name in os.listdir(result_dir)
+        if RESULT_FILE_PATTERN.match(name) and not name.endswith('.checkpoint.jsonl')
+        and not SHARD_FILE_PATTERN.search(name)
+    )
+
+
+def evaluate_directory(result_dir, num_workers=1, n_bootstrap=0, baseline=None, by_type=False,
+                       store_dir=SCORE_STORE_DIR):
+    """
+    Scores every result file of a directory, several files at a time.
+
+    Args:
+        result_dir (str): Directory holding `{TASK}_test_{MODEL}.json` files.
+        num_workers (int): Number of files scored in parallel processes.
+        n_bootstrap (int): Bootstrap resamples for confidence intervals and paired tests (0 = none).
+        baseline (str): Model compared with every other model by paired tests (None = no tests).
+        by_type (bool): Add one row per item `type` after the row of each file.
+        store_dir (str): Directory of the persistent item scores; only new or changed
+                         items are scored (None = score every item).
+
+    Returns:
+        List[dict]: One row per file (and item type), sorted by model and task.
+    """
+    files = find_result_files(result_dir)
+    results, errors = [], []
+
+    if num_workers <= 1:
+        for file_path in files:
+            try:
+                results.append(evaluate_file(file_path, os.cpu_count() or 1, n_bootstrap, by_type, store_dir))
+            except Exception as e:
+                errors.append((file_path, e))
+    else:
+        # Files are already scored in parallel, so GEN lexical metrics stay in each worker
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = {pool.submit(evaluate_file, file_path, 1, n_bootstrap, by_type, store_dir): file_path for file_path in files}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append((futures[future], e))
+
+    for file_path, e in errors:
+        print(f"Skipped {file_path}: {e}")
+    results.sort(key=lambda file_results: (file_results[0][0]['Model'], TASKS.index(file_results[0][0]['Task'])))
+    results = [result for file_results in results for result in file_results]
+    rows = [row for row, _ in results]
+    if baseline:
+        add_paired_tests(rows, [scores for _, scores in results], baseline, n_bootstrap or N_RESAMPLES)
+    return rows
+
+
+def write_results_table(rows, output_path):
+    """Writes the results table as CSV, or as JSON if output_path ends with .json."""
+    if output_path.endswith('.json'):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=4, ensure_ascii=False)
+        return
+
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    """
+    Scores all result files in a directory and writes one consolidated table.
+    """
+    parser = argparse.ArgumentParser(description="Evaluate every {TASK}_test_{MODEL}.json file in a directory.")
+    parser.add_argument('result_dir', help="Directory with the model output files")
+    parser.add_argument('--output', default='results.csv', help="Results table (.csv or .json)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Number of files scored in parallel")
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help="Add bootstrap confidence intervals from N resamples (e.g. 10000)")
+    parser.add_argument('--baseline', metavar='MODEL',
+                        help="Add paired significance tests of every model against this model")
+    parser.add_argument('--by-type', action='store_true',
+                        help="Add one row per item type (e.g. operation/parameter/reagent) of every file")
+    parser.add_argument('--rescore', action='store_true',
+                        help="Score every item again instead of reusing stored item scores")
+    args = parser.parse_args()
+
+    rows = evaluate_directory(args.result_dir, args.workers, args.bootstrap, args.baseline, args.by_type,
+                              None if args.rescore else SCORE_STORE_DIR)
+    write_results_table(rows, args.output)
+
+    for row in rows:
+        scores = []
+        for key, value in row.items():
+            if key in ('Model', 'Task', 'File', 'Type', 'Total', 'Judged') or value is None or key.endswith(('_CI_low', '_CI_high')):
+                continue
+            if f"{key}_CI_low" in row:
+                scores.append(f"{key}: {format_interval(value, row[f'{key}_CI_low'], row[f'{key}_CI_high'])}")
+            else:
+                scores.append(f"{key}: {value:.4f}")
+        task = f"{row['Task']} ({row['Type']})" if 'Type' in row else row['Task']
+        print(f"{row['Model']} | {task} | {', '.join(scores)}")
+    print(f"Results of {len({row['File'] for row in rows})} files saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
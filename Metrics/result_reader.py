@@ -0,0 +1,173 @@
+import os
+import re
+import json
+from functools import lru_cache
+
+try:
+    import ijson
+except ImportError:  # Optional: fall back to the incremental decoder below
+    ijson = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only needed for Parquet result files
+    pq = None
+
+
+CHUNK_SIZE = 1 << 20  # Characters read from the file at a time by the fallback decoder
+SEPARATORS = ' \t\r\n,'
+
+# Parquet result files only hold `id` and the model outputs; other fields are joined from here
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data')
+ID_TASK_PATTERN = re.compile(r"^TEST-(?P<task>[A-Z]+)-")
+
+
+def _first_char(file_path):
+    """Return the first non-whitespace character of a file ('' if it is empty)."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return ''
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped[0]
+
+
+def _iter_json_array(f):
+    """
+    Yield the elements of a JSON array from a text file without loading the whole array.
+
+    Only the current element (plus at most one read chunk) is held in memory. If an
+    element does not fit in the buffer, the buffer is grown geometrically so that
+    very large elements are still decoded in linear time.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos = '', 0
+
+    def read_more(size=CHUNK_SIZE):
+        nonlocal buffer, pos
+        chunk = f.read(size)
+        if not chunk:
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    read_more()
+    buffer = buffer.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array")
+    pos = 1
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in SEPARATORS:
+            pos += 1
+        if pos == len(buffer):
+            if not read_more():
+                raise ValueError("Unterminated JSON array")
+            continue
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not read_more(max(CHUNK_SIZE, len(buffer) - pos)):
+                raise
+            continue
+        if end == len(buffer) and read_more(max(CHUNK_SIZE, len(buffer) - pos)):
+            continue  # The element may continue in the next chunk
+        yield item
+        pos = end
+
+
+def benchmark_file(sample_id, data_dir=DATA_DIR):
+    """Return the `Data/{TASK}_test.json` split that a benchmark id belongs to."""
+    match = ID_TASK_PATTERN.match(str(sample_id))
+    if not match:
+        raise ValueError(f"Cannot tell the benchmark split of id {sample_id}")
+    return os.path.join(data_dir, f"{match.group('task')}_test.json")
+
+
+@lru_cache(maxsize=4)
+def load_benchmark_columns(file_path, columns):
+    """
+    Return {id: {column: value}} for the given columns of a benchmark split.
+
+    Only the requested columns are kept, so a split is never held in memory whole.
+    """
+    return {
+        item['id']: {column: item[column] for column in columns if column in item}
+        for item in iter_results(file_path)
+    }
+
+
+def _iter_parquet(file_path, columns, data_dir):
+    """
+    Yield the rows of a Parquet result file, reading only the requested columns.
+    Requested columns that are not stored in the file are joined from the benchmark split by id.
+    """
+    if pq is None:
+        raise ImportError("Reading Parquet result files needs pyarrow (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(file_path)
+    stored = parquet_file.schema_arrow.names
+    if columns is None:
+        read, joined = stored, ()
+    else:
+        read = ['id'] + [column for column in columns if column in stored and column != 'id']
+        joined = tuple(column for column in columns if column not in stored)
+
+    benchmark = None
+    for batch in parquet_file.iter_batches(columns=read):
+        for row in batch.to_pylist():
+            # Missing outputs are stored as nulls; drop them like absent keys in a JSON file
+            item = {key: value for key, value in row.items() if value is not None}
+            if joined:
+                if benchmark is None:
+                    benchmark = load_benchmark_columns(benchmark_file(item['id'], data_dir), joined)
+                if item['id'] not in benchmark:
+                    raise ValueError(f"Id {item['id']} is not in the benchmark split")
+                item.update(benchmark[item['id']])
+            yield item
+
+
+def iter_results(file_path, columns=None, data_dir=DATA_DIR):
+    """
+    Yields the items of a result file one at a time.
+
+    Accepts a JSON array (as written by the generation scripts), JSON Lines (one
+    item per line, e.g. a checkpoint log) or Parquet. JSON arrays are parsed with
+    ijson when it is installed, and with an incremental decoder otherwise, so memory
+    use is bounded by the largest single item rather than the file size.
+
+    Parquet files hold only `id` and the model outputs. Only `columns` are read from
+    them, and requested benchmark fields (e.g. `answer`, `correct_steps`) are joined
+    from `Data/{TASK}_test.json` by id. JSON items always contain all their fields.
+
+    Args:
+        file_path (str): Path to the JSON, JSONL or Parquet results file.
+        columns (Iterable[str]): Fields needed by the caller (None = all stored fields).
+        data_dir (str): Directory of the benchmark splits joined into Parquet results.
+
+    Yields:
+        dict: One result item.
+    """
+    if file_path.endswith('.parquet'):
+        yield from _iter_parquet(file_path, columns, data_dir)
+        return
+
+    if _first_char(file_path) == '[':
+        if ijson is not None:
+            with open(file_path, 'rb') as f:
+                yield from ijson.items(f, 'item', use_float=True)
+        else:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                yield from _iter_json_array(f)
+        return
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
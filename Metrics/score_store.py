@@ -0,0 +1,91 @@
+import os
+import json
+import hashlib
+import sqlite3
+
+
+# Per-item scores are kept here, so re-evaluating a grown or partly regenerated result
+# file only scores the new or changed items
+SCORE_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'scores')  # None = always re-score
+
+
+def item_hash(item, fields):
+    """Stable hash of the fields of a result item that its scores depend on."""
+    payload = json.dumps([item.get(field) for field in fields], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ScoreStore:
+    """
+    Persistent per-item scores of one task, stored in SQLite.
+
+    Rows are keyed by (task, item id, hash of the scored fields, metric version). The
+    hash covers the model response and the reference fields, so the same id scored
+    for different models (or a regenerated response) gets its own row, and bumping
+    the metric version of an evaluator invalidates all its old rows. All rows of the
+    task and version are read once when the store is opened; new scores are buffered
+    and written in one transaction by flush().
+
+    Args:
+        store_dir (str): Directory of the SQLite database (shared by all tasks).
+        task (str): Task name, e.g. 'PQA' or 'REA-ERR'.
+        version (str): Metric version of the evaluator.
+        fields (Sequence[str]): Item fields the scores depend on.
+    """
+
+    def __init__(self, store_dir, task, version, fields):
+        os.makedirs(store_dir, exist_ok=True)
+        self.path = os.path.join(store_dir, 'scores.sqlite')
+        self.task = task
+        self.version = str(version)
+        self.fields = tuple(fields)
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        # Several evaluation processes may write at once; wait for the lock instead of failing
+        self._conn = sqlite3.connect(self.path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS item_scores ("
+            "task TEXT, id TEXT, hash TEXT, version TEXT, scores TEXT, "
+            "PRIMARY KEY (task, id, hash, version))"
+        )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, hash, scores FROM item_scores WHERE task = ? AND version = ?",
+            (self.task, self.version)
+        )
+        self._scores = {(sample_id, digest): scores for sample_id, digest, scores in rows}
+
+    def key(self, item):
+        """Return the key of a result item: (id, hash of its scored fields)."""
+        return str(item['id']), item_hash(item, self.fields)
+
+    def __contains__(self, key):
+        return key in self._scores
+
+    def get(self, key):
+        """Return the stored column values of an item, or None if it has to be scored."""
+        scores = self._scores.get(key)
+        if scores is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(scores)
+
+    def put(self, key, scores):
+        """Buffer the column values of a newly scored item."""
+        encoded = json.dumps(scores)
+        self._scores[key] = encoded
+        self._pending.append((self.task, key[0], key[1], self.version, encoded))
+
+    def flush(self):
+        """Write the buffered scores to the database."""
+        if self._pending:
+            self._conn.executemany("INSERT OR REPLACE INTO item_scores VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._conn.commit()
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self._conn.close()
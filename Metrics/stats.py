@@ -0,0 +1,321 @@
+from functools import partial
+import numpy as np
+from tqdm import tqdm
+
+
+N_RESAMPLES = 10000
+CONFIDENCE = 0.95
+RESAMPLE_CHUNK = 1000  # Resamples drawn per matrix product, bounds memory to RESAMPLE_CHUNK x n_items
+SEED = 0
+GROUP_FIELD = 'type'     # Item field that splits the benchmark into categories
+
+
+def ratio_of(numerator, denominator=None):
+    """
+    Metric that divides the sum of one per-item column by the sum of another
+    (by the number of items if `denominator` is None). Empty denominators give 0.
+
+    Args:
+        numerator (str): Column summed in the numerator.
+        denominator (str): Column summed in the denominator.
+
+    Returns:
+        Callable: Function of (column sums, number of items), vectorized over resamples.
+    """
+    # Metrics are partials of module-level functions so that ItemScores can be pickled
+    return partial(_ratio, numerator=numerator, denominator=denominator)
+
+
+def _ratio(sums, n, numerator, denominator):
+    den = sums[denominator] if denominator is not None else n
+    return safe_divide(sums[numerator], den)
+
+
+def failure_rate(parsed_column):
+    """
+    Metric giving the fraction of items whose `parsed_column` is 0.
+    """
+    return partial(_failure_rate, parsed_column=parsed_column)
+
+
+def _failure_rate(sums, n, parsed_column):
+    return safe_divide(n - sums[parsed_column], n)
+
+
+def safe_divide(numerator, denominator):
+    """Element-wise numerator / denominator, with 0 where the denominator is 0."""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator != 0, numerator / np.where(denominator != 0, denominator, 1), 0.0)
+
+
+class ItemScores:
+    """
+    Per-item metric columns of one result file.
+
+    Every metric is a function of the column sums (see ratio_of), so a bootstrap
+    resample is just a weighted sum of the items: thousands of resamples are one
+    matrix product of multinomial resampling weights with the column matrix.
+    Items that failed to parse are kept (with a 0 in their `parsed` column), so two
+    models scored on the same test set have the same ids and can be paired.
+
+    Items can carry a group label (the `type` field of the benchmark, e.g. operation,
+    parameter or reagent). Labels are stored as integer codes into `group_names`, so
+    every metric of every group comes from one bincount per column (see by_group).
+
+    Args:
+        ids (List[str]): Item ids.
+        columns (Dict[str, Sequence[float]]): Per-item values, one array per column.
+        metrics (Dict[str, Callable]): Metric name -> function of (column sums, number of items).
+        groups (Sequence[str]): Group label of each item (None = no groups).
+    """
+
+    def __init__(self, ids, columns, metrics, groups=None):
+        self.ids = list(ids)
+        self.column_names = list(columns)
+        self.matrix = np.zeros((len(self.ids), len(self.column_names)))
+        for j, name in enumerate(self.column_names):
+            self.matrix[:, j] = columns[name]
+        self.metrics = metrics
+        self.set_groups(groups)
+
+    @classmethod
+    def from_matrix(cls, ids, column_names, matrix, metrics, groups=None):
+        scores = cls([], {}, metrics)
+        scores.ids = list(ids)
+        scores.column_names = list(column_names)
+        scores.matrix = matrix
+        scores.set_groups(groups)
+        return scores
+
+    def set_groups(self, groups):
+        """
+        Set the group label of every item. Missing labels (None) form the group 'unknown'.
+        """
+        if groups is None:
+            self.group_names, self.group_codes = [], None
+            return
+        labels = ['unknown' if group is None else str(group) for group in groups]
+        if len(labels) != len(self.ids):
+            raise ValueError(f"Got {len(labels)} group labels for {len(self.ids)} items")
+        names, codes = np.unique(np.array(labels, dtype=str), return_inverse=True)
+        self.group_names = [str(name) for name in names]
+        self.group_codes = codes.astype(np.intp).reshape(-1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, name):
+        return self.matrix[:, self.column_names.index(name)]
+
+    def _evaluate(self, sums, n):
+        named = {name: sums[..., j] for j, name in enumerate(self.column_names)}
+        return {metric: fn(named, n) for metric, fn in self.metrics.items()}
+
+    def point_estimates(self):
+        """
+        Return the value of every metric on the full set of items.
+        """
+        values = self._evaluate(self.matrix.sum(axis=0), len(self))
+        return {metric: float(value) for metric, value in values.items()}
+
+    def by_group(self):
+        """
+        Return the value of every metric within each group, in a single pass over the items.
+
+        Returns:
+            Dict[str, Dict[str, float]]: Group -> metric -> value (empty if there are no groups).
+        """
+        if self.group_codes is None:
+            return {}
+        n_groups = len(self.group_names)
+        counts = np.bincount(self.group_codes, minlength=n_groups)
+        sums = np.zeros((n_groups, len(self.column_names)))
+        for j in range(len(self.column_names)):
+            sums[:, j] = np.bincount(self.group_codes, weights=self.matrix[:, j], minlength=n_groups)
+        values = self._evaluate(sums, counts)
+        return {
+            group: {metric: float(value[g]) for metric, value in values.items()}
+            for g, group in enumerate(self.group_names)
+        }
+
+    def group_sizes(self):
+        """Return the number of items in each group."""
+        if self.group_codes is None:
+            return {}
+        counts = np.bincount(self.group_codes, minlength=len(self.group_names))
+        return {group: int(count) for group, count in zip(self.group_names, counts)}
+
+    def group(self, name):
+        """Return the scores of the items of one group."""
+        return self.subset(np.flatnonzero(self.group_codes == self.group_names.index(name)))
+
+    def subset(self, positions):
+        """
+        Return the scores of the items at `positions` (e.g. the items of one category).
+        """
+        positions = np.asarray(positions, dtype=np.intp)
+        groups = None if self.group_codes is None else [self.group_names[c] for c in self.group_codes[positions]]
+        return ItemScores.from_matrix([self.ids[i] for i in positions], self.column_names,
+                                      self.matrix[positions], self.metrics, groups)
+
+    def align(self, other):
+        """
+        Return the scores of both files restricted to their shared ids, in the same order.
+        """
+        positions = {sample_id: i for i, sample_id in enumerate(other.ids)}
+        mine = [i for i, sample_id in enumerate(self.ids) if sample_id in positions]
+        theirs = [positions[self.ids[i]] for i in mine]
+        return self.subset(mine), other.subset(theirs)
+
+    def bootstrap(self, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=SEED):
+        """
+        Percentile bootstrap confidence intervals of every metric.
+
+        Returns:
+            Dict[str, Tuple[float, float, float]]: Metric -> (estimate, lower, upper).
+        """
+        samples = {metric: [] for metric in self.metrics}
+        for weights in resampling_weights(len(self), n_resamples, seed):
+            values = self._evaluate(weights @ self.matrix, len(self))
+            for metric, value in values.items():
+                samples[metric].append(value)
+
+        alpha = (1 - confidence) / 2
+        estimates = self.point_estimates()
+        result = {}
+        for metric, chunks in samples.items():
+            low, high = np.quantile(np.concatenate(chunks), [alpha, 1 - alpha])
+            result[metric] = (estimates[metric], float(low), float(high))
+        return result
+
+
+def resampling_weights(n_items, n_resamples=N_RESAMPLES, seed=SEED, chunk=RESAMPLE_CHUNK):
+    """
+    Yield bootstrap resamples as (chunk, n_items) matrices of how often each item is drawn.
+
+    The same seed gives the same resamples, so two models scored on aligned items
+    are resampled identically (a paired bootstrap).
+    """
+    rng = np.random.default_rng(seed)
+    uniform = np.full(n_items, 1.0 / n_items) if n_items else np.zeros(0)
+    for start in range(0, n_resamples, chunk):
+        size = min(chunk, n_resamples - start)
+        if not n_items:
+            yield np.zeros((size, 0))
+            continue
+        yield rng.multinomial(n_items, uniform, size=size).astype(np.float64)
+
+
+def paired_test(scores_a, scores_b, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=SEED):
+    """
+    Compare two models scored with the same metrics on the same items.
+
+    The difference of every metric (A - B) gets a paired bootstrap confidence
+    interval. Its p-value comes from a paired permutation test: each resample swaps
+    the outputs of A and B on a random subset of the items, which is one matrix
+    product per chunk of resamples.
+
+    Args:
+        scores_a (ItemScores): Scores of model A.
+        scores_b (ItemScores): Scores of model B (only ids shared with A are used).
+        n_resamples (int): Number of bootstrap resamples and permutations.
+        confidence (float): Confidence level of the interval.
+        seed (int): Random seed.
+
+    Returns:
+        Dict[str, dict]: Metric -> {'diff', 'ci_low', 'ci_high', 'p_value'}.
+    """
+    a, b = scores_a.align(scores_b)
+    n = len(a)
+    sums_a, sums_b = a.matrix.sum(axis=0), b.matrix.sum(axis=0)
+    observed = {
+        metric: float(diff) for metric, diff in
+        _metric_difference(a, a._evaluate(sums_a, n), b._evaluate(sums_b, n)).items()
+    }
+
+    boot = {metric: [] for metric in a.metrics}
+    for weights in resampling_weights(n, n_resamples, seed):
+        diffs = _metric_difference(a, a._evaluate(weights @ a.matrix, n), b._evaluate(weights @ b.matrix, n))
+        for metric, diff in diffs.items():
+            boot[metric].append(diff)
+
+    # Swapping item i moves (b_i - a_i) into A's sums and (a_i - b_i) into B's sums
+    delta = b.matrix - a.matrix
+    rng = np.random.default_rng(seed + 1)
+    extreme = {metric: 0 for metric in a.metrics}
+    for start in range(0, n_resamples, RESAMPLE_CHUNK):
+        size = min(RESAMPLE_CHUNK, n_resamples - start)
+        swaps = rng.integers(0, 2, size=(size, n)).astype(np.float64)
+        shift = swaps @ delta
+        diffs = _metric_difference(a, a._evaluate(sums_a + shift, n), b._evaluate(sums_b - shift, n))
+        for metric, diff in diffs.items():
+            extreme[metric] += int(np.count_nonzero(np.abs(diff) >= abs(observed[metric]) - 1e-12))
+
+    alpha = (1 - confidence) / 2
+    result = {}
+    for metric in a.metrics:
+        low, high = np.quantile(np.concatenate(boot[metric]), [alpha, 1 - alpha])
+        result[metric] = {
+            'diff': observed[metric],
+            'ci_low': float(low),
+            'ci_high': float(high),
+            'p_value': (extreme[metric] + 1) / (n_resamples + 1),
+        }
+    return result
+
+
+def _metric_difference(scores, values_a, values_b):
+    return {metric: np.asarray(values_a[metric]) - np.asarray(values_b[metric]) for metric in scores.metrics}
+
+
+def collect_item_scores(items, score_item, column_names, metrics, desc="Scoring items", group_field=GROUP_FIELD,
+                        store=None):
+    """
+    Build ItemScores by applying a per-item scoring function to a stream of result items.
+
+    Args:
+        items (Iterable[dict]): Result items (e.g. from iter_results).
+        score_item (Callable): Returns a dict of column values for one item.
+        column_names (Sequence[str]): Columns returned by score_item.
+        metrics (Dict[str, Callable]): Metric definitions passed to ItemScores.
+        group_field (str): Item field used as group label (None = no groups).
+        store (ScoreStore): Persistent item scores; only items missing from it are
+                            scored, and it is closed when done (None = score every item).
+
+    Returns:
+        ItemScores: The per-item scores.
+    """
+    ids, rows, groups = [], [], []
+    for item in tqdm(items, desc=desc):
+        ids.append(item['id'])
+        groups.append(item.get(group_field) if group_field else None)
+        key = store.key(item) if store is not None else None
+        scores = store.get(key) if store is not None else None
+        if scores is None:
+            scores = score_item(item)
+            if store is not None:
+                store.put(key, scores)
+        rows.append([scores[name] for name in column_names])
+    if store is not None:
+        print(f"Scored {store.misses} items, reused {store.hits} stored item scores")
+        store.close()
+    matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(column_names))
+    return ItemScores.from_matrix(ids, column_names, matrix, metrics, groups if group_field else None)
+
+
+def format_groups(scores):
+    """
+    Format the per-group metrics of ItemScores as lines of text, one group per line.
+    """
+    sizes = scores.group_sizes()
+    return [
+        f"  {group} ({sizes[group]}): " + ", ".join(f"{metric}: {value:.4f}" for metric, value in values.items())
+        for group, values in scores.by_group().items()
+    ]
+
+
+def format_interval(estimate, low, high):
+    """Format an estimate with its confidence interval, e.g. '0.8123 [0.7890, 0.8345]'."""
+    return f"{estimate:.4f} [{low:.4f}, {high:.4f}]"
@@ -1,9 +1,16 @@
 #We use LLM (deepseek-chat here) as a judge to evaluate the consitency of the model-generated response with the error description in REA-ERR task. For more details, please refer to our paper.
-import os
-import json
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
 from openai import OpenAI
+from rate_limiter import RateLimiter, estimate_tokens, get_used_tokens
+from checkpoint import CheckpointStore
+from dataset import IndexedDataset
+from response_cache import ResponseCache, print_cache_stats
+from metrics_modules import import_metrics_module
+
+parse_binary = import_metrics_module('answer_parsing').parse_binary
 
 # ================================
 # User Configuration
@@ -15,6 +22,18 @@ MODEL_NAME = 'deepseek-chat'
 
 TEST_FILE_PATH = './REA-ERR_test_o3-mini.json'  # For example, we use LLM judge to evaluate the consistency of o3-mini's responses
 OUTPUT_FILE = TEST_FILE_PATH
+SAMPLE_TYPES = None                 # Only process samples of these types, e.g. ['parameter', 'reagent'] (None = all)
+SAMPLE_RANGE = (None, None)         # (start, stop) positions of the samples to process (None = from the start / to the end)
+DATASET_INDEX_DIR = './cache/datasets'   # Indexed copies of the test files, built on first use
+CONCURRENCY = 8                     # Requests sent at the same time by the worker pool (1 = one request at a time)
+MAX_IN_FLIGHT = 32                  # Maximum number of requests scheduled at once (including those waiting to retry)
+ITEMS_PER_REQUEST = 1               # Samples judged per request; K > 1 packs K samples into one prompt and falls back to one request per sample if the K verdicts cannot be matched
+MAX_TOKENS_PER_ITEM = 256           # Completion tokens allowed per judged sample (the verdict needs about 10, but judges often explain it first; truncated verdicts are judged again on the next run)
+REQUESTS_PER_MINUTE = 500           # Client-side request budget (None = unlimited)
+TOKENS_PER_MINUTE = 200000          # Client-side token budget, prompt + completion (None = unlimited)
+GENERATION_PARAMS = {}              # Other decoding parameters sent with every request, e.g. {'temperature': 0} (part of the cache key)
+CACHE_DIR = './cache'               # Response cache shared with the generation scripts (None = no caching)
+CACHE_MAX_BYTES = 2 * 1024 ** 3     # Least recently used responses are evicted above this size
 
 print(f"Use LLM-as-a-judge to evaluate the consistency of model-generated responses with error descriptions in {TEST_FILE_PATH}")
 
@@ -23,54 +42,46 @@ print(f"Use LLM-as-a-judge to evaluate the consistency of model-generated respon
 # ================================
 
 client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+response_cache = ResponseCache(CACHE_DIR, CACHE_MAX_BYTES) if CACHE_DIR else None
 
 # ================================
 # Functions
 # ================================
 
-def get_test_data(file_path):
-    """
-    Load test data from a JSON file.
-    """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        test_data = json.load(f)
-    return test_data
-
-def generate_response(user_prompt, model_name, max_retries=5, initial_delay=1):
+def generate_response(user_prompt, model_name, max_tokens, max_retries=5, initial_delay=1):
     """
     Call the OpenAI API to generate a response for the given user prompt.
-    Includes a retry mechanism with exponential backoff.
+    Requests are paced by the shared rate limiter, and failed requests are retried
+    with jittered exponential backoff (honouring Retry-After on 429 responses).
+    Returns the response text and its finish reason ('length' if it was cut off at max_tokens).
     """
     last_exception = None
+    estimated_tokens = estimate_tokens(user_prompt) + max_tokens
 
     for attempt in range(max_retries):
+        rate_limiter.acquire(estimated_tokens)
         try:
             response = client.chat.completions.create(
                 model=model_name,
                 messages=[{"role": "user", "content": user_prompt}],
-                max_tokens=8192,
-                stream=False
+                stream=False,
+                **GENERATION_PARAMS,
+                max_tokens=max_tokens
             )
-            return response.choices[0].message.content.strip()
+            rate_limiter.on_success(estimated_tokens, get_used_tokens(response))
+            choice = response.choices[0]
+            return (choice.message.content or '').strip(), choice.finish_reason
         except Exception as e:
             last_exception = e
             print(f"Attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
-                delay = initial_delay * (2 ** attempt)
+                delay = rate_limiter.on_error(e, attempt, initial_delay)
                 time.sleep(delay)
 
     raise Exception(f"All {max_retries} attempts failed") from last_exception
 
-def generate_user_prompt(sample):
-    """
-    Format the user prompt for LLM evaluation.
-    """
-    corrupted_text = sample.get('corrupted_text', '')
-    corrected_text = sample.get('corrected_text', '')
-    error_description = sample.get('error_description', 'No error description provided.')
-    generated_response = sample.get('generated_response', '').split('</think>')[-1].split('[/INST]')[-1]
-
-    prompt = f"""You are given a task to judge whether a model-generated response correctly identifies the key error in a scientific protocol step. You will receive the following inputs:
+JUDGE_INSTRUCTIONS = """You are given a task to judge whether a model-generated response correctly identifies the key error in a scientific protocol step. You will receive the following inputs:
 
 - `corrupted_text`: the original text containing the error.
 - `corrected_text`: the corrected version of the text.
@@ -85,15 +96,33 @@ At the end of your judgment, output only one of the following two values (withou
 
 **True** – if the generated response accurately identifies the error described.
 
-**False** – if the generated response misses or incorrectly identifies the error described.
+**False** – if the generated response misses or incorrectly identifies the error described."""
 
----
+PACKED_VERDICT_PATTERN = re.compile(r"\[ITEM\s*(\d+)\]\s*(\[ANSWER_START\].*?\[ANSWER_END\])", re.DOTALL)
 
-Input:
-corrupted_text: {corrupted_text}
+def format_judge_inputs(sample):
+    """
+    Format the inputs of one sample for the judge.
+    """
+    corrupted_text = sample.get('corrupted_text', '')
+    corrected_text = sample.get('corrected_text', '')
+    error_description = sample.get('error_description', 'No error description provided.')
+    generated_response = sample.get('generated_response', '').split('</think>')[-1].split('[/INST]')[-1]
+    return f"""corrupted_text: {corrupted_text}
 corrected_text: {corrected_text}
 error_description: {error_description}
-generated_response: {generated_response}
+generated_response: {generated_response}"""
+
+def generate_user_prompt(sample):
+    """
+    Format the user prompt for LLM evaluation.
+    """
+    return f"""{JUDGE_INSTRUCTIONS}
+
+---
+
+Input:
+{format_judge_inputs(sample)}
 
 ---
 
@@ -101,27 +130,160 @@ Output your final answer in the following format:
 [ANSWER_START]True/False[ANSWER_END]
 
 Now give me your final answer:"""
-    return prompt
+
+def generate_packed_prompt(samples):
+    """
+    Format one prompt that asks for a labelled verdict on each of several samples.
+    """
+    items = "\n\n---\n\n".join(
+        f"Item {i}:\n{format_judge_inputs(sample)}" for i, sample in enumerate(samples, start=1)
+    )
+    answer_lines = "\n".join(f"[ITEM {i}][ANSWER_START]True/False[ANSWER_END]" for i in range(1, len(samples) + 1))
+    return f"""{JUDGE_INSTRUCTIONS}
+
+Below are {len(samples)} items. Judge each item independently, using only its own inputs.
+
+---
+
+{items}
+
+---
+
+Output your final answers, one line per item in this order, in the following format:
+{answer_lines}
+
+Now give me your final answers:"""
+
+def parse_packed_verdicts(response, num_items):
+    """
+    Split the response to a packed prompt into one verdict per item.
+    Returns None unless every item 1..num_items has exactly one parseable True/False verdict.
+    """
+    verdicts = {}
+    for match in PACKED_VERDICT_PATTERN.finditer(response):
+        index = int(match.group(1))
+        if index in verdicts or not 1 <= index <= num_items or parse_binary(match.group(2)).error:
+            return None
+        verdicts[index] = match.group(2)
+    if len(verdicts) != num_items:
+        return None
+    return [verdicts[i] for i in range(1, num_items + 1)]
+
+def is_verdict(response):
+    """
+    Check that a response holds a parseable True/False verdict.
+    """
+    return parse_binary(response).error is None
+
+def cached_response(user_prompt, model_name, max_tokens, validate):
+    """
+    Return the judge's response to a prompt from the response cache, or from the API.
+    Responses that were cut off at max_tokens or are rejected by `validate` are
+    neither cached nor returned (None), so they are requested again on the next run.
+    """
+    params = dict(GENERATION_PARAMS, max_tokens=max_tokens)
+    cache_key = ResponseCache.make_key(model_name, 'REA-ERR-judge', user_prompt, params)
+    response = response_cache.get(cache_key) if response_cache else None
+    if response is not None and validate(response):
+        return response
+
+    response, finish_reason = generate_response(user_prompt, model_name, max_tokens)
+    if finish_reason == 'length' or not validate(response):
+        return None
+    if response_cache:
+        response_cache.put(cache_key, model_name, 'REA-ERR-judge', response)
+    return response
 
 def process_sample(sample, model_name):
     """
     Process a single sample by generating a response using the model.
     Skips processing if the sample already has a generated LLM judge response.
+    A truncated or unparseable verdict is not stored, so the sample keeps no `LLM_judge`.
     """
     if 'LLM_judge' in sample:
         return sample
     if sample.get('corrupted_text'):
-        user_prompt = generate_user_prompt(sample)
-        response = generate_response(user_prompt, model_name)
-        sample['LLM_judge'] = response
+        verdict = cached_response(generate_user_prompt(sample), model_name, MAX_TOKENS_PER_ITEM, is_verdict)
+        if verdict is not None:
+            sample['LLM_judge'] = verdict
     return sample
 
-def save_checkpoint(data, filename):
+def process_group(samples, model_name):
     """
-    Save intermediate results to a JSON file.
+    Judge several samples with one packed request. If the response does not contain
+    exactly one verdict per sample, every sample is judged on its own instead.
+    """
+    if len(samples) == 1:
+        return [process_sample(samples[0], model_name)]
+
+    def validate(response):
+        return parse_packed_verdicts(response, len(samples)) is not None
+
+    response = cached_response(generate_packed_prompt(samples), model_name, MAX_TOKENS_PER_ITEM * len(samples), validate)
+    if response is None:
+        tqdm.write(f"Could not match {len(samples)} verdicts in a packed response, judging the samples one by one")
+        return [process_sample(sample, model_name) for sample in samples]
+    for sample, verdict in zip(samples, parse_packed_verdicts(response, len(samples))):
+        sample['LLM_judge'] = verdict
+    return samples
+
+def process_samples_concurrent(samples, checkpoint, model_name):
     """
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    Judge samples with a pool of CONCURRENCY worker threads, ITEMS_PER_REQUEST samples per request.
+
+    At most MAX_IN_FLIGHT requests are scheduled at once, and finished samples are
+    checkpointed as their requests complete. Samples whose requests fail, or whose
+    verdicts were truncated or could not be parsed, are not checkpointed, so they
+    are judged again on the next run.
+    """
+    failed = 0
+    unjudged = 0
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool, \
+            tqdm(total=len(samples), desc="Processing samples") as pbar:
+        pending = {}
+
+        def collect():
+            nonlocal failed, unjudged
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = pending.pop(future)
+                pbar.update(len(group))
+                if future.exception() is not None:
+                    failed += len(group)
+                    tqdm.write(f"Request failed: {future.exception()}")
+                    continue
+                for sample in future.result():
+                    if 'LLM_judge' not in sample:
+                        unjudged += 1
+                        continue
+                    checkpoint.append(sample)
+
+        def submit(group):
+            if len(pending) >= MAX_IN_FLIGHT:
+                collect()
+            pending[pool.submit(process_group, group, model_name)] = group
+
+        group = []
+        for sample in samples:
+            # Samples without a corrupted step have nothing to judge and are kept as they are
+            if 'LLM_judge' in sample or not sample.get('corrupted_text'):
+                checkpoint.append(sample)
+                pbar.update(1)
+                continue
+            group.append(sample)
+            if len(group) == max(1, ITEMS_PER_REQUEST):
+                submit(group)
+                group = []
+        if group:
+            submit(group)
+        while pending:
+            collect()
+
+    if failed:
+        print(f"{failed} samples failed and will be judged again on the next run.")
+    if unjudged:
+        print(f"{unjudged} verdicts were truncated or could not be parsed and will be judged again on the next run "
+              f"(raise MAX_TOKENS_PER_ITEM if this keeps happening).")
 
 # ================================
 # Main Processing Function
@@ -130,34 +292,27 @@ def save_checkpoint(data, filename):
 def main():
     """
     Main function to process the dataset.
-    Loads test data, processes each sample, and saves results periodically.
+    Loads test data, judges the samples concurrently, and saves results periodically.
     """
-    test_set = get_test_data(TEST_FILE_PATH)
-
-    # Load checkpoint if exists
-    processed_set = []
-    if os.path.exists(OUTPUT_FILE):
-        print("Loading from checkpoint")
-        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-            processed_set = json.load(f)
-
-    # Identify already processed samples
-    processed_ids = set(sample['id'] for sample in processed_set if 'LLM_judge' in sample)
-    remaining_samples = [sample for sample in test_set if sample['id'] not in processed_ids]
-
-    count_since_last_save = 0
-    for sample in tqdm(remaining_samples, desc="Processing samples"):
-        processed_sample = process_sample(sample, MODEL_NAME)
-        processed_set.append(processed_sample)
-        count_since_last_save += 1
-
-        if count_since_last_save >= 10:
-            save_checkpoint(processed_set, OUTPUT_FILE)
-            print(f"Checkpoint saved after processing {len(processed_set)} samples.")
-            count_since_last_save = 0
-
-    save_checkpoint(processed_set, OUTPUT_FILE)
+    dataset = IndexedDataset(TEST_FILE_PATH, DATASET_INDEX_DIR)
+    positions = dataset.positions(SAMPLE_TYPES, *SAMPLE_RANGE)
+
+    # Load existing checkpoint if available
+    checkpoint = CheckpointStore(OUTPUT_FILE, done_key='LLM_judge')
+    processed_ids = checkpoint.load_processed_ids()
+    remaining_samples = dataset.view([i for i in positions if dataset.ids[i] not in processed_ids])
+
+    try:
+        process_samples_concurrent(remaining_samples, checkpoint, MODEL_NAME)
+    finally:
+        checkpoint.close()
+
+    # Write the checkpoint log out as the final JSON file, in test set order
+    checkpoint.compact(dataset.ids)
+    dataset.close()
     print(f"All data saved to {OUTPUT_FILE}")
+    if response_cache:
+        print_cache_stats(response_cache)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+FINISHED_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def batch_state_file(output_file):
+    """
+    Return the file that remembers submitted batches, e.g. PQA_test_o3-mini.batch.json.
+    """
+    return os.path.splitext(output_file)[0] + '.batch.json'
+
+
+def load_batch_state(state_file):
+    """
+    Return the saved state of a batch run, or None if no batches were prepared.
+    """
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_batch_state(state_file, state, run):
+    """
+    Refuse to resume a batch run whose saved state belongs to another configuration.
+    `run` holds the fields the state must match, e.g. the model, task and test file.
+    """
+    mismatched = [f"{key}: {state.get(key)!r} (this run: {value!r})" for key, value in run.items() if state.get(key) != value]
+    if mismatched:
+        raise ValueError(
+            f"{state_file} belongs to a different batch run ({'; '.join(mismatched)}). "
+            f"Finish that run with its original configuration, or delete {state_file} and its batch input files to start over."
+        )
+
+
+def save_batch_state(state_file, state):
+    """
+    Atomically write the state of a batch run: its input files and the ids of the batches submitted so far.
+    """
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, state_file)
+
+
+def batch_request(custom_id, user_prompt, model_name, params):
+    """
+    Build one line of a batch input file: a chat completion request tagged with the sample id.
+    """
+    return {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': BATCH_ENDPOINT,
+        'body': {
+            'model': model_name,
+            'messages': [{"role": "user", "content": user_prompt}],
+            **params
+        }
+    }
+
+
+def write_batch_inputs(requests, input_prefix, max_requests):
+    """
+    Write batch requests to JSONL files of at most `max_requests` lines each.
+    Returns the paths of the written files.
+    """
+    paths = []
+    f = None
+    for i, request in enumerate(requests):
+        if i % max_requests == 0:
+            if f is not None:
+                f.close()
+            paths.append(f"{input_prefix}.batch-input-{len(paths)}.jsonl")
+            f = open(paths[-1], 'w', encoding='utf-8')
+        f.write(json.dumps(request, ensure_ascii=False) + '\n')
+    if f is not None:
+        f.close()
+    return paths
+
+
+def batch_input_ids(input_path):
+    """
+    Return the custom ids of the requests in a batch input file.
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line)['custom_id'] for line in f if line.strip()]
+
+
+def submit_batch(client, input_path, completion_window='24h'):
+    """
+    Upload a batch input file and start a batch job. Returns the batch id.
+    """
+    with open(input_path, 'rb') as f:
+        input_file = client.files.create(file=f, purpose='batch')
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=completion_window
+    )
+    print(f"Submitted batch {batch.id} ({input_path})")
+    return batch.id
+
+
+def wait_for_batches(client, batch_ids, poll_interval=60):
+    """
+    Poll batch jobs until all of them have finished. Returns the final batch objects.
+    """
+    batches = {}
+    while True:
+        for batch_id in batch_ids:
+            if batch_id not in batches or batches[batch_id].status not in FINISHED_STATUSES:
+                batches[batch_id] = client.batches.retrieve(batch_id)
+        running = [batch for batch in batches.values() if batch.status not in FINISHED_STATUSES]
+        for batch in running:
+            counts = batch.request_counts
+            progress = f"{counts.completed + counts.failed}/{counts.total}" if counts else "?"
+            print(f"Batch {batch.id}: {batch.status} ({progress} requests done)")
+        if not running:
+            return [batches[batch_id] for batch_id in batch_ids]
+        time.sleep(poll_interval)
+
+
+def iter_batch_results(client, batch):
+    """
+    Yield (custom_id, response, error) for every request of a finished batch.
+    `response` is the message content, or None if the request failed.
+    """
+    if batch.status != 'completed':
+        print(f"Batch {batch.id} ended with status {batch.status}")
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get('response') or {}
+            body = response.get('body') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                yield result['custom_id'], None, result.get('error') or body.get('error')
+            else:
+                yield result['custom_id'], body['choices'][0]['message']['content'], None
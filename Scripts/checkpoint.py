@@ -0,0 +1,234 @@
+import os
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only needed for Parquet output files
+    pa = pq = None
+
+
+PARQUET_ROW_GROUP_SIZE = 1000  # Records per Parquet row group written by compact()
+
+
+def shard_output_file(output_file, shard_index, num_shards):
+    """
+    Return the output file of one shard, e.g. PQA_test_o3-mini.shard-1-of-4.json.
+    The index is zero-padded to the width of the largest index (shard-03-of-12).
+    """
+    base, ext = os.path.splitext(output_file)
+    width = len(str(num_shards - 1))
+    return f"{base}.shard-{shard_index:0{width}d}-of-{num_shards}{ext}"
+
+
+class CheckpointStore:
+    """
+    Append-only checkpoint for generation runs.
+
+    Every finished sample is appended to a JSONL log next to the output file as one
+    line, and the log is fsynced every `sync_every` appends. On restart the log is
+    streamed to rebuild the set of processed ids, and at the end of a run it is
+    compacted into the usual pretty-printed JSON output file and deleted, so the
+    output file stays the only record of the run and edits to it (or deleting it)
+    are picked up by the next run, which seeds a new log from it.
+
+    If a sample appears more than once in the log, the last record wins.
+
+    If the output file ends with `.parquet`, only the `id` and the model-specific
+    `result_columns` are written; the benchmark fields are joined back from
+    `Data/*_test.json` when the file is scored (see Metrics/result_reader.py).
+
+    `on_append` is called with every appended sample after it is written, e.g. to
+    score the run while it is generated (see live_scoring.py).
+    """
+
+    def __init__(self, output_file, done_key='generated_response', sync_every=10, result_columns=None,
+                 on_append=None):
+        self.output_file = output_file
+        self.on_append = on_append
+        self.log_file = os.path.splitext(output_file)[0] + '.checkpoint.jsonl'
+        self.done_key = done_key
+        self.result_columns = list(result_columns or [done_key])
+        self.sync_every = sync_every
+        self._handle = None
+        self._unsynced = 0
+
+    def _iter_log(self):
+        """
+        Yield (offset, record) for every complete line of the log.
+        Stops at the first truncated or unreadable line and records where it starts.
+        """
+        offset = 0
+        with open(self.log_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                yield offset, record
+                offset += len(line)
+        self._valid_size = offset
+
+    def _read_output_file(self):
+        """
+        Return the samples of an output file written by an earlier run.
+        """
+        if self._is_parquet():
+            return [
+                {key: value for key, value in row.items() if value is not None}
+                for row in _require_pyarrow().read_table(self.output_file).to_pylist()
+            ]
+        with open(self.output_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _migrate_output_file(self):
+        """
+        Seed the log from an output file written by an earlier run (plain JSON list).
+        """
+        print("Converting existing output file into a checkpoint log")
+        processed_set = self._read_output_file()
+        with open(self.log_file, 'w', encoding='utf-8') as f:
+            for sample in processed_set:
+                f.write(json.dumps(sample, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load_processed_ids(self):
+        """
+        Stream the checkpoint log and return the ids of samples that are already done.
+        """
+        if not os.path.exists(self.log_file):
+            if not os.path.exists(self.output_file):
+                return set()
+            self._migrate_output_file()
+
+        print("Loading from checkpoint")
+        processed_ids = set()
+        for _, record in self._iter_log():
+            if self.done_key in record:
+                processed_ids.add(record['id'])
+            else:
+                processed_ids.discard(record['id'])
+
+        # Drop a partially written last line left behind by a crash
+        if self._valid_size < os.path.getsize(self.log_file):
+            print(f"Discarding incomplete record at the end of {self.log_file}")
+            with open(self.log_file, 'r+b') as f:
+                f.truncate(self._valid_size)
+        return processed_ids
+
+    def iter_records(self):
+        """
+        Stream every complete record of the log, or of the output file if there is no log.
+        """
+        if os.path.exists(self.log_file):
+            for _, record in self._iter_log():
+                yield record
+        elif os.path.exists(self.output_file):
+            yield from self._read_output_file()
+
+    def append(self, sample):
+        """
+        Append one finished sample to the log.
+        """
+        if self._handle is None:
+            self._handle = open(self.log_file, 'a', encoding='utf-8')
+        self._handle.write(json.dumps(sample, ensure_ascii=False) + '\n')
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        if self.on_append is not None:
+            self.on_append(sample)
+
+    def sync(self):
+        """
+        Flush buffered records to disk.
+        """
+        if self._handle is not None and self._unsynced:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        self.sync()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _is_parquet(self):
+        return self.output_file.endswith('.parquet')
+
+    def compact(self, order=None):
+        """
+        Write the latest record of every sample in the log to the output file.
+
+        Samples whose ids appear in `order` are written in that order, followed by
+        any other samples in log order. Only an id -> offset index is kept in memory;
+        records are read back one at a time. The output file is replaced atomically,
+        and the log is deleted once it has been written out.
+        """
+        self.close()
+        if not os.path.exists(self.log_file):
+            return
+
+        index = {}
+        for offset, record in self._iter_log():
+            index.pop(record['id'], None)
+            index[record['id']] = offset
+
+        ids = []
+        if order is not None:
+            ids = [sample_id for sample_id in order if sample_id in index]
+        listed = set(ids)
+        ids += [sample_id for sample_id in index if sample_id not in listed]
+
+        tmp_file = self.output_file + '.tmp'
+        if self._is_parquet():
+            self._write_parquet(ids, index, tmp_file)
+        else:
+            self._write_json(ids, index, tmp_file)
+        os.replace(tmp_file, self.output_file)
+        # A log left behind would silently win over later edits to the output file
+        os.remove(self.log_file)
+
+    def _write_json(self, ids, index, tmp_file):
+        """
+        Write the indexed records as a pretty-printed JSON list, one record at a time.
+        """
+        with open(self.log_file, 'rb') as log, open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for i, sample_id in enumerate(ids):
+                log.seek(index[sample_id])
+                record = json.loads(log.readline())
+                item = json.dumps(record, indent=4, ensure_ascii=False)
+                f.write((',\n    ' if i else '\n    ') + item.replace('\n', '\n    '))
+            f.write('\n]' if ids else ']')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_parquet(self, ids, index, tmp_file):
+        """
+        Write `id` and the result columns of the indexed records as Parquet, one row group at a time.
+        """
+        _require_pyarrow()
+        columns = ['id'] + self.result_columns
+        schema = pa.schema([(column, pa.string()) for column in columns])
+        with open(self.log_file, 'rb') as log, pq.ParquetWriter(tmp_file, schema, compression='zstd') as writer:
+            for start in range(0, len(ids), PARQUET_ROW_GROUP_SIZE):
+                batch = {column: [] for column in columns}
+                for sample_id in ids[start:start + PARQUET_ROW_GROUP_SIZE]:
+                    log.seek(index[sample_id])
+                    record = json.loads(log.readline())
+                    for column in columns:
+                        batch[column].append(record.get(column))
+                writer.write_table(pa.table(batch, schema=schema))
+        with open(tmp_file, 'rb') as f:
+            os.fsync(f.fileno())
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("Parquet output files need pyarrow (pip install pyarrow)")
+    return pq
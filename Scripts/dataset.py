@@ -0,0 +1,188 @@
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+
+
+def iter_samples(source_path):
+    """
+    Yield the samples of a split stored as a JSON array (as in Data/) or as JSON Lines.
+    """
+    with open(source_path, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def shard_of(sample_id, num_shards):
+    """
+    Return the shard a sample belongs to.
+    Based on a hash of the id, so every machine computes the same partition.
+    """
+    digest = hashlib.sha1(str(sample_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_shards
+
+
+def _temp_file(path):
+    """
+    Create an empty temporary file with a unique name next to `path` and return its name.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    return tmp_path
+
+
+class IndexedDataset:
+    """
+    Random access to a benchmark split (e.g. Data/PQA_test.json) without loading it.
+
+    On first use the split is decoded once and written into a records file (one
+    compact JSON object per sample) and an index holding the id, `type` and byte
+    offset of every sample. Later runs memory-map the records file and decode only the samples they
+    touch. The index remembers the size and modification time of the source file and
+    is rebuilt when the source changes.
+    """
+
+    def __init__(self, source_path, index_dir=None):
+        self.source_path = source_path
+        index_dir = index_dir or os.path.dirname(os.path.abspath(source_path))
+        os.makedirs(index_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        self.records_file = os.path.join(index_dir, name + '.records')
+        self.index_file = os.path.join(index_dir, name + '.index.json')
+
+        index = self._load_index()
+        if index is None:
+            index = self._build_index()
+        self.ids = index['ids']
+        self.types = index['types']
+        self._offsets = index['offsets']
+        self._positions = {sample_id: i for i, sample_id in enumerate(self.ids)}
+
+        self._file = open(self.records_file, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else None
+
+    def _source_stamp(self):
+        stat = os.stat(self.source_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_index(self):
+        """
+        Return the saved index, or None if it is missing or out of date.
+        """
+        if not (os.path.exists(self.index_file) and os.path.exists(self.records_file)):
+            return None
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('source') != self._source_stamp() or index['offsets'][-1] != os.path.getsize(self.records_file):
+            return None
+        return index
+
+    def _build_index(self):
+        """
+        Copy the source split into the records file and write the index.
+        Both files are written under unique temporary names and renamed into place,
+        so shard processes that index the same split at once never write the same file.
+        """
+        print(f"Indexing {self.source_path}")
+        stamp = self._source_stamp()
+        ids, types, offsets = [], [], [0]
+        records_tmp, index_tmp = _temp_file(self.records_file), _temp_file(self.index_file)
+        try:
+            with open(records_tmp, 'wb') as f:
+                for sample in iter_samples(self.source_path):
+                    line = (json.dumps(sample, ensure_ascii=False) + '\n').encode('utf-8')
+                    f.write(line)
+                    ids.append(sample['id'])
+                    types.append(sample.get('type'))
+                    offsets.append(offsets[-1] + len(line))
+            index = {'source': stamp, 'ids': ids, 'types': types, 'offsets': offsets}
+            with open(index_tmp, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(records_tmp, self.records_file)
+            os.replace(index_tmp, self.index_file)
+        finally:
+            for tmp_path in (records_tmp, index_tmp):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        """
+        Decode the sample at `position` (0-based, in source order).
+        """
+        return json.loads(self._mmap[self._offsets[position]:self._offsets[position + 1]])
+
+    def get(self, sample_id):
+        """
+        Return the sample with the given id.
+        """
+        return self[self._positions[sample_id]]
+
+    def positions(self, types=None, start=None, stop=None, num_shards=1, shard_index=0):
+        """
+        Return the positions of the samples in [start, stop) whose `type` is in `types`.
+
+        Args:
+            types (Iterable[str]): Sample types to keep, e.g. ['parameter', 'reagent'] (None = all).
+            start (int): First position of the range (None = 0).
+            stop (int): End of the range, exclusive (None = end of the split).
+            num_shards (int): Number of shards the split is partitioned into (see shard_of).
+            shard_index (int): Shard to keep, in [0, num_shards).
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"Shard index {shard_index} is not in [0, {num_shards})")
+        selected = range(len(self))[start:stop]
+        types = None if types is None else set(types)
+        return [
+            i for i in selected
+            if (types is None or self.types[i] in types)
+            and (num_shards == 1 or shard_of(self.ids[i], num_shards) == shard_index)
+        ]
+
+    def view(self, positions):
+        """
+        Return a lazy sequence of the samples at `positions`.
+        """
+        return DatasetView(self, positions)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class DatasetView:
+    """
+    Sequence of samples at given positions of an IndexedDataset, decoded on access.
+    """
+
+    def __init__(self, dataset, positions):
+        self.dataset = dataset
+        self.positions = list(positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        return self.dataset[self.positions[i]]
+
+    def __iter__(self):
+        for position in self.positions:
+            yield self.dataset[position]
+
+    @property
+    def ids(self):
+        return [self.dataset.ids[position] for position in self.positions]
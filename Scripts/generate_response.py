@@ -1,9 +1,17 @@
 import os
-import json
+import argparse
 import time
+import asyncio
 from tqdm import tqdm
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from prompt_format import generate_user_prompt
+from rate_limiter import RateLimiter, estimate_tokens, get_used_tokens
+from checkpoint import CheckpointStore, shard_output_file
+from dataset import IndexedDataset
+from live_scoring import LiveScorer, LiveScoringStop, finished_samples
+from response_cache import ResponseCache, print_cache_stats
+from batch_api import (batch_request, batch_state_file, load_batch_state, check_batch_state, save_batch_state,
+                       write_batch_inputs, batch_input_ids, submit_batch, wait_for_batches, iter_batch_results)
 
 # ================================
 # User Configuration
@@ -14,7 +22,31 @@ BASE_URL = 'https://api.openai.com/v1'  # Replace with your base URL if differen
 MODEL_NAME = 'o3-mini'              # Replace with your preferred model
 TASK_NAME = 'PQA'                   # Task name used in file paths ('PQA', 'ORD', 'ERR', 'REA-ERR', 'GEN', 'REA-GEN')
 TEST_FILE_PATH = f"../Data/{TASK_NAME.split('-')[-1]}_test.json"
-OUTPUT_FILE = f'./{TASK_NAME}_test_{MODEL_NAME}.json'
+PROMPT_LAYOUT = 'original'          # 'original' (prompts of the paper) or 'prefix' (static instructions first, for prompt/KV caching)
+OUTPUT_FORMAT = 'json'              # 'json' (full samples) or 'parquet' (id + generated_response only, needs pyarrow)
+OUTPUT_FILE = f'./{TASK_NAME}_test_{MODEL_NAME}.{OUTPUT_FORMAT}'
+SAMPLE_TYPES = None                 # Only process samples of these types, e.g. ['parameter', 'reagent'] (None = all)
+SAMPLE_RANGE = (None, None)         # (start, stop) positions of the samples to process (None = from the start / to the end)
+DATASET_INDEX_DIR = './cache/datasets'   # Indexed copies of the test files, built on first use
+NUM_SHARDS = 1                      # Split the test set over this many processes/machines (or pass --num-shards)
+SHARD_INDEX = 0                     # Shard processed by this process, in [0, NUM_SHARDS) (or pass --shard-index)
+USE_ASYNC = True                    # Send requests concurrently with AsyncOpenAI (False = one request at a time)
+CONCURRENCY = 8                     # Maximum number of API calls running at the same time
+MAX_IN_FLIGHT = 32                  # Maximum number of samples scheduled at once (including those waiting to retry)
+USE_BATCH_API = False               # Submit all prompts as provider batch jobs instead of live requests (overrides USE_ASYNC)
+BATCH_MAX_REQUESTS = 50000          # Maximum number of requests per batch job
+BATCH_COMPLETION_WINDOW = '24h'     # Time the provider has to finish a batch job
+BATCH_POLL_INTERVAL = 60            # Seconds between batch status checks
+REQUESTS_PER_MINUTE = 500           # Client-side request budget (None = unlimited)
+TOKENS_PER_MINUTE = 200000          # Client-side token budget, prompt + completion (None = unlimited)
+EXPECTED_COMPLETION_TOKENS = 1024   # Completion tokens reserved per request until the real usage is known
+GENERATION_PARAMS = {'max_tokens': 8192}   # Decoding parameters sent with every request (part of the cache key; cached responses are replayed as they are, so set 'temperature': 0 for reproducible reruns)
+CACHE_DIR = './cache'               # Response cache shared by all runs and tasks (None = no caching)
+CACHE_MAX_BYTES = 2 * 1024 ** 3     # Least recently used responses are evicted above this size
+LIVE_SCORING = True                 # Parse and score responses while generating, printing running metrics
+MAX_FAILURE_RATE = None             # Abort the run once more than this fraction of responses cannot be parsed, e.g. 0.2 (None = never)
+MIN_SCORED_SAMPLES = 100            # Responses scored before MAX_FAILURE_RATE is checked
+REPORT_EVERY = 50                   # Print the running metrics every this many responses (0 = only at the end)
 
 print(f"Using model: {MODEL_NAME} for task: {TASK_NAME}......")
 
@@ -23,27 +55,25 @@ print(f"Using model: {MODEL_NAME} for task: {TASK_NAME}......")
 # ================================
 
 client = OpenAI(api_key=API_KEY,base_url=BASE_URL)
+async_client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL)
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+response_cache = ResponseCache(CACHE_DIR, CACHE_MAX_BYTES) if CACHE_DIR else None
 
 # ================================
 # Functions
 # ================================
 
-def get_test_data(file_path):
-    """
-    Load test data from a JSON file.
-    """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        test_data = json.load(f)
-    return test_data
-
 def generate_response(user_prompt, model_name, max_retries=5, initial_delay=1):
     """
     Call the OpenAI API to generate a response for the given user prompt.
-    Includes a retry mechanism with exponential backoff.
+    Requests are paced by the shared rate limiter, and failed requests are retried
+    with jittered exponential backoff (honouring Retry-After on 429 responses).
     """
     last_exception = None
+    estimated_tokens = estimate_tokens(user_prompt) + EXPECTED_COMPLETION_TOKENS
 
     for attempt in range(max_retries):
+        rate_limiter.acquire(estimated_tokens)
         try:
             response = client.chat.completions.create(
                 model=model_name,
@@ -51,14 +81,15 @@ def generate_response(user_prompt, model_name, max_retries=5, initial_delay=1):
                     {"role": "user", "content": user_prompt}
                 ],
                 stream=False,
-                max_tokens=8192
+                **GENERATION_PARAMS
             )
+            rate_limiter.on_success(estimated_tokens, get_used_tokens(response))
             return response.choices[0].message.content.strip()
         except Exception as e:
             last_exception = e
             print(f"Attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
-                delay = initial_delay * (2 ** attempt)
+                delay = rate_limiter.on_error(e, attempt, initial_delay)
                 time.sleep(delay)
 
     raise Exception(f"All {max_retries} attempts failed") from last_exception
@@ -72,17 +103,182 @@ def process_sample(sample, model_name, task_name):
     if 'generated_response' in sample:
         return sample
 
-    user_prompt = generate_user_prompt(sample, task_name)
-    response = generate_response(user_prompt, model_name)
+    user_prompt = generate_user_prompt(sample, task_name, PROMPT_LAYOUT)
+    cache_key = ResponseCache.make_key(model_name, task_name, user_prompt, GENERATION_PARAMS)
+    response = response_cache.get(cache_key) if response_cache else None
+    if response is None:
+        response = generate_response(user_prompt, model_name)
+        if response_cache:
+            response_cache.put(cache_key, model_name, task_name, response)
+    sample['generated_response'] = response
+    return sample
+
+async def generate_response_async(user_prompt, model_name, semaphore, max_retries=5, initial_delay=1):
+    """
+    Asynchronous counterpart of generate_response().
+    The semaphore is only held while a request is in flight, so samples waiting
+    to retry do not block other requests.
+    """
+    last_exception = None
+    estimated_tokens = estimate_tokens(user_prompt) + EXPECTED_COMPLETION_TOKENS
+
+    for attempt in range(max_retries):
+        await rate_limiter.acquire_async(estimated_tokens)
+        try:
+            async with semaphore:
+                response = await async_client.chat.completions.create(
+                    model=model_name,
+                    messages=[
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    stream=False,
+                    **GENERATION_PARAMS
+                )
+            rate_limiter.on_success(estimated_tokens, get_used_tokens(response))
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            last_exception = e
+            print(f"Attempt {attempt + 1} failed: {e}")
+            if attempt < max_retries - 1:
+                delay = rate_limiter.on_error(e, attempt, initial_delay)
+                await asyncio.sleep(delay)
+
+    raise Exception(f"All {max_retries} attempts failed") from last_exception
+
+
+async def process_sample_async(sample, model_name, task_name, semaphore):
+    """
+    Asynchronous counterpart of process_sample().
+    """
+    if 'generated_response' in sample:
+        return sample
+
+    user_prompt = generate_user_prompt(sample, task_name, PROMPT_LAYOUT)
+    cache_key = ResponseCache.make_key(model_name, task_name, user_prompt, GENERATION_PARAMS)
+    response = response_cache.get(cache_key) if response_cache else None
+    if response is None:
+        response = await generate_response_async(user_prompt, model_name, semaphore)
+        if response_cache:
+            response_cache.put(cache_key, model_name, task_name, response)
     sample['generated_response'] = response
     return sample
 
-def save_checkpoint(data, filename):
+
+async def process_samples_async(samples, checkpoint, model_name, task_name):
+    """
+    Process samples concurrently and append finished ones to the checkpoint.
+
+    At most CONCURRENCY API calls run at the same time and at most MAX_IN_FLIGHT
+    samples are scheduled at once. Samples whose retries are exhausted are not
+    checkpointed, so they are picked up again on the next run.
     """
-    Save intermediate results to a JSON file.
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    pending = set()
+    failed = 0
+
+    with tqdm(total=len(samples), desc="Processing samples") as pbar:
+
+        async def collect():
+            nonlocal pending, failed
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pbar.update(1)
+                if task.exception() is not None:
+                    failed += 1
+                    print(f"Sample failed: {task.exception()}")
+                    continue
+                checkpoint.append(task.result())
+
+        for sample in samples:
+            if len(pending) >= MAX_IN_FLIGHT:
+                await collect()
+            pending.add(asyncio.create_task(process_sample_async(sample, model_name, task_name, semaphore)))
+
+        while pending:
+            await collect()
+
+    if failed:
+        print(f"{failed} samples failed and will be retried on the next run.")
+
+def process_samples_batch_api(samples, checkpoint, model_name, task_name, output_file):
     """
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    Generate responses through the provider batch API.
+
+    Cached prompts are answered right away; the others are written to batch input
+    files, submitted, and polled until finished. The input files and the id of
+    every batch are saved next to the output file as soon as they exist, so an
+    interrupted run only submits the input files that have no batch yet and then
+    resumes polling; no batch is paid for twice. The state also records the model,
+    task, test file and prompt layout, and a run with a different configuration
+    refuses to resume it. Results are mapped back onto the samples by id; failed
+    requests, and requests that a failed, expired or cancelled batch returned no
+    result for, are not checkpointed and are submitted again on the next run.
+    """
+    state_file = batch_state_file(output_file)
+    state = load_batch_state(state_file)
+    run = {'model': model_name, 'task': task_name, 'test_file': os.path.abspath(TEST_FILE_PATH), 'prompt_layout': PROMPT_LAYOUT}
+    if state is not None:
+        check_batch_state(state_file, state, run)
+    positions = {}
+    requests = []
+    for i, sample in enumerate(tqdm(samples, desc="Rendering prompts")):
+        positions[sample['id']] = i
+        if state is not None:
+            continue
+        user_prompt = generate_user_prompt(sample, task_name, PROMPT_LAYOUT)
+        cache_key = ResponseCache.make_key(model_name, task_name, user_prompt, GENERATION_PARAMS)
+        response = response_cache.get(cache_key) if response_cache else None
+        if response is not None:
+            sample['generated_response'] = response
+            checkpoint.append(sample)
+        else:
+            requests.append(batch_request(sample['id'], user_prompt, model_name, GENERATION_PARAMS))
+
+    if state is not None:
+        print(f"Resuming {len(state['batch_ids'])} submitted batches from {state_file}")
+    else:
+        if not requests:
+            return
+        input_files = write_batch_inputs(requests, os.path.splitext(output_file)[0], BATCH_MAX_REQUESTS)
+        state = {**run, 'input_files': input_files, 'batch_ids': []}
+        save_batch_state(state_file, state)
+
+    # Input files are submitted in order; the state is saved after every submission
+    for path in state['input_files'][len(state['batch_ids']):]:
+        state['batch_ids'].append(submit_batch(client, path, BATCH_COMPLETION_WINDOW))
+        save_batch_state(state_file, state)
+
+    failed = missing = 0
+    batches = wait_for_batches(client, state['batch_ids'], BATCH_POLL_INTERVAL)
+    for path, batch in zip(state['input_files'], batches):
+        unanswered = set(batch_input_ids(path))
+        for sample_id, response, error in iter_batch_results(client, batch):
+            unanswered.discard(sample_id)
+            if sample_id not in positions:
+                continue  # Already checkpointed by an earlier run
+            if response is None:
+                failed += 1
+                print(f"Sample {sample_id} failed: {error}")
+                continue
+            sample = samples[positions[sample_id]]
+            response = response.strip()
+            if response_cache:
+                cache_key = ResponseCache.make_key(model_name, task_name, generate_user_prompt(sample, task_name, PROMPT_LAYOUT), GENERATION_PARAMS)
+                response_cache.put(cache_key, model_name, task_name, response)
+            sample['generated_response'] = response
+            checkpoint.append(sample)
+        # A batch that did not complete may leave requests without any result
+        unanswered &= positions.keys()
+        if unanswered:
+            missing += len(unanswered)
+            print(f"Batch {batch.id} ({batch.status}) returned no result for {len(unanswered)} requests")
+    checkpoint.sync()
+    for path in state['input_files'] + [state_file]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    if failed or missing:
+        print(f"{failed} samples failed and {missing} got no result; they will be submitted again on the next run.")
 
 # ================================
 # Main Processing Function
@@ -91,35 +287,56 @@ def save_checkpoint(data, filename):
 def main():
     """
     Main function to process the dataset.
-    Loads test data, processes each sample sequentially, and saves results periodically.
+    Loads test data, processes the samples (concurrently if USE_ASYNC is set), and saves results periodically.
     """
 
-    test_set = get_test_data(TEST_FILE_PATH)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-shards', type=int, default=NUM_SHARDS, help="Number of shards the test set is split into")
+    parser.add_argument('--shard-index', type=int, default=SHARD_INDEX, help="Shard processed by this run")
+    args = parser.parse_args()
+
+    dataset = IndexedDataset(TEST_FILE_PATH, DATASET_INDEX_DIR)
+    positions = dataset.positions(SAMPLE_TYPES, *SAMPLE_RANGE, num_shards=args.num_shards, shard_index=args.shard_index)
+
+    # Every shard writes its own checkpoint and output file; combine them with merge_shards.py
+    output_file = OUTPUT_FILE
+    if args.num_shards > 1:
+        output_file = shard_output_file(OUTPUT_FILE, args.shard_index, args.num_shards)
+        print(f"Processing shard {args.shard_index} of {args.num_shards}: {len(positions)} samples")
+
+    # Every finished sample is also handed to the live scorer, which can stop the run early
+    # Batch jobs are paid for once submitted, so batch runs are scored but never stopped
+    live_scorer = LiveScorer(TASK_NAME, None if USE_BATCH_API else MAX_FAILURE_RATE, MIN_SCORED_SAMPLES, REPORT_EVERY) if LIVE_SCORING else None
 
     # Load existing checkpoint if available
-    processed_set = []
-    if os.path.exists(OUTPUT_FILE):
-        print("Loading from checkpoint")
-        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-            processed_set = json.load(f)
-
-    # Identify already processed samples
-    processed_ids = set(sample['id'] for sample in processed_set if 'generated_response' in sample)
-    remaining_samples = [sample for sample in test_set if sample['id'] not in processed_ids]
-
-    count_since_last_save = 0
-    for sample in tqdm(remaining_samples, desc="Processing samples"):
-        processed_sample = process_sample(sample, MODEL_NAME, TASK_NAME)
-        processed_set.append(processed_sample)
-        count_since_last_save += 1
-
-        if count_since_last_save >= 10:
-            save_checkpoint(processed_set, OUTPUT_FILE)
-            print(f"Checkpoint saved after processing {len(processed_set)} samples.")
-            count_since_last_save = 0
-
-    save_checkpoint(processed_set, OUTPUT_FILE)
-    print(f"All data saved to {OUTPUT_FILE}")
+    checkpoint = CheckpointStore(output_file, on_append=live_scorer.submit if live_scorer else None)
+    processed_ids = checkpoint.load_processed_ids()
+    if live_scorer and processed_ids:
+        live_scorer.add_scored(finished_samples(checkpoint, dataset, processed_ids))
+    remaining_samples = dataset.view([i for i in positions if dataset.ids[i] not in processed_ids])
+
+    try:
+        if USE_BATCH_API:
+            process_samples_batch_api(remaining_samples, checkpoint, MODEL_NAME, TASK_NAME, output_file)
+        elif USE_ASYNC:
+            asyncio.run(process_samples_async(remaining_samples, checkpoint, MODEL_NAME, TASK_NAME))
+        else:
+            for sample in tqdm(remaining_samples, desc="Processing samples"):
+                processed_sample = process_sample(sample, MODEL_NAME, TASK_NAME)
+                checkpoint.append(processed_sample)
+    except LiveScoringStop as e:
+        print(f"Run stopped early: {e}")
+    finally:
+        checkpoint.close()
+        if live_scorer:
+            live_scorer.close()
+
+    # Write the checkpoint log out as the final output file, in test set order
+    checkpoint.compact(dataset.ids)
+    dataset.close()
+    print(f"All data saved to {output_file}")
+    if response_cache:
+        print_cache_stats(response_cache)
 
 if __name__ == '__main__':
     main()
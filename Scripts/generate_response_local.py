@@ -1,8 +1,13 @@
-import os
-import json
+import copy
+import argparse
+import torch
 from tqdm import tqdm
-from prompt_format import generate_user_prompt
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from prompt_format import generate_user_prompt, split_user_prompt
+from checkpoint import CheckpointStore, shard_output_file
+from dataset import IndexedDataset
+from live_scoring import LiveScorer, LiveScoringStop, finished_samples
+from response_cache import ResponseCache, print_cache_stats
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache, pipeline
 
 # ================================
 # User Configuration
@@ -11,7 +16,26 @@ from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
 MODEL_NAME = 'meta-llama/Meta-Llama-3-8B-Instruct'                 # or other models from huggingface or local path
 TASK_NAME = 'PQA'                   # Task name used in file paths ('PQA', 'ORD', 'ERR', 'REA-ERR', 'GEN', 'REA-GEN')
 TEST_FILE_PATH = f"../Data/{TASK_NAME.split('-')[-1]}_test.json"
-OUTPUT_FILE = f'./{TASK_NAME}_test_{MODEL_NAME}.json'
+PROMPT_LAYOUT = 'original'          # 'original' (prompts of the paper) or 'prefix' (static instructions first, for prompt/KV caching)
+OUTPUT_FORMAT = 'json'              # 'json' (full samples) or 'parquet' (id + generated_response only, needs pyarrow)
+OUTPUT_FILE = f'./{TASK_NAME}_test_{MODEL_NAME}.{OUTPUT_FORMAT}'
+SAMPLE_TYPES = None                 # Only process samples of these types, e.g. ['parameter', 'reagent'] (None = all)
+SAMPLE_RANGE = (None, None)         # (start, stop) positions of the samples to process (None = from the start / to the end)
+DATASET_INDEX_DIR = './cache/datasets'   # Indexed copies of the test files, built on first use
+NUM_SHARDS = 1                      # Split the test set over this many processes/machines (or pass --num-shards)
+SHARD_INDEX = 0                     # Shard processed by this process, in [0, NUM_SHARDS) (or pass --shard-index)
+DEVICE = 'cuda:0' if torch.cuda.is_available() else 'cpu'   # Device used for inference, e.g. 'cuda:0', 'cuda:1' or 'cpu'
+BATCH_SIZE = 8                      # Number of prompts generated together (1 = one prompt at a time through the pipeline)
+MAX_NEW_TOKENS = 512                # Maximum number of generated tokens per prompt in batched mode
+PAD_TO_MULTIPLE_OF = 8              # Pad each batch to a multiple of this length so that similar batches share shapes
+USE_PREFIX_CACHE = False            # Prefill the static prompt prefix of the task once and reuse its KV cache for every sample (one prompt at a time; best with PROMPT_LAYOUT = 'prefix')
+SAMPLING_PARAMS = {'do_sample': True, 'top_k': 50, 'top_p': 0.95, 'temperature': 0.7}   # Decoding parameters (part of the cache key; responses are only cached with do_sample=False)
+CACHE_DIR = './cache'               # Response cache shared by all runs and tasks (None = no caching)
+CACHE_MAX_BYTES = 2 * 1024 ** 3     # Least recently used responses are evicted above this size
+LIVE_SCORING = True                 # Parse and score responses while generating, printing running metrics
+MAX_FAILURE_RATE = None             # Abort the run once more than this fraction of responses cannot be parsed, e.g. 0.2 (None = never)
+MIN_SCORED_SAMPLES = 100            # Responses scored before MAX_FAILURE_RATE is checked
+REPORT_EVERY = 50                   # Print the running metrics every this many responses (0 = only at the end)
 
 print(f"Using local model: {MODEL_NAME} for task: {TASK_NAME}......")
 
@@ -20,21 +44,21 @@ print(f"Using local model: {MODEL_NAME} for task: {TASK_NAME}......")
 # ================================
 
 tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
-generator = pipeline("text-generation", model=model, tokenizer=tokenizer, device=0)  # use GPU:0 for inference
+tokenizer.padding_side = 'left'     # Generation continues from the right end of every row in a batch
+if tokenizer.pad_token is None:
+    tokenizer.pad_token = tokenizer.eos_token
+model = AutoModelForCausalLM.from_pretrained(MODEL_NAME).to(DEVICE)
+model.eval()
+generator = pipeline("text-generation", model=model, tokenizer=tokenizer, device=torch.device(DEVICE))
+# Sampled responses differ from run to run, so replaying them from the cache would pass them off as deterministic
+cache_responses = CACHE_DIR and not SAMPLING_PARAMS.get('do_sample', False)
+response_cache = ResponseCache(CACHE_DIR, CACHE_MAX_BYTES) if cache_responses else None
+prefix_caches = {}                  # Prompt prefix -> (token ids, past key values), filled by get_prefix_cache()
 
 # ================================
 # Functions
 # ================================
 
-def get_test_data(file_path):
-    """
-    Load test data from a JSON file.
-    """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        test_data = json.load(f)
-    return test_data
-
 def generate_response(user_prompt, model_name, max_length=512):
     """
     Generate a response using the local model.
@@ -43,14 +67,152 @@ def generate_response(user_prompt, model_name, max_length=512):
         user_prompt,
         max_length=max_length,
         num_return_sequences=1,
-        do_sample=True,
-        top_k=50,
-        top_p=0.95,
-        temperature=0.7
+        **SAMPLING_PARAMS
     )
     response_text = outputs[0]['generated_text'][len(user_prompt):].strip()  # Remove the prompt from the output
     return response_text
 
+def generate_responses_batched(user_prompts, max_new_tokens=MAX_NEW_TOKENS):
+    """
+    Generate responses for a batch of prompts with a single model.generate() call.
+    Prompts are left-padded so that every row continues from the same position.
+    """
+    inputs = tokenizer(
+        user_prompts,
+        return_tensors='pt',
+        padding=True,
+        pad_to_multiple_of=PAD_TO_MULTIPLE_OF
+    ).to(model.device)
+
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            num_return_sequences=1,
+            pad_token_id=tokenizer.pad_token_id,
+            **SAMPLING_PARAMS
+        )
+
+    # Remove the (padded) prompts from the output
+    new_tokens = outputs[:, inputs['input_ids'].shape[1]:]
+    return [text.strip() for text in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+def get_prefix_cache(prefix):
+    """
+    Return the token ids of a prompt prefix and its past key values, running the prefill only once per prefix.
+
+    The past key values are None if there is nothing to reuse: the prefix is empty or
+    only a BOS token (e.g. GEN and REA-GEN in the 'original' layout), or the model
+    returns a cache that cannot be cropped to the shared tokens.
+    """
+    if prefix not in prefix_caches:
+        prefix_ids = tokenizer(prefix, return_tensors='pt')['input_ids'].to(model.device)
+        past_key_values = None
+        if prefix_ids[0].tolist() not in ([], [tokenizer.bos_token_id]):
+            with torch.no_grad():
+                # Models without a key/value cache (e.g. state-space models) return no past_key_values
+                past_key_values = getattr(model(prefix_ids, use_cache=True), 'past_key_values', None)
+            if not isinstance(past_key_values, DynamicCache):
+                print(f"Not reusing the prefix KV cache: the model returned {type(past_key_values).__name__}, "
+                      f"not a DynamicCache that can be cropped")
+                past_key_values = None
+        prefix_caches[prefix] = (prefix_ids[0].tolist(), past_key_values)
+    return prefix_caches[prefix]
+
+def generate_response_with_prefix(prefix, suffix, max_new_tokens=MAX_NEW_TOKENS):
+    """
+    Generate a response for prefix + suffix, reusing the KV cache of the prefix.
+
+    The full prompt is tokenized as usual, and the cache is reused for the tokens it
+    shares with the tokenized prefix (tokens can merge across the boundary), so the
+    model sees exactly the same input as without the cache.
+    """
+    prefix_ids, prefix_cache = get_prefix_cache(prefix)
+    input_ids = tokenizer(prefix + suffix, return_tensors='pt')['input_ids'].to(model.device)
+
+    shared = 0
+    for prefix_id, input_id in zip(prefix_ids, input_ids[0].tolist()):
+        if prefix_id != input_id:
+            break
+        shared += 1
+    shared = min(shared, input_ids.shape[1] - 1)  # At least one token has to be fed to the model
+
+    past_key_values = None
+    if shared > 0 and prefix_cache is not None:
+        past_key_values = copy.deepcopy(prefix_cache)  # generate() extends the cache in place
+        if shared < len(prefix_ids):
+            past_key_values.crop(shared - len(prefix_ids))  # A negative length drops that many tokens
+
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values,
+            max_new_tokens=max_new_tokens,
+            num_return_sequences=1,
+            pad_token_id=tokenizer.pad_token_id,
+            **SAMPLING_PARAMS
+        )
+    return tokenizer.decode(outputs[0, input_ids.shape[1]:], skip_special_tokens=True).strip()
+
+def process_samples_prefix_cached(samples, checkpoint, task_name):
+    """
+    Generate responses one sample at a time, reusing the KV cache of the task's static prompt prefix.
+    Responses share the cache entries of batched mode, which uses the same decoding parameters.
+    """
+    params = dict(SAMPLING_PARAMS, max_new_tokens=MAX_NEW_TOKENS)
+    for sample in tqdm(samples, desc="Processing samples"):
+        prefix, suffix = split_user_prompt(sample, task_name, PROMPT_LAYOUT)
+        cache_key = ResponseCache.make_key(MODEL_NAME, task_name, prefix + suffix, params)
+        response = response_cache.get(cache_key) if response_cache else None
+        if response is None:
+            response = generate_response_with_prefix(prefix, suffix)
+            if response_cache:
+                response_cache.put(cache_key, MODEL_NAME, task_name, response)
+        sample['generated_response'] = response
+        checkpoint.append(sample)
+
+def process_samples_batched(samples, checkpoint, task_name):
+    """
+    Generate responses for all samples in batches of BATCH_SIZE.
+
+    Samples found in the response cache are checkpointed right away. The remaining
+    prompts are sorted by token length (longest first, so that running out of memory
+    shows up immediately) so that each batch needs little padding. Finished samples
+    are checkpointed batch by batch; the checkpoint is written out in the original
+    test set order at the end of the run.
+    """
+    params = dict(SAMPLING_PARAMS, max_new_tokens=MAX_NEW_TOKENS)
+    user_prompts, cache_keys, pending = [], [], []
+    for i, sample in enumerate(samples):
+        user_prompt = generate_user_prompt(sample, task_name, PROMPT_LAYOUT)
+        cache_key = ResponseCache.make_key(MODEL_NAME, task_name, user_prompt, params)
+        response = response_cache.get(cache_key) if response_cache else None
+        if response is not None:
+            sample['generated_response'] = response
+            checkpoint.append(sample)
+        else:
+            pending.append(i)
+        user_prompts.append(user_prompt)
+        cache_keys.append(cache_key)
+
+    if not pending:
+        return
+    lengths = [len(ids) for ids in tokenizer([user_prompts[i] for i in pending])['input_ids']]
+    order = [i for _, i in sorted(zip(lengths, pending), key=lambda pair: pair[0], reverse=True)]
+
+    with tqdm(total=len(order), desc="Processing samples") as pbar:
+        for start in range(0, len(order), BATCH_SIZE):
+            batch = order[start:start + BATCH_SIZE]
+            responses = generate_responses_batched([user_prompts[i] for i in batch])
+            for i, response in zip(batch, responses):
+                sample = samples[i]  # Samples are decoded from the dataset on every access
+                sample['generated_response'] = response
+                if response_cache:
+                    response_cache.put(cache_keys[i], MODEL_NAME, task_name, response)
+                checkpoint.append(sample)
+            pbar.update(len(batch))
+
 def process_sample(sample, model_name, task_name):
     """
     Process a single sample by generating a response using the local model.
@@ -59,18 +221,16 @@ def process_sample(sample, model_name, task_name):
     if 'generated_response' in sample:
         return sample
 
-    user_prompt = generate_user_prompt(sample, task_name)
-    response = generate_response(user_prompt, model_name)
+    user_prompt = generate_user_prompt(sample, task_name, PROMPT_LAYOUT)
+    cache_key = ResponseCache.make_key(model_name, task_name, user_prompt, dict(SAMPLING_PARAMS, max_length=512))
+    response = response_cache.get(cache_key) if response_cache else None
+    if response is None:
+        response = generate_response(user_prompt, model_name)
+        if response_cache:
+            response_cache.put(cache_key, model_name, task_name, response)
     sample['generated_response'] = response
     return sample
 
-def save_checkpoint(data, filename):
-    """
-    Save intermediate results to a JSON file.
-    """
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
-
 # ================================
 # Main Processing Function
 # ================================
@@ -78,34 +238,55 @@ def save_checkpoint(data, filename):
 def main():
     """
     Main function to process the dataset.
-    Loads test data, processes each sample sequentially, and saves results periodically.
+    Loads test data, processes the samples (with the prefix KV cache if USE_PREFIX_CACHE is set, else in batches
+    if BATCH_SIZE > 1), and saves results periodically.
     """
-    test_set = get_test_data(TEST_FILE_PATH)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-shards', type=int, default=NUM_SHARDS, help="Number of shards the test set is split into")
+    parser.add_argument('--shard-index', type=int, default=SHARD_INDEX, help="Shard processed by this run")
+    args = parser.parse_args()
+
+    dataset = IndexedDataset(TEST_FILE_PATH, DATASET_INDEX_DIR)
+    positions = dataset.positions(SAMPLE_TYPES, *SAMPLE_RANGE, num_shards=args.num_shards, shard_index=args.shard_index)
+
+    # Every shard writes its own checkpoint and output file; combine them with merge_shards.py
+    output_file = OUTPUT_FILE
+    if args.num_shards > 1:
+        output_file = shard_output_file(OUTPUT_FILE, args.shard_index, args.num_shards)
+        print(f"Processing shard {args.shard_index} of {args.num_shards}: {len(positions)} samples")
+
+    # Every finished sample is also handed to the live scorer, which can stop the run early
+    live_scorer = LiveScorer(TASK_NAME, MAX_FAILURE_RATE, MIN_SCORED_SAMPLES, REPORT_EVERY) if LIVE_SCORING else None
 
     # Load existing checkpoint if available
-    processed_set = []
-    if os.path.exists(OUTPUT_FILE):
-        print("Loading from checkpoint")
-        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-            processed_set = json.load(f)
-
-    # Identify already processed samples
-    processed_ids = set(sample['id'] for sample in processed_set if 'generated_response' in sample)
-    remaining_samples = [sample for sample in test_set if sample['id'] not in processed_ids]
-
-    count_since_last_save = 0
-    for sample in tqdm(remaining_samples, desc="Processing samples"):
-        processed_sample = process_sample(sample, MODEL_NAME, TASK_NAME)
-        processed_set.append(processed_sample)
-        count_since_last_save += 1
-
-        if count_since_last_save >= 10:
-            save_checkpoint(processed_set, OUTPUT_FILE)
-            print(f"Checkpoint saved after processing {len(processed_set)} samples.")
-            count_since_last_save = 0
-
-    save_checkpoint(processed_set, OUTPUT_FILE)
-    print(f"All data saved to {OUTPUT_FILE}")
+    checkpoint = CheckpointStore(output_file, on_append=live_scorer.submit if live_scorer else None)
+    processed_ids = checkpoint.load_processed_ids()
+    if live_scorer and processed_ids:
+        live_scorer.add_scored(finished_samples(checkpoint, dataset, processed_ids))
+    remaining_samples = dataset.view([i for i in positions if dataset.ids[i] not in processed_ids])
+
+    try:
+        if USE_PREFIX_CACHE:
+            process_samples_prefix_cached(remaining_samples, checkpoint, TASK_NAME)
+        elif BATCH_SIZE > 1:
+            process_samples_batched(remaining_samples, checkpoint, TASK_NAME)
+        else:
+            for sample in tqdm(remaining_samples, desc="Processing samples"):
+                processed_sample = process_sample(sample, MODEL_NAME, TASK_NAME)
+                checkpoint.append(processed_sample)
+    except LiveScoringStop as e:
+        print(f"Run stopped early: {e}")
+    finally:
+        checkpoint.close()
+        if live_scorer:
+            live_scorer.close()
+
+    # Write the checkpoint log out as the final output file, in test set order
+    checkpoint.compact(dataset.ids)
+    dataset.close()
+    print(f"All data saved to {output_file}")
+    if response_cache:
+        print_cache_stats(response_cache)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,154 @@
+import queue
+import threading
+import numpy as np
+from tqdm import tqdm
+from metrics_modules import import_metrics_module
+
+parse_text_response = import_metrics_module('answer_parsing').parse_text_response
+failure_rate = import_metrics_module('stats').failure_rate
+
+# Metrics module whose score_item/METRICS score each task while generating. REA-ERR is
+# scored like ERR (the LLM judge runs after generation); GEN metrics need the embedding
+# and keyword models, so generation tasks only track the parse-failure rate.
+TASK_MODULES = {'PQA': 'PQA', 'ORD': 'ORD', 'ERR': 'ERR', 'REA-ERR': 'ERR'}
+MAX_PENDING = 32  # Samples queued for scoring before submit() blocks, bounds how far generation runs ahead
+
+
+class LiveScoringStop(Exception):
+    """Raised when the parse-failure rate of a run passes the threshold."""
+
+
+def _score_generation(item):
+    result = parse_text_response(item.get('generated_response'))
+    return {'parsed': int(result.error is None and bool(result.value))}
+
+
+def task_scorer(task_name):
+    """
+    Return (score_item, column names, metrics) used to score a task while generating.
+    """
+    if task_name in TASK_MODULES:
+        module = import_metrics_module(TASK_MODULES[task_name])
+        return module.score_item, module.ITEM_COLUMNS, module.METRICS
+    if task_name in ('GEN', 'REA-GEN'):
+        return _score_generation, ('parsed',), {'Failed': failure_rate('parsed')}
+    raise ValueError(f"Unsupported task name: {task_name}")
+
+
+class LiveScorer:
+    """
+    Scores samples while they are generated.
+
+    The generation loop (producer) hands every finished sample to submit(), which
+    only puts it on a queue; a background thread (consumer) parses and scores it
+    with the task's Metrics module and adds it to running column sums. The running
+    metrics are printed every `report_every` samples. Once `min_samples` are scored
+    and more than `max_failure_rate` of them could not be parsed, the next call to
+    submit() raises LiveScoringStop so the run can be aborted early. The queue holds
+    at most `max_pending` samples, so a fast producer waits for the consumer instead
+    of generating the whole run before the threshold is checked.
+
+    Args:
+        task_name (str): Task of the run ('PQA', 'ORD', 'ERR', 'REA-ERR', 'GEN', 'REA-GEN').
+        max_failure_rate (float): Parse-failure rate that stops the run (None = never stop).
+        min_samples (int): Samples scored before the failure rate is checked.
+        report_every (int): Print the running metrics every this many samples (0 = only at the end).
+        max_pending (int): Samples queued for scoring before submit() blocks.
+    """
+
+    def __init__(self, task_name, max_failure_rate=None, min_samples=100, report_every=50, max_pending=MAX_PENDING):
+        self.task_name = task_name
+        self.score_item, self.column_names, self.metrics = task_scorer(task_name)
+        self.max_failure_rate = max_failure_rate
+        self.min_samples = min_samples
+        self.report_every = report_every
+        self.sums = np.zeros(len(self.column_names))
+        self.count = 0
+        self.stop_reason = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def submit(self, sample):
+        """
+        Queue a finished sample for scoring, waiting while `max_pending` samples are queued.
+
+        Raises:
+            LiveScoringStop: If the parse-failure threshold was passed.
+        """
+        if self.stop_reason:
+            raise LiveScoringStop(self.stop_reason)
+        self._queue.put(sample)
+
+    def add_scored(self, samples):
+        """
+        Score samples finished by an earlier run right away, e.g. the records of a resumed checkpoint.
+        """
+        for sample in samples:
+            self._add(sample)
+
+    def _consume(self):
+        while True:
+            sample = self._queue.get()
+            if sample is None:
+                return
+            try:
+                self._add(sample)
+            except Exception as e:
+                tqdm.write(f"Live scoring failed for sample {sample.get('id')}: {e}")
+            if self.report_every and self.count % self.report_every == 0:
+                tqdm.write(f"[{self.count} scored] {self.summary()}")
+            self._check_failures()
+
+    def _add(self, sample):
+        scores = self.score_item(sample)
+        with self._lock:
+            self.sums += [scores[name] for name in self.column_names]
+            self.count += 1
+
+    def values(self):
+        """Return the running value of every metric."""
+        with self._lock:
+            sums, count = self.sums.copy(), self.count
+        named = {name: sums[j] for j, name in enumerate(self.column_names)}
+        return {metric: float(fn(named, count)) for metric, fn in self.metrics.items()}
+
+    def failure_rate(self):
+        with self._lock:
+            parsed, count = self.sums[self.column_names.index('parsed')], self.count
+        return 1 - parsed / count if count else 0.0
+
+    def summary(self):
+        return ", ".join(f"{metric}: {value:.4f}" for metric, value in self.values().items())
+
+    def _check_failures(self):
+        if self.max_failure_rate is None or self.stop_reason or self.count < self.min_samples:
+            return
+        rate = self.failure_rate()
+        if rate > self.max_failure_rate:
+            self.stop_reason = (f"{rate * 100:.1f}% of {self.count} responses could not be parsed "
+                                f"(limit {self.max_failure_rate * 100:.1f}%)")
+            tqdm.write(f"Stopping: {self.stop_reason}")
+
+    def close(self):
+        """
+        Score the queued samples, stop the consumer thread and print the final metrics.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        print(f"Live scores of {self.count} samples: {self.summary()}")
+
+
+def finished_samples(checkpoint, dataset, processed_ids):
+    """
+    Yield the samples finished by earlier runs of a checkpoint, so a resumed run reports
+    metrics over the whole output file. Benchmark fields are joined from the dataset,
+    since the records of Parquet runs only hold the model outputs.
+    """
+    records = {}
+    for record in checkpoint.iter_records():
+        if record['id'] in processed_ids:
+            records[record['id']] = record  # The last record of a sample wins
+    for sample_id, record in records.items():
+        yield dict(dataset.get(sample_id), **record)
@@ -0,0 +1,72 @@
+import sys
+import argparse
+from checkpoint import CheckpointStore, shard_output_file
+from dataset import IndexedDataset
+
+# ================================
+# Functions
+# ================================
+
+def merge_shards(output_file, num_shards, test_ids, done_key='generated_response', result_columns=None):
+    """
+    Merge the checkpoints of all shards into the checkpoint of `output_file` and write it out.
+
+    Records already in the merged checkpoint are kept; from the shards, only the
+    first finished record of each id is added, so merging again adds nothing new.
+    Returns the ids of `test_ids` that no shard has finished.
+    """
+    merged = CheckpointStore(output_file, done_key, result_columns=result_columns)
+    done = merged.load_processed_ids()
+    duplicates = 0
+
+    for shard_index in range(num_shards):
+        shard = CheckpointStore(shard_output_file(output_file, shard_index, num_shards), done_key)
+        added = 0
+        for record in shard.iter_records():
+            if done_key not in record:
+                continue
+            if record['id'] in done:
+                duplicates += 1
+                continue
+            merged.append(record)
+            done.add(record['id'])
+            added += 1
+        print(f"Shard {shard_index}: {added} samples from {shard.output_file}")
+
+    merged.compact(test_ids)
+    print(f"Skipped {duplicates} duplicate samples")
+
+    test_set = set(test_ids)
+    extra = len(done - test_set)
+    if extra:
+        print(f"{extra} merged samples are not in the test set")
+    return [sample_id for sample_id in test_ids if sample_id not in done]
+
+# ================================
+# Main Processing Function
+# ================================
+
+def main():
+    """
+    Combine shard outputs of a generation run into one output file and check that the test set is covered.
+    """
+    parser = argparse.ArgumentParser(description="Merge the shard outputs written with --num-shards/--shard-index.")
+    parser.add_argument('output_file', help="Unsharded output file, e.g. ./PQA_test_o3-mini.json")
+    parser.add_argument('--num-shards', type=int, required=True, help="Number of shards the run was split into")
+    parser.add_argument('--test-file', required=True, help="Test file of the run, e.g. ../Data/PQA_test.json")
+    parser.add_argument('--done-key', default='generated_response', help="Field that marks a finished sample")
+    parser.add_argument('--index-dir', default='./cache/datasets', help="Directory of the indexed test files")
+    args = parser.parse_args()
+
+    dataset = IndexedDataset(args.test_file, args.index_dir)
+    missing = merge_shards(args.output_file, args.num_shards, dataset.ids, args.done_key)
+    dataset.close()
+
+    print(f"All data saved to {args.output_file}")
+    if missing:
+        print(f"{len(missing)}/{len(dataset)} samples are missing, e.g. {', '.join(missing[:5])}")
+        sys.exit(1)
+    print(f"All {len(dataset)} samples are covered")
+
+if __name__ == '__main__':
+    main()
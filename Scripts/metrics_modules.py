@@ -0,0 +1,19 @@
+import os
+import sys
+import importlib
+
+
+# The generation scripts reuse the answer parsers and scorers of the evaluation
+# scripts instead of keeping copies of them. Both folders are run as plain script
+# directories, so this is the only place where Metrics/ is put on the import path.
+# It is appended, so a Metrics module can never shadow a module of Scripts/.
+METRICS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Metrics')
+
+
+def import_metrics_module(name):
+    """
+    Import a module of Metrics/ by name, e.g. 'answer_parsing', 'stats' or 'ERR'.
+    """
+    if METRICS_DIR not in sys.path:
+        sys.path.append(METRICS_DIR)
+    return importlib.import_module(name)
@@ -0,0 +1,210 @@
+# A local stand-in for an OpenAI-compatible API, used to test generate_response.py (live and batch mode) without a provider account.
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ================================
+# User Configuration
+# ================================
+
+HOST = '127.0.0.1'
+PORT = 8000
+RESPONSE = '[ANSWER_START]mock response[ANSWER_END]'   # Content of every generated message
+FINISH_REASON = 'stop'              # Finish reason of every generated message ('length' = cut off at max_tokens)
+POLLS_UNTIL_DONE = 2                # Batch status checks answered with 'in_progress' before a batch completes
+FAIL_EVERY = 0                      # Every n-th batch request fails (0 = none)
+EXPIRE_AFTER = 0                    # Batches expire after answering this many requests (0 = never)
+
+# ================================
+# Functions
+# ================================
+
+def chat_completion(body):
+    """
+    Build a chat completion response for a request body.
+    """
+    prompt_tokens = sum(len(message.get('content', '')) for message in body.get('messages', [])) // 4
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'mock'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': RESPONSE},
+            'finish_reason': FINISH_REASON
+        }],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': 8, 'total_tokens': prompt_tokens + 8}
+    }
+
+
+class MockState:
+    """
+    Files and batch jobs held in memory by the mock server.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+        self.polls = {}
+
+    def add_file(self, content, filename, purpose):
+        file_id = f'file-{uuid.uuid4().hex}'
+        self.files[file_id] = content
+        return {
+            'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+            'filename': filename, 'purpose': purpose, 'status': 'processed'
+        }
+
+    def run_batch(self, batch):
+        """
+        Answer the requests of a batch (only the first EXPIRE_AFTER, if set) and attach the output and error files.
+        """
+        outputs, errors = [], []
+        expired = False
+        lines = self.files[batch['input_file_id']].decode('utf-8').splitlines()
+        for index, line in enumerate(filter(str.strip, lines), start=1):
+            request = json.loads(line)
+            if EXPIRE_AFTER and index > EXPIRE_AFTER:
+                expired = True
+                break
+            if FAIL_EVERY and index % FAIL_EVERY == 0:
+                errors.append({
+                    'id': f'batch_req_{uuid.uuid4().hex}', 'custom_id': request['custom_id'],
+                    'response': {'status_code': 500, 'body': {'error': {'message': 'Mock failure'}}},
+                    'error': None
+                })
+            else:
+                outputs.append({
+                    'id': f'batch_req_{uuid.uuid4().hex}', 'custom_id': request['custom_id'],
+                    'response': {'status_code': 200, 'body': chat_completion(request['body'])},
+                    'error': None
+                })
+
+        def to_file(results):
+            if not results:
+                return None
+            content = ''.join(json.dumps(result) + '\n' for result in results).encode('utf-8')
+            return self.add_file(content, 'batch_output.jsonl', 'batch_output')['id']
+
+        batch.update({
+            'status': 'expired' if expired else 'completed',
+            'completed_at': int(time.time()),
+            'output_file_id': to_file(outputs),
+            'error_file_id': to_file(errors),
+            'request_counts': {'total': len(outputs) + len(errors), 'completed': len(outputs), 'failed': len(errors)}
+        })
+
+
+STATE = MockState()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        body = self.read_body()
+        with STATE.lock:
+            if self.path.endswith('/chat/completions'):
+                return self.send_json(chat_completion(json.loads(body)))
+
+            if self.path.endswith('/files'):
+                # Multipart upload with a `purpose` field and a `file` part
+                header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8')
+                message = BytesParser(policy=policy.HTTP).parsebytes(header + body)
+                fields = {
+                    part.get_param('name', header='content-disposition'): part
+                    for part in message.iter_parts()
+                }
+                upload = fields['file']
+                return self.send_json(STATE.add_file(
+                    upload.get_payload(decode=True), upload.get_filename(),
+                    fields['purpose'].get_payload(decode=True).decode('utf-8')
+                ))
+
+            if self.path.endswith('/batches'):
+                request = json.loads(body)
+                if request.get('input_file_id') not in STATE.files:
+                    return self.send_json({'error': {'message': 'Unknown input file'}}, 404)
+                batch_id = f'batch_{uuid.uuid4().hex}'
+                STATE.batches[batch_id] = {
+                    'id': batch_id, 'object': 'batch', 'endpoint': request['endpoint'],
+                    'input_file_id': request['input_file_id'], 'completion_window': request['completion_window'],
+                    'status': 'validating', 'created_at': int(time.time()), 'output_file_id': None,
+                    'error_file_id': None, 'request_counts': {'total': 0, 'completed': 0, 'failed': 0}
+                }
+                STATE.polls[batch_id] = 0
+                return self.send_json(STATE.batches[batch_id])
+
+        self.send_json({'error': {'message': f'Unknown endpoint {self.path}'}}, 404)
+
+    def do_GET(self):
+        with STATE.lock:
+            match = re.search(r'/batches/([^/]+)$', self.path)
+            if match and match.group(1) in STATE.batches:
+                batch = STATE.batches[match.group(1)]
+                STATE.polls[batch['id']] += 1
+                if batch['status'] not in ('completed', 'expired'):
+                    if STATE.polls[batch['id']] > POLLS_UNTIL_DONE:
+                        STATE.run_batch(batch)
+                    else:
+                        batch['status'] = 'in_progress'
+                return self.send_json(batch)
+
+            match = re.search(r'/files/([^/]+)/content$', self.path)
+            if match and match.group(1) in STATE.files:
+                data = STATE.files[match.group(1)]
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+
+        self.send_json({'error': {'message': f'Unknown endpoint {self.path}'}}, 404)
+
+# ================================
+# Main Processing Function
+# ================================
+
+def main():
+    """
+    Serve the mock API. Point BASE_URL of generate_response.py to http://HOST:PORT/v1.
+    """
+    global RESPONSE, FINISH_REASON, POLLS_UNTIL_DONE, FAIL_EVERY, EXPIRE_AFTER
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server for chat completions and the batch API.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--response', default=RESPONSE, help="Content of every generated message")
+    parser.add_argument('--finish-reason', default=FINISH_REASON, help="Finish reason of every generated message")
+    parser.add_argument('--polls-until-done', type=int, default=POLLS_UNTIL_DONE)
+    parser.add_argument('--fail-every', type=int, default=FAIL_EVERY, help="Every n-th batch request fails (0 = none)")
+    parser.add_argument('--expire-after', type=int, default=EXPIRE_AFTER,
+                        help="Batches expire after answering this many requests (0 = never)")
+    args = parser.parse_args()
+    RESPONSE, FINISH_REASON = args.response, args.finish_reason
+    POLLS_UNTIL_DONE, FAIL_EVERY, EXPIRE_AFTER = args.polls_until_done, args.fail_every, args.expire_after
+
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    print(f"Mock API listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,87 @@
-def generate_user_prompt(sample, task_name):
-    """
-    Generate a prompt for the given sample and task.
-    """
-    if task_name == 'PQA':
-        prompt = f"""
+from string import Formatter
+
+# Prompt templates are plain str.format strings over the fields of a sample (plus
+# `step`, the target step of ERR samples). Each template is compiled once into a
+# static prefix (all text before the first field) and a suffix of literal/field
+# pieces, so rendering is a single join and the prefix is shared by all samples.
+#
+# Layouts:
+#   'original' - the prompts used in the paper (default, keeps results comparable)
+#   'prefix'   - all static text moved before the per-sample fields, which makes the
+#                shared prefix as long as possible for provider prompt caching and
+#                local KV-cache reuse. PQA, ORD, GEN and REA-GEN keep the original
+#                sentences in a new order. ERR and REA-ERR introduce the step and
+#                context as "given below" with "Target step:"/"Context:" labels
+#                instead of "the following ...:", since the fields no longer follow
+#                those sentences. Results of the two layouts are not directly
+#                comparable; use 'original' to reproduce the paper.
+
+DEFAULT_LAYOUT = 'original'
+
+_REA_ERR_EXAMPLE = """Evaluate the validity of the following target step in a protocol. Follow the detailed reasoning process demonstrated in the example below to identify potential errors across Operation, Reagent, and Parameter categories, with meticulous attention to numerical values and their consistency with the provided context and typical practices.
+
+---
+
+Example Start
+
+**Example Target Step:**
+Mix 860µL of sterile deionized water and 14µL of 5% sodium hypochlorite in a 1.5mL tube.
+
+**Example Context:**
+{{
+    "purpose": "Sterilization of seeds to remove surface contaminants using sodium hypochlorite.",
+    "prior_step": "1.1 Place transgenic Arabidopsis seeds in a 1.5mL tube.",
+    "next_step": "1.2.2 Vigorously mix the contents of the tube using a vortex mixer."
+}}
+
+**Example Reasoning Process:**
+
+1.  **Operation Error:** The operations (Mix) and the use of a 1.5mL tube are standard. No obvious operational errors.
+2.  **Reagent Error:** The reagents are appropriate. However, the specified volume of 5% sodium hypochlorite is 14µL, mixed with 860µL water. This results in a very dilute solution (~0.07%). For sterilization, typical practice suggests a final concentration of around 0.5–1% sodium hypochlorite. Therefore, the reagent volume is significantly too low, which undermines effectiveness and contradicts the stated sterilization purpose.
+3.  **Parameter Error:** Although explicit parameters like time and temperature are not mentioned, the concentration of sodium hypochlorite functions as a critical parameter in disinfection efficacy. Here, the final concentration (~0.07%) is too low to be effective, making it a parameter error as well.
+
+Based on the significant numerical error in both Reagent volume and the effective concentration (parameter), the step is invalid.
+
+**Example Answer:**
+[ANSWER_START]False[ANSWER_END]
+
+---
+Example End
+"""
+
+_REA_GEN_STRUCTURE = """Your response must be structured strictly for machine processing. It must contain two main parts in order:
+1.  Your Chain of Thought (CoT) process, formatted with specific XML-like tags.
+2.  The final detailed protocol steps, wrapped in [ANSWER_START][ANSWER_END] tags.
+
+Please begin your response by outputting your thinking process. Follow this *exact* structure and include your analysis within the respective tags:
+
+Let's think step by step:
+<Objective>[Output the core objective of this protocol here]</Objective>.
+To achieve this, <Precondition>[Output the necessary preconditions, materials, equipment, etc., here]</Precondition>.
+The protocol must proceed as <Phase>[Output the logical division into key phases or stages here]</Phase>,
+where critical parameters are <Parameter>[Output the critical parameters for each step/phase and the logic behind them here]</Parameter>.
+Finally, <Structure>[Acknowledge and state the required output structure for the final steps here]</Structure>.
+
+After outputting the complete thinking process exactly as structured above, output the final detailed protocol steps.
+
+Format requirements for the final output steps (which must be placed *between* the [ANSWER_START] and [ANSWER_END] tags):
+- Each step must be on a separate line.
+
+[ANSWER_START]
+[Output the detailed protocol steps here, ensuring each step is on a new line]
+[ANSWER_END]
+"""
+
+TEMPLATES = {
+    'original': {
+        'PQA': """
 You will be given a multiple-choice question related to a biological protocol. The blank in the question (represented as '____') indicates where the correct choice should be filled in.
 
 Question:
-{sample['question']}
+{question}
 
 Choices:
-{sample['choices']}
+{choices}
 
 Your task:
 - Choose the most likely correct answer from the given choices.
@@ -20,28 +91,22 @@ Your task:
 - Output your answer *wrapped exactly* between the tags [ANSWER_START] and [ANSWER_END].
 - The format of your response must be:
 [ANSWER_START]your selected choice & your confidence score[ANSWER_END]
-"""
-    elif task_name == 'ORD':
-        prompt = f"""
-{sample['question']}
+""",
+        'ORD': """
+{question}
 The steps are:
-{sample['wrong_steps']}
+{wrong_steps}
 
 - Give me the correct order of the steps as a list of their original indices (start from 0), no other words.
 - Output your answer *wrapped exactly* between the tags [ANSWER_START] and [ANSWER_END].
 - The format of your response must be:
 [ANSWER_START]a list of the original indices[ANSWER_END]
-"""
-    elif task_name == 'ERR':
-        if sample['is_correct']:
-            step=sample['corrected_text']
-        else:
-            step=sample['corrupted_text']
-        prompt = f"""Determine whether the following target step in a protocol is True or False:
+""",
+        'ERR': """Determine whether the following target step in a protocol is True or False:
 {step}
 
 You may use the following context, which includes the purpose of the step, as well as the preceding and following steps, to inform your decision:
-{sample['context']}
+{context}
 
 Please carefully evaluate if the step is logically consistent, necessary, and accurate in the context. If you find anything wrong, answer False.
 
@@ -49,49 +114,85 @@ Please carefully evaluate if the step is logically consistent, necessary, and ac
 - Output your answer *wrapped exactly* between the tags [ANSWER_START] and [ANSWER_END].
 - The format of your response must be:
 [ANSWER_START]True or False[ANSWER_END]
-"""
-    elif task_name == 'REA-ERR':
-        if sample['is_correct']:
-            step=sample['corrected_text']
-        else:
-            step=sample['corrupted_text']
-        prompt = f"""Evaluate the validity of the following target step in a protocol. Follow the detailed reasoning process demonstrated in the example below to identify potential errors across Operation, Reagent, and Parameter categories, with meticulous attention to numerical values and their consistency with the provided context and typical practices.
+""",
+        'REA-ERR': _REA_ERR_EXAMPLE + """
+Now, evaluate the following target step using the same detailed reasoning process demonstrated in the example above:
 
----
+Evaluate the validity of the target step:
+{step}
 
-Example Start
+You may use the following context, which includes the purpose of the target step, as well as the preceding and following steps, to inform your decision:
+{context}
 
-**Example Target Step:**
-Mix 860µL of sterile deionized water and 14µL of 5% sodium hypochlorite in a 1.5mL tube.
+Analyze the step, paying meticulous attention to all numerical values (e.g., times, temperatures, volumes, concentrations, speeds, durations), by reasoning through the following three categories of potential errors. As part of this analysis, explicitly compare numerical values specified in the target step and consider typical laboratory practices.
 
-**Example Context:**
-{{
-    "purpose": "Sterilization of seeds to remove surface contaminants using sodium hypochlorite.",
-    "prior_step": "1.1 Place transgenic Arabidopsis seeds in a 1.5mL tube.",
-    "next_step": "1.2.2 Vigorously mix the contents of the tube using a vortex mixer."
-}}
+Only evaluate the correctness of the information explicitly present in the target step. Do not make assumptions about missing details. Focus solely on identifying errors in what is actually stated.
 
-**Example Reasoning Process:**
+The format of your final answer must be:
+[ANSWER_START]True or False[ANSWER_END]
+""",
+        'GEN': """{system_prompt}
+{instruction}
+Format requirements:
+- Each step must be on a separate line.
 
-1.  **Operation Error:** The operations (Mix) and the use of a 1.5mL tube are standard. No obvious operational errors.
-2.  **Reagent Error:** The reagents are appropriate. However, the specified volume of 5% sodium hypochlorite is 14µL, mixed with 860µL water. This results in a very dilute solution (~0.07%). For sterilization, typical practice suggests a final concentration of around 0.5–1% sodium hypochlorite. Therefore, the reagent volume is significantly too low, which undermines effectiveness and contradicts the stated sterilization purpose.
-3.  **Parameter Error:** Although explicit parameters like time and temperature are not mentioned, the concentration of sodium hypochlorite functions as a critical parameter in disinfection efficacy. Here, the final concentration (~0.07%) is too low to be effective, making it a parameter error as well.
+{input}""",
+        'REA-GEN': """{system_prompt}
+{instruction}
 
-Based on the significant numerical error in both Reagent volume and the effective concentration (parameter), the step is invalid.
+""" + _REA_GEN_STRUCTURE + """
+{input}""",
+    },
+    'prefix': {
+        'PQA': """
+You will be given a multiple-choice question related to a biological protocol. The blank in the question (represented as '____') indicates where the correct choice should be filled in.
 
-**Example Answer:**
-[ANSWER_START]False[ANSWER_END]
+Your task:
+- Choose the most likely correct answer from the given choices.
+- You must always select *one* answer, even if you are unsure.
+- The selected answer must match one of the choices exactly (including case and punctuation).
+- Assign a confidence score between 0 and 100 based on your certainty.
+- Output your answer *wrapped exactly* between the tags [ANSWER_START] and [ANSWER_END].
+- The format of your response must be:
+[ANSWER_START]your selected choice & your confidence score[ANSWER_END]
 
----
-Example End
+Question:
+{question}
 
-Now, evaluate the following target step using the same detailed reasoning process demonstrated in the example above:
+Choices:
+{choices}
+""",
+        'ORD': """
+- Give me the correct order of the steps as a list of their original indices (start from 0), no other words.
+- Output your answer *wrapped exactly* between the tags [ANSWER_START] and [ANSWER_END].
+- The format of your response must be:
+[ANSWER_START]a list of the original indices[ANSWER_END]
 
-Evaluate the validity of the target step:
+{question}
+The steps are:
+{wrong_steps}
+""",
+        'ERR': """Determine whether the target step in a protocol given below is True or False.
+
+You may use the context given below, which includes the purpose of the step, as well as the preceding and following steps, to inform your decision.
+
+Please carefully evaluate if the step is logically consistent, necessary, and accurate in the context. If you find anything wrong, answer False.
+
+- Please respond with only True or False, without any additional explanation.
+- Output your answer *wrapped exactly* between the tags [ANSWER_START] and [ANSWER_END].
+- The format of your response must be:
+[ANSWER_START]True or False[ANSWER_END]
+
+Target step:
 {step}
 
-You may use the following context, which includes the purpose of the target step, as well as the preceding and following steps, to inform your decision:
-{sample['context']}
+Context:
+{context}
+""",
+        'REA-ERR': _REA_ERR_EXAMPLE + """
+Now, evaluate the target step given below using the same detailed reasoning process demonstrated in the example above.
+
+You may use the context given below, which includes the purpose of the target step, as well as the preceding and following steps, to inform your decision.
 
 Analyze the step, paying meticulous attention to all numerical values (e.g., times, temperatures, volumes, concentrations, speeds, durations), by reasoning through the following three categories of potential errors. As part of this analysis, explicitly compare numerical values specified in the target step and consider typical laboratory practices.
 
@@ -99,42 +200,101 @@ Only evaluate the correctness of the information explicitly present in the targe
 
 The format of your final answer must be:
 [ANSWER_START]True or False[ANSWER_END]
-"""
-    elif task_name == 'GEN':
-        prompt = f"""{sample['system_prompt']}
-{sample['instruction']}
-Format requirements:
+
+Target step:
+{step}
+
+Context:
+{context}
+""",
+        'GEN': """Format requirements:
 - Each step must be on a separate line.
 
-{sample['input']}"""
-    elif task_name == 'REA-GEN':
-        prompt = f"""{sample['system_prompt']}
-{sample['instruction']}
+{system_prompt}
+{instruction}
 
-Your response must be structured strictly for machine processing. It must contain two main parts in order:
-1.  Your Chain of Thought (CoT) process, formatted with specific XML-like tags.
-2.  The final detailed protocol steps, wrapped in [ANSWER_START][ANSWER_END] tags.
+{input}""",
+        'REA-GEN': _REA_GEN_STRUCTURE + """
+{system_prompt}
+{instruction}
 
-Please begin your response by outputting your thinking process. Follow this *exact* structure and include your analysis within the respective tags:
+{input}""",
+    },
+}
 
-Let's think step by step:
-<Objective>[Output the core objective of this protocol here]</Objective>.
-To achieve this, <Precondition>[Output the necessary preconditions, materials, equipment, etc., here]</Precondition>.
-The protocol must proceed as <Phase>[Output the logical division into key phases or stages here]</Phase>,
-where critical parameters are <Parameter>[Output the critical parameters for each step/phase and the logic behind them here]</Parameter>.
-Finally, <Structure>[Acknowledge and state the required output structure for the final steps here]</Structure>.
 
-After outputting the complete thinking process exactly as structured above, output the final detailed protocol steps.
+class PromptTemplate:
+    """
+    A prompt template compiled into a static prefix and per-sample suffix pieces.
+    """
 
-Format requirements for the final output steps (which must be placed *between* the [ANSWER_START] and [ANSWER_END] tags):
-- Each step must be on a separate line.
+    def __init__(self, template):
+        # Split into (literal text, field) pairs; escaped braces only continue the literal text
+        pieces, literal = [], ''
+        for text, field, _, _ in Formatter().parse(template):
+            literal += text
+            if field is not None:
+                pieces.append((literal, field))
+                literal = ''
 
-[ANSWER_START]
-[Output the detailed protocol steps here, ensuring each step is on a new line]
-[ANSWER_END]
+        # Everything before the first field is the shared prefix
+        if pieces:
+            self.prefix = pieces[0][0]
+            pieces[0] = ('', pieces[0][1])
+            self._tail = literal
+        else:
+            self.prefix, self._tail = literal, ''
+        self._pieces = pieces
+        self.fields = [field for _, field in pieces]
 
-{sample['input']}"""
-    else:
+    def render_suffix(self, values):
+        """
+        Render the sample-specific part of the prompt.
+        """
+        return ''.join([literal + str(values[field]) for literal, field in self._pieces] + [self._tail])
+
+    def render(self, values):
+        return self.prefix + self.render_suffix(values)
+
+
+_COMPILED = {
+    layout: {task_name: PromptTemplate(template) for task_name, template in templates.items()}
+    for layout, templates in TEMPLATES.items()
+}
+
+
+def get_prompt_template(task_name, layout=DEFAULT_LAYOUT):
+    """
+    Return the compiled template of a task.
+    """
+    if layout not in _COMPILED:
+        raise ValueError(f"Unsupported prompt layout: {layout}")
+    if task_name not in _COMPILED[layout]:
         raise ValueError(f"Unsupported task name: {task_name}")
-    
-    return prompt
+    return _COMPILED[layout][task_name]
+
+
+def prompt_fields(sample, task_name):
+    """
+    Return the values available to a template: the sample fields plus derived ones.
+    """
+    if task_name in ('ERR', 'REA-ERR'):
+        step = sample['corrected_text'] if sample['is_correct'] else sample['corrupted_text']
+        return dict(sample, step=step)
+    return sample
+
+
+def split_user_prompt(sample, task_name, layout=DEFAULT_LAYOUT):
+    """
+    Generate the prompt for the given sample and task as (static prefix, per-sample suffix).
+    """
+    template = get_prompt_template(task_name, layout)
+    return template.prefix, template.render_suffix(prompt_fields(sample, task_name))
+
+
+def generate_user_prompt(sample, task_name, layout=DEFAULT_LAYOUT):
+    """
+    Generate a prompt for the given sample and task.
+    """
+    prefix, suffix = split_user_prompt(sample, task_name, layout)
+    return prefix + suffix
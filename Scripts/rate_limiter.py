@@ -0,0 +1,195 @@
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimate the number of tokens in a text (about 4 characters per token).
+    """
+    return max(1, len(text) // 4)
+
+
+def get_used_tokens(response):
+    """
+    Return the total number of tokens reported by the API for a response, if any.
+    """
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None)
+
+
+def is_rate_limit_error(exc):
+    """
+    Check whether an exception raised by the OpenAI client is a 429 response.
+    """
+    return getattr(exc, 'status_code', None) == 429
+
+
+def retry_after_seconds(exc):
+    """
+    Read the Retry-After delay (in seconds) from the response attached to an exception.
+    Returns None if the server did not send one.
+    """
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        # Retry-After may also be an HTTP date
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` units per second, holding at most `capacity` units.
+    Reservations are debited immediately and may drive the balance negative; the
+    caller is told how long to wait until the debt is paid back.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount, now):
+        """
+        Debit `amount` units and return the number of seconds to wait before using them.
+        """
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self, amount, now):
+        """
+        Give back (or, if negative, additionally charge) `amount` units.
+        """
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Client-side requests-per-minute and tokens-per-minute budget with AIMD backoff.
+
+    Every request reserves one request and its estimated token count before it is
+    sent. A 429 response halves the allowed rate (multiplicative decrease) and, if the
+    server sent a Retry-After header, pauses every caller sharing this limiter until
+    it has passed. Each successful request then raises the rate again by a small
+    step (additive increase) until the configured budget is reached.
+
+    The limiter is thread-safe and can be shared by sequential, threaded and asyncio
+    runners: use acquire() from synchronous code and acquire_async() from coroutines.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None,
+                 min_fraction=0.05, increase_step=0.02, decrease_factor=0.5, max_backoff=60):
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_fraction = min_fraction
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_backoff = max_backoff
+        self.fraction = 1.0
+        self.paused_until = 0.0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def _set_fraction(self, fraction):
+        self.fraction = min(1.0, max(self.min_fraction, fraction))
+        if self.requests is not None:
+            self.requests.rate = self.requests_per_minute * self.fraction / 60
+        if self.tokens is not None:
+            self.tokens.rate = self.tokens_per_minute * self.fraction / 60
+
+    def reserve(self, tokens=0):
+        """
+        Reserve budget for one request of about `tokens` tokens.
+        Returns the number of seconds the caller has to wait before sending it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            return wait
+
+    def acquire(self, tokens=0):
+        """
+        Block until a request of about `tokens` tokens may be sent.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=0):
+        """
+        Asynchronous counterpart of acquire().
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self, estimated_tokens=0, used_tokens=None):
+        """
+        Record a successful request: additively increase the rate and, if the real
+        token usage is known, correct the token budget for the estimation error.
+        """
+        with self._lock:
+            self._set_fraction(self.fraction + self.increase_step)
+            if self.tokens is not None and used_tokens is not None:
+                self.tokens.refund(estimated_tokens - used_tokens, time.monotonic())
+
+    def on_error(self, exc, attempt, initial_delay=1):
+        """
+        Record a failed request and return how many seconds to wait before retrying it.
+
+        Rate-limit errors decrease the allowed rate (once per backoff window, so a
+        burst of concurrent 429s counts as a single congestion event) and honour the
+        Retry-After header. All delays are jittered so that concurrent callers do
+        not retry in lockstep.
+        """
+        backoff = min(self.max_backoff, initial_delay * (2 ** attempt))
+        if not is_rate_limit_error(exc):
+            return random.uniform(backoff / 2, backoff)
+
+        with self._lock:
+            now = time.monotonic()
+            self.rate_limited += 1
+            if now >= self.paused_until:
+                self._set_fraction(self.fraction * self.decrease_factor)
+            retry_after = retry_after_seconds(exc)
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, now + min(retry_after, self.max_backoff))
+                return min(retry_after, self.max_backoff) + random.uniform(0, initial_delay)
+            self.paused_until = max(self.paused_until, now + backoff / 2)
+            return random.uniform(0, backoff)
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of model responses stored in SQLite.
+
+    Entries are keyed by a hash of (model, task, rendered prompt, decoding parameters),
+    so the same prompt is only sent once per model and sampling setup no matter which
+    output file or run asks for it. When the stored responses grow beyond `max_bytes`,
+    the least recently used entries are evicted. Hits and misses are counted both for
+    the current run and cumulatively in the database.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, 'responses.sqlite')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, task TEXT, response TEXT, "
+            "size INTEGER, created_at REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model, task, prompt, params):
+        """
+        Build the cache key for a request.
+        `params` holds the decoding parameters (temperature, max_tokens, ...).
+        """
+        payload = json.dumps(
+            {'model': model, 'task': task, 'prompt': prompt, 'params': params},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _count(self, name):
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def get(self, key):
+        """
+        Return the cached response for `key`, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self._count('misses')
+            else:
+                self.hits += 1
+                self._count('hits')
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return None if row is None else row[0]
+
+    def put(self, key, model, task, response):
+        """
+        Store a response and evict least recently used entries if the cache is over its size limit.
+        """
+        size = len(response.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, task, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, task, response, size, now, now)
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self._conn.commit()
+
+    def _evict(self, target_bytes):
+        """
+        Delete least recently used entries until the cache holds at most target_bytes.
+        """
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access")
+        evicted = []
+        for key, size in rows:
+            if self._size <= target_bytes:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self):
+        """
+        Return hit/miss counters for this run and for the lifetime of the cache.
+        """
+        with self._lock:
+            totals = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'total_hits': totals.get('hits', 0),
+            'total_misses': totals.get('misses', 0),
+            'entries': entries,
+            'size_bytes': self._size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def print_cache_stats(cache):
+    """
+    Print the response cache hit/miss counters.
+    """
+    stats = cache.stats()
+    print(f"Cache hits: {stats['hits']}, misses: {stats['misses']} ({stats['hit_rate'] * 100:.2f}% hit rate)")
+    print(f"Cache entries: {stats['entries']} ({stats['size_bytes'] / 1024 ** 2:.1f} MB)")
@@ -0,0 +1,29 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# Scripts/ and Metrics/ are plain script directories; make their modules importable
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('Scripts', 'Metrics'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import mock_batch_server
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """Serve a fresh mock API on a free port; yields its base URL."""
+    monkeypatch.setattr(mock_batch_server, 'STATE', mock_batch_server.MockState())
+    monkeypatch.setattr(mock_batch_server, 'POLLS_UNTIL_DONE', 0)
+    monkeypatch.setattr(mock_batch_server, 'FAIL_EVERY', 0)
+    monkeypatch.setattr(mock_batch_server, 'EXPIRE_AFTER', 0)
+    server = mock_batch_server.ThreadingHTTPServer(('127.0.0.1', 0), mock_batch_server.MockHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
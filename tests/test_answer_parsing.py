@@ -0,0 +1,75 @@
+import pytest
+
+from answer_parsing import (ParseResult, failure_reasons, parse_answer_and_confidence, parse_batch, parse_binary,
+                            parse_index_list, parse_text_response)
+
+
+@pytest.mark.parametrize('response, value', [
+    ('[ANSWER_START]True[ANSWER_END]', True),
+    ('[ANSWER_START] false [ANSWER_END]', False),
+    ('<think>[ANSWER_START]True[ANSWER_END]</think>[ANSWER_START]False[ANSWER_END]', False),  # After the reasoning
+    ('[ANSWER_START]True[ANSWER_END] ... [ANSWER_START]False[ANSWER_END]', False),  # The last block
+    ('The step is wrong.\nFalse', False),  # No block: the last line
+    ('[INST] Answer True or False [/INST] True', True),
+])
+def test_parse_binary(response, value):
+    assert parse_binary(response).value is value
+
+
+@pytest.mark.parametrize('response, error', [
+    (None, "missing response"),
+    ('[ANSWER_START]maybe[ANSWER_END]', "unrecognized answer"),
+])
+def test_parse_binary_failures(response, error):
+    assert parse_binary(response) == ParseResult(None, None if response is None else 'maybe', error)
+
+
+@pytest.mark.parametrize('response, value', [
+    ('[ANSWER_START]B & 85[ANSWER_END]', ('B', 85)),
+    ('[ANSWER_START] 10 mM & 100% [ANSWER_END]', ('10 mM', 100)),
+    ('[ANSWER_START]37 °C 90[ANSWER_END]', ('37 °C', 90)),
+    ('<think>[ANSWER_START]A & 1[ANSWER_END]</think>[ANSWER_START]C & 70[ANSWER_END]', ('C', 70)),
+])
+def test_parse_answer_and_confidence(response, value):
+    assert parse_answer_and_confidence(response).value == value
+
+
+@pytest.mark.parametrize('response, error', [
+    ('B & 85', "missing answer block"),
+    ('[ANSWER_START]A & B & 85[ANSWER_END]', "expected one '&' to separate answer and confidence"),
+    ('[ANSWER_START]A & high[ANSWER_END]', "confidence value not found"),
+    ('[ANSWER_START]A & 150[ANSWER_END]', "confidence exceeds 100"),
+])
+def test_parse_answer_and_confidence_failures(response, error):
+    result = parse_answer_and_confidence(response)
+    assert result.value is None and result.error == error
+
+
+@pytest.mark.parametrize('response, num_steps, value, error', [
+    ('[ANSWER_START][2, 0, 1][ANSWER_END]', 3, [2, 0, 1], None),
+    ('[ANSWER_START](1, 0)[ANSWER_END]', 2, [1, 0], None),
+    ('[ANSWER_START][0, 0, 1][ANSWER_END]', 3, None, "invalid or incomplete index set"),  # Repeated index
+    ('[ANSWER_START][0, 1][ANSWER_END]', 3, None, "invalid or incomplete index set"),
+    ('[ANSWER_START][0, 1, 3][ANSWER_END]', 3, None, "invalid or incomplete index set"),
+    ('[ANSWER_START][0, 1.0][ANSWER_END]', 2, None, "cannot parse step indices as list"),
+    ('[ANSWER_START]first, then second[ANSWER_END]', 2, None, "cannot parse step indices as list"),
+    ('[0, 1]', 2, None, "missing answer block"),
+])
+def test_parse_index_list(response, num_steps, value, error):
+    result = parse_index_list(response, num_steps)
+    assert (result.value, result.error) == (value, error)
+
+
+@pytest.mark.parametrize('response, text', [
+    ('1. Mix.\n2. Spin.', '1. Mix.\n2. Spin.'),
+    ('<think>plan</think>\n[ANSWER_START]\n1. Mix.\n[ANSWER_END] trailing', '1. Mix.'),
+    ('<Structure>[ANSWER_START]draft[ANSWER_END]</Structure>[ANSWER_START]1. Mix.[ANSWER_END]', '1. Mix.'),
+])
+def test_parse_text_response(response, text):
+    assert parse_text_response(response).value == text
+
+
+def test_parse_batch_counts_failure_reasons():
+    results = parse_batch(parse_index_list, ['[ANSWER_START][1, 0][ANSWER_END]', 'none', None], [2, 2, 2])
+    assert [result.value for result in results] == [[1, 0], None, None]
+    assert failure_reasons(results) == {"missing answer block": 1, "missing response": 1}
@@ -0,0 +1,131 @@
+import json
+import os
+import importlib
+
+import pytest
+from openai import OpenAI
+
+import mock_batch_server
+from checkpoint import CheckpointStore
+from batch_api import batch_state_file, load_batch_state
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'PQA_test.json')
+
+
+@pytest.fixture
+def generation(monkeypatch, tmp_path, mock_server):
+    """generate_response.py configured for the batch API of the mock server, without a response cache."""
+    monkeypatch.chdir(tmp_path)  # The module creates its cache directory on import
+    module = importlib.import_module('generate_response')
+    monkeypatch.setattr(module, 'client', OpenAI(api_key='test', base_url=mock_server))
+    monkeypatch.setattr(module, 'response_cache', None)
+    monkeypatch.setattr(module, 'BATCH_POLL_INTERVAL', 0)
+    monkeypatch.setattr(module, 'BATCH_MAX_REQUESTS', 2)
+    return module
+
+
+def load_samples(count):
+    with open(DATA_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)[:count]
+
+
+def run_batch(module, samples, output_file):
+    checkpoint = CheckpointStore(output_file)
+    done = checkpoint.load_processed_ids()
+    remaining = [sample for sample in samples if sample['id'] not in done]
+    try:
+        module.process_samples_batch_api(remaining, checkpoint, 'mock-model', 'PQA', output_file)
+    finally:
+        checkpoint.close()
+    return {record['id']: record for record in checkpoint.iter_records()}
+
+
+def test_failed_requests_are_submitted_again(generation, tmp_path, monkeypatch):
+    output_file = str(tmp_path / 'PQA_test_mock.json')
+    samples = load_samples(5)
+    monkeypatch.setattr(mock_batch_server, 'FAIL_EVERY', 2)  # The 2nd request of every batch fails
+
+    records = run_batch(generation, samples, output_file)
+    assert len(records) == 3
+    assert all(record['generated_response'] == mock_batch_server.RESPONSE for record in records.values())
+    assert not os.path.exists(batch_state_file(output_file))
+    assert not [name for name in os.listdir(tmp_path) if '.batch-input-' in name]
+
+    monkeypatch.setattr(mock_batch_server, 'FAIL_EVERY', 0)
+    records = run_batch(generation, samples, output_file)
+    assert sorted(records) == sorted(sample['id'] for sample in samples)
+    assert len(mock_batch_server.STATE.batches) == 3 + 1  # 5 requests in batches of 2, then the 2 failures
+
+
+def test_interrupted_submission_resumes_without_resubmitting(generation, tmp_path, monkeypatch):
+    output_file = str(tmp_path / 'PQA_test_mock.json')
+    samples = load_samples(5)
+    submit_batch = generation.submit_batch
+    submitted = []
+
+    def submit_then_fail(client, path, completion_window):
+        if len(submitted) == 1:
+            raise RuntimeError("Connection lost")
+        submitted.append(path)
+        return submit_batch(client, path, completion_window)
+
+    monkeypatch.setattr(generation, 'submit_batch', submit_then_fail)
+    with pytest.raises(RuntimeError):
+        run_batch(generation, samples, output_file)
+    state = load_batch_state(batch_state_file(output_file))
+    assert len(state['input_files']) == 3
+    assert len(state['batch_ids']) == 1
+
+    monkeypatch.setattr(generation, 'submit_batch', submit_batch)
+    records = run_batch(generation, samples, output_file)
+    assert sorted(records) == sorted(sample['id'] for sample in samples)
+    assert len(mock_batch_server.STATE.batches) == 3  # The first batch was not submitted again
+    assert not os.path.exists(batch_state_file(output_file))
+
+
+def test_requests_of_expired_batches_are_reported_and_submitted_again(generation, tmp_path, monkeypatch, capsys):
+    output_file = str(tmp_path / 'PQA_test_mock.json')
+    samples = load_samples(5)
+    monkeypatch.setattr(mock_batch_server, 'EXPIRE_AFTER', 1)  # Every batch expires after its 1st request
+
+    records = run_batch(generation, samples, output_file)
+    assert len(records) == 3
+    out = capsys.readouterr().out
+    assert out.count("(expired) returned no result for 1 requests") == 2
+    assert "0 samples failed and 2 got no result" in out
+
+    monkeypatch.setattr(mock_batch_server, 'EXPIRE_AFTER', 0)
+    records = run_batch(generation, samples, output_file)
+    assert sorted(records) == sorted(sample['id'] for sample in samples)
+
+
+@pytest.mark.parametrize('setting, value', [('model', 'other-model'), ('TEST_FILE_PATH', '../Data/ERR_test.json'),
+                                            ('PROMPT_LAYOUT', 'prefix')])
+def test_resuming_with_another_configuration_is_refused(generation, tmp_path, monkeypatch, setting, value):
+    output_file = str(tmp_path / 'PQA_test_mock.json')
+    samples = load_samples(5)
+    submit_batch = generation.submit_batch
+
+    def submit_once(client, path, completion_window):
+        if mock_batch_server.STATE.batches:
+            raise RuntimeError("Connection lost")
+        return submit_batch(client, path, completion_window)
+
+    monkeypatch.setattr(generation, 'submit_batch', submit_once)
+    with pytest.raises(RuntimeError):
+        run_batch(generation, samples, output_file)
+    state = load_batch_state(batch_state_file(output_file))
+    assert state['model'] == 'mock-model' and state['task'] == 'PQA'
+
+    monkeypatch.setattr(generation, 'submit_batch', submit_batch)
+    model = 'mock-model'
+    if setting == 'model':
+        model = value
+    else:
+        monkeypatch.setattr(generation, setting, value)
+    checkpoint = CheckpointStore(output_file)
+    with pytest.raises(ValueError, match="belongs to a different batch run"):
+        generation.process_samples_batch_api(samples, checkpoint, model, 'PQA', output_file)
+    checkpoint.close()
+    assert load_batch_state(batch_state_file(output_file)) == state
+    assert len(mock_batch_server.STATE.batches) == 1
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from checkpoint import CheckpointStore, shard_output_file
+
+
+def sample(i, response=None):
+    record = {'id': f'TEST-PQA-{i:06d}', 'question': f'Question {i}', 'answer': 'A'}
+    if response is not None:
+        record['generated_response'] = response
+    return record
+
+
+def test_compaction_round_trip(tmp_path):
+    output_file = str(tmp_path / 'PQA_test_mock.json')
+    checkpoint = CheckpointStore(output_file, sync_every=2)
+    assert checkpoint.load_processed_ids() == set()
+    for i in (2, 0, 1):
+        checkpoint.append(sample(i, f'first {i}'))
+    checkpoint.append(sample(0, 'second 0'))  # The last record of a sample wins
+    checkpoint.append(sample(3))  # No response yet
+    checkpoint.close()
+
+    assert CheckpointStore(output_file).load_processed_ids() == {sample(i)['id'] for i in range(3)}
+    order = [sample(i)['id'] for i in range(4)]
+    checkpoint.compact(order)
+
+    assert not os.path.exists(checkpoint.log_file)
+    with open(output_file, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    assert records == [sample(0, 'second 0'), sample(1, 'first 1'), sample(2, 'first 2'), sample(3)]
+
+    # The next run seeds its log from the output file and picks up edits to it
+    records[1]['generated_response'] = 'edited 1'
+    del records[2]['generated_response']
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(records, f)
+    resumed = CheckpointStore(output_file)
+    assert resumed.load_processed_ids() == {sample(0)['id'], sample(1)['id']}
+    assert list(resumed.iter_records()) == records
+
+
+def test_truncated_last_record_is_dropped(tmp_path):
+    output_file = str(tmp_path / 'PQA_test_mock.json')
+    checkpoint = CheckpointStore(output_file)
+    checkpoint.append(sample(0, 'done'))
+    checkpoint.close()
+    with open(checkpoint.log_file, 'a', encoding='utf-8') as f:
+        f.write('{"id": "TEST-PQA-000001", "generated_')  # Crash in the middle of a write
+    size = os.path.getsize(checkpoint.log_file)
+
+    resumed = CheckpointStore(output_file)
+    assert resumed.load_processed_ids() == {sample(0)['id']}
+    assert os.path.getsize(resumed.log_file) < size
+    resumed.append(sample(1, 'done'))
+    resumed.compact()
+    with open(output_file, 'r', encoding='utf-8') as f:
+        assert json.load(f) == [sample(0, 'done'), sample(1, 'done')]
+
+
+def test_empty_log_compacts_to_an_empty_list(tmp_path):
+    output_file = str(tmp_path / 'PQA_test_mock.json')
+    checkpoint = CheckpointStore(output_file)
+    open(checkpoint.log_file, 'w').close()
+    checkpoint.compact()
+    with open(output_file, 'r', encoding='utf-8') as f:
+        assert json.load(f) == []
+
+
+def test_parquet_output_keeps_the_result_columns(tmp_path):
+    pytest.importorskip('pyarrow')
+    output_file = str(tmp_path / 'PQA_test_mock.parquet')
+    checkpoint = CheckpointStore(output_file)
+    for i in range(3):
+        checkpoint.append(sample(i, f'response {i}'))
+    checkpoint.compact([sample(i)['id'] for i in (2, 1, 0)])
+
+    resumed = CheckpointStore(output_file)
+    assert resumed.load_processed_ids() == {sample(i)['id'] for i in range(3)}
+    assert list(resumed.iter_records()) == [
+        {'id': sample(i)['id'], 'generated_response': f'response {i}'} for i in (2, 1, 0)
+    ]
+
+
+def test_shard_output_file_pads_the_index():
+    assert shard_output_file('out/PQA_test_o3-mini.json', 1, 4) == 'out/PQA_test_o3-mini.shard-1-of-4.json'
+    assert shard_output_file('PQA.parquet', 3, 12) == 'PQA.shard-03-of-12.parquet'
@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from dataset import IndexedDataset, shard_of
+
+
+def write_split(path, samples):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(samples, f, indent=4, ensure_ascii=False)
+
+
+def make_samples(n, suffix=''):
+    return [{'id': f'TEST-PQA-{i:06d}', 'question': f'Qüestion {i}{suffix}', 'type': ('parameter', 'reagent')[i % 2]}
+            for i in range(n)]
+
+
+def test_samples_are_read_back_by_position_and_id(tmp_path):
+    source = str(tmp_path / 'PQA_test.json')
+    samples = make_samples(10)
+    write_split(source, samples)
+
+    dataset = IndexedDataset(source, str(tmp_path / 'index'))
+    assert len(dataset) == 10
+    assert [dataset[i] for i in range(10)] == samples
+    assert dataset.get('TEST-PQA-000007') == samples[7]
+    assert dataset.positions(types=['reagent'], start=2, stop=8) == [3, 5, 7]
+    assert list(dataset.view([4, 1])) == [samples[4], samples[1]]
+    assert dataset.view([4, 1]).ids == ['TEST-PQA-000004', 'TEST-PQA-000001']
+    dataset.close()
+
+
+def test_index_is_reused_until_the_source_changes(tmp_path, capsys):
+    source = str(tmp_path / 'PQA_test.json')
+    index_dir = str(tmp_path / 'index')
+    write_split(source, make_samples(5))
+    IndexedDataset(source, index_dir).close()
+    assert capsys.readouterr().out.count("Indexing") == 1
+
+    IndexedDataset(source, index_dir).close()
+    assert "Indexing" not in capsys.readouterr().out
+
+    changed = make_samples(7, suffix=' (revised)')
+    write_split(source, changed)
+    dataset = IndexedDataset(source, index_dir)
+    assert "Indexing" in capsys.readouterr().out
+    assert list(dataset.view(range(len(dataset)))) == changed
+    dataset.close()
+    assert sorted(os.listdir(index_dir)) == ['PQA_test.index.json', 'PQA_test.records']  # No temporary files left
+
+
+def test_failed_indexing_leaves_no_files(tmp_path):
+    source = str(tmp_path / 'PQA_test.json')
+    index_dir = str(tmp_path / 'index')
+    write_split(source, [{'question': 'No id'}])
+    with pytest.raises(KeyError):
+        IndexedDataset(source, index_dir)
+    assert os.listdir(index_dir) == []
+
+
+def test_shards_partition_the_split(tmp_path):
+    source = str(tmp_path / 'PQA_test.json')
+    write_split(source, make_samples(50))
+    dataset = IndexedDataset(source, str(tmp_path / 'index'))
+    shards = [dataset.positions(num_shards=3, shard_index=k) for k in range(3)]
+    assert sorted(sum(shards, [])) == list(range(50))
+    assert all(shard_of(dataset.ids[i], 3) == k for k, shard in enumerate(shards) for i in shard)
+    with pytest.raises(ValueError):
+        dataset.positions(num_shards=3, shard_index=3)
+    dataset.close()
+
+
+def test_empty_split(tmp_path):
+    source = str(tmp_path / 'PQA_test.json')
+    write_split(source, [])
+    dataset = IndexedDataset(source, str(tmp_path / 'index'))
+    assert len(dataset) == 0
+    assert dataset.positions() == []
+    dataset.close()
@@ -0,0 +1,61 @@
+import json
+import os
+import importlib.util
+
+import pytest
+from openai import OpenAI
+
+import mock_batch_server
+from response_cache import ResponseCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JUDGE_SCRIPT = os.path.join(ROOT, 'Scripts', 'LLM-as-a-judge_for_REA-ERR.py')
+DATA_FILE = os.path.join(ROOT, 'Data', 'ERR_test.json')
+
+
+@pytest.fixture
+def judge(monkeypatch, tmp_path, mock_server):
+    """The LLM-as-a-judge script pointed at the mock server, judging 4 REA-ERR results in tmp_path."""
+    monkeypatch.chdir(tmp_path)  # The module creates its cache directory on import
+    spec = importlib.util.spec_from_file_location('llm_judge', JUDGE_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    with open(DATA_FILE, 'r', encoding='utf-8') as f:
+        samples = [sample for sample in json.load(f) if not sample['is_correct']][:4]
+    for sample in samples:
+        sample['generated_response'] = '[ANSWER_START]False[ANSWER_END]'
+    results_file = str(tmp_path / 'REA-ERR_test_mock.json')
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(samples, f)
+
+    monkeypatch.setattr(module, 'client', OpenAI(api_key='test', base_url=mock_server))
+    monkeypatch.setattr(module, 'response_cache', ResponseCache(str(tmp_path / 'cache')))
+    monkeypatch.setattr(module, 'TEST_FILE_PATH', results_file)
+    monkeypatch.setattr(module, 'OUTPUT_FILE', results_file)
+    return module
+
+
+def judged(module):
+    with open(module.OUTPUT_FILE, 'r', encoding='utf-8') as f:
+        return [sample.get('LLM_judge') for sample in json.load(f)]
+
+
+@pytest.mark.parametrize('response, finish_reason', [
+    ('[ANSWER_START]Tr', 'length'),                         # Cut off before the verdict ends
+    ('[ANSWER_START]True[ANSWER_END] Because', 'length'),   # Parseable, but cut off
+    ('The response identifies the error.', 'stop'),         # No verdict
+])
+@pytest.mark.parametrize('items_per_request', [1, 2])
+def test_bad_verdicts_are_judged_again(judge, monkeypatch, response, finish_reason, items_per_request):
+    monkeypatch.setattr(judge, 'ITEMS_PER_REQUEST', items_per_request)
+    monkeypatch.setattr(mock_batch_server, 'RESPONSE', response)
+    monkeypatch.setattr(mock_batch_server, 'FINISH_REASON', finish_reason)
+    judge.main()
+    assert judged(judge) == [None] * 4
+    assert judge.response_cache.stats()['entries'] == 0
+
+    monkeypatch.setattr(mock_batch_server, 'RESPONSE', '[ANSWER_START]True[ANSWER_END]')
+    monkeypatch.setattr(mock_batch_server, 'FINISH_REASON', 'stop')
+    judge.main()
+    assert judged(judge) == ['[ANSWER_START]True[ANSWER_END]'] * 4
@@ -0,0 +1,37 @@
+import pytest
+
+from live_scoring import LiveScorer, LiveScoringStop
+
+
+def err_sample(i):
+    """An ERR sample whose response cannot be parsed for 17 of every 50 samples (34%)."""
+    response = "no answer" if i % 50 < 17 else "[ANSWER_START]True[ANSWER_END]"
+    return {'id': str(i), 'generated_response': response, 'is_correct': True}
+
+
+def test_fast_producer_is_stopped_near_min_samples():
+    scorer = LiveScorer('ERR', max_failure_rate=0.2, min_samples=100, report_every=0, max_pending=8)
+    accepted = 0
+    try:
+        for i in range(300):
+            scorer.submit(err_sample(i))
+            accepted += 1
+    except LiveScoringStop:
+        pass
+    scorer.close()
+
+    assert scorer.stop_reason
+    # At most the queue (plus the one sample waiting to enter it) runs past the check
+    assert 100 <= accepted <= 100 + 8 + 1
+    assert scorer.count == accepted
+
+
+def test_low_failure_rate_does_not_stop():
+    scorer = LiveScorer('ERR', max_failure_rate=0.5, min_samples=100, report_every=0, max_pending=8)
+    for i in range(300):
+        scorer.submit(err_sample(i))
+    scorer.close()
+
+    assert scorer.stop_reason is None
+    assert scorer.count == 300
+    assert scorer.failure_rate() == pytest.approx(0.34)
@@ -0,0 +1,114 @@
+import os
+import json
+import random
+import importlib
+
+import numpy as np
+import pytest
+
+import ERR
+import GEN
+import ORD
+import PQA
+from test_stats import err_items, ord_items, pqa_items
+
+REA_ERR = importlib.import_module('REA-ERR')
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data')
+
+
+def write_items(tmp_path, items):
+    path = str(tmp_path / 'results.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(items, f)
+    return path
+
+
+def test_pqa_evaluator_matches_item_scores(tmp_path):
+    path = write_items(tmp_path, pqa_items(random.Random(1)))
+    accs, cfds, failed, total = PQA.evaluate_predictions(path)
+    estimates = PQA.item_scores(path, store_dir=None).point_estimates()
+    assert sum(accs) / len(accs) == pytest.approx(estimates['Accuracy'])
+    assert failed / total == pytest.approx(estimates['Failed'])
+    assert len(cfds) == len(accs) and all(0 <= c <= 100 for c in cfds)
+
+
+def test_err_evaluator_matches_item_scores(tmp_path):
+    path = write_items(tmp_path, err_items(random.Random(2)))
+    preds, gts, failed, total = ERR.evaluate_correction_task(path)
+    metrics = ERR.compute_classification_metrics(preds, gts)
+    estimates = ERR.item_scores(path, store_dir=None).point_estimates()
+    for name, metric in (('accuracy', 'Accuracy'), ('precision', 'Precision'), ('recall', 'Recall'), ('f1', 'F1')):
+        assert metrics[name] == pytest.approx(estimates[metric])
+    assert failed / total == pytest.approx(estimates['Failed'])
+    assert ERR.compute_classification_metrics([], []) == {'accuracy': 0, 'precision': 0, 'recall': 0, 'f1': 0}
+
+
+def test_ord_evaluator_matches_item_scores(tmp_path):
+    path = write_items(tmp_path, ord_items(random.Random(3)))
+    preds, gts, failed, total = ORD.evaluate_sorting_predictions(path)
+    estimates = ORD.item_scores(path, store_dir=None).point_estimates()
+    assert ORD.calculate_exact_match(gts, preds) == pytest.approx(estimates['Exact_Match'])
+    pooled, per_item = ORD.calculate_kendall_tau(gts, preds)
+    assert pooled == pytest.approx(estimates['Kendall_Tau'])
+    assert np.nanmean(per_item) == pytest.approx(estimates['Mean_Item_Tau'])
+    assert failed / total == pytest.approx(estimates['Failed'])
+
+
+def test_rea_err_keeps_the_original_units(tmp_path):
+    items = [
+        {'id': str(i), 'generated_response': '[ANSWER_START]False[ANSWER_END]', 'is_correct': False}
+        for i in range(6)
+    ]
+    for item, verdict in zip(items, ['True', 'True', 'False', 'maybe']):  # The last 2 items are not judged
+        item['LLM_judge'] = f'[ANSWER_START]{verdict}[ANSWER_END]' if verdict != 'maybe' else verdict
+    path = write_items(tmp_path, items)
+
+    results = REA_ERR.evaluate_step_reasoning_model(path, store_dir=None)
+    assert results == {'Consistency': pytest.approx(200 / 3), 'Failure_Rate': 25.0, 'Total': 4, 'Failed': 1}
+    estimates = REA_ERR.item_scores(path, store_dir=None).point_estimates()
+    assert estimates['Consistency'] == results['Consistency']
+    assert estimates['Accuracy'] == 1.0  # ERR metrics are over all items
+
+
+class FakeEmbeddingModel:
+    """Letter counts as embeddings, so similar steps get similar vectors."""
+
+    def encode(self, texts, batch_size=None, show_progress_bar=None):
+        return np.array([[text.lower().count(c) for c in 'abcdefghijklmnopqrstuvwxyz'] for text in texts], dtype=float)
+
+
+class FakeKeywordModel:
+    def extract_keywords(self, docs, top_n):
+        keywords = [[(word, 1.0) for word in sorted(set(doc.lower().split()))[:top_n]] for doc in docs]
+        return keywords[0] if len(docs) == 1 else keywords
+
+
+def gen_items(rng, n=40):
+    with open(os.path.join(DATA_DIR, 'GEN_test.json'), 'r', encoding='utf-8') as f:
+        samples = json.load(f)[:n]
+    for sample in samples:
+        steps = rng.sample(sample['output'], rng.randint(1, len(sample['output'])))
+        sample['generated_response'] = None if rng.random() < 0.1 else '\n'.join(steps + ['Incubate overnight.'])
+    return samples
+
+
+@pytest.mark.parametrize('embedding_cache', [False, True])
+def test_gen_chunks_do_not_change_scores(tmp_path, monkeypatch, embedding_cache):
+    monkeypatch.setattr(GEN, 'EMBEDDING_MODEL', FakeEmbeddingModel())
+    monkeypatch.setattr(GEN, 'KEYWORD_MODEL', FakeKeywordModel())
+    monkeypatch.setattr(GEN, 'EMBEDDING_CACHE_DIR', str(tmp_path / 'embeddings') if embedding_cache else None)
+    monkeypatch.setattr(GEN, 'REFERENCE_KEYWORD_INDEX', str(tmp_path / 'keywords.json'))
+    path = write_items(tmp_path, gen_items(random.Random(6)))
+    metrics = ('keyword', 'step')
+
+    whole = GEN.item_scores(path, metrics=metrics, store_dir=None)
+    monkeypatch.setattr(GEN, 'SCORING_CHUNK_SIZE', 3)
+    chunked = GEN.item_scores(path, metrics=metrics, store_dir=None)
+    assert chunked.point_estimates() == whole.point_estimates()
+    assert 0 < whole.point_estimates()['Step_Recall'] < 1
+    assert whole.point_estimates()['Failed'] > 0
+
+    # Scores stored chunk by chunk are reused as they are
+    stored = GEN.item_scores(path, metrics=metrics, store_dir=str(tmp_path / 'scores'))
+    assert GEN.item_scores(path, metrics=metrics, store_dir=str(tmp_path / 'scores')).point_estimates() == \
+        stored.point_estimates() == whole.point_estimates()
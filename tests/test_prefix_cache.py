@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import importlib
+
+import pytest
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import (
+    AutoModelForCausalLM, AutoTokenizer, GPT2Config, GPT2LMHeadModel, MambaConfig, MambaForCausalLM,
+    PreTrainedTokenizerFast
+)
+
+from prompt_format import generate_user_prompt, split_user_prompt
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data')
+MAX_NEW_TOKENS = 6
+
+
+def load_samples(task_name, count=4):
+    with open(os.path.join(DATA_DIR, f"{task_name}_test.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)[:count]
+
+
+def build_tokenizer(bos=False):
+    """A small byte-level BPE trained on the prompts, so tokens merge across the prefix/suffix boundary."""
+    texts = [generate_user_prompt(sample, task, layout)
+             for task in ('ERR', 'GEN') for layout in ('original', 'prefix') for sample in load_samples(task, 20)]
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=500, special_tokens=['<eos>', '<bos>'],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(texts, trainer)
+    if bos:
+        tokenizer.post_processor = processors.TemplateProcessing(
+            single='<bos> $A', special_tokens=[('<bos>', tokenizer.token_to_id('<bos>'))])
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token='<eos>', bos_token='<bos>' if bos else None)
+
+
+def build_gpt2(tokenizer):
+    # A larger initializer range makes the greedy output of the random model depend on the prompt
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=2048, n_embd=32, n_layer=2, n_head=2,
+                        initializer_range=0.2, bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    return GPT2LMHeadModel(config).double().eval()
+
+
+def build_mamba(tokenizer):
+    # A state-space model: it keeps no key/value cache that could be cropped
+    torch.manual_seed(0)
+    config = MambaConfig(vocab_size=len(tokenizer), hidden_size=16, num_hidden_layers=1, state_size=4,
+                         initializer_range=0.2, bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    return MambaForCausalLM(config).double().eval()
+
+
+@pytest.fixture
+def local(monkeypatch, tmp_path):
+    """generate_response_local.py running a tiny GPT-2 on CPU with greedy decoding and no response cache."""
+    monkeypatch.chdir(tmp_path)
+    tokenizer = build_tokenizer()
+    model = build_gpt2(tokenizer)
+    monkeypatch.setattr(AutoTokenizer, 'from_pretrained', lambda *args, **kwargs: tokenizer)
+    monkeypatch.setattr(AutoModelForCausalLM, 'from_pretrained', lambda *args, **kwargs: model)
+    monkeypatch.delitem(sys.modules, 'generate_response_local', raising=False)
+    module = importlib.import_module('generate_response_local')
+    monkeypatch.setattr(module, 'DEVICE', 'cpu')
+    monkeypatch.setattr(module, 'SAMPLING_PARAMS', {'do_sample': False})
+    monkeypatch.setattr(module, 'response_cache', None)
+    return module
+
+
+def use_model(module, monkeypatch, tokenizer=None, model=None):
+    if tokenizer is not None:
+        tokenizer.padding_side = 'left'
+        tokenizer.pad_token = tokenizer.eos_token
+        monkeypatch.setattr(module, 'tokenizer', tokenizer)
+    if model is not None:
+        monkeypatch.setattr(module, 'model', model)
+    monkeypatch.setattr(module, 'prefix_caches', {})
+
+
+def plain_generate(module, prompt):
+    input_ids = module.tokenizer(prompt, return_tensors='pt')['input_ids']
+    with torch.no_grad():
+        outputs = module.model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=MAX_NEW_TOKENS,
+            do_sample=False,
+            pad_token_id=module.tokenizer.pad_token_id
+        )
+    return module.tokenizer.decode(outputs[0, input_ids.shape[1]:], skip_special_tokens=True).strip()
+
+
+def prefix_generate(module, task_name, layout, samples):
+    responses = []
+    for sample in samples:
+        prefix, suffix = split_user_prompt(sample, task_name, layout)
+        responses.append(module.generate_response_with_prefix(prefix, suffix, max_new_tokens=MAX_NEW_TOKENS))
+    return responses
+
+
+@pytest.mark.parametrize('layout', ['prefix', 'original'])
+def test_prefix_cache_matches_plain_generate(local, layout):
+    samples = load_samples('ERR')
+    responses = prefix_generate(local, 'ERR', layout, samples)
+    assert responses == [plain_generate(local, generate_user_prompt(sample, 'ERR', layout)) for sample in samples]
+    assert all(cache is not None for _, cache in local.prefix_caches.values())
+    assert len(set(responses)) > 1  # The output depends on the prompt
+
+
+def test_prefix_ending_inside_a_token_is_cropped(local):
+    # A short prompt, so that one wrongly cached token would change the output
+    prompt = "Determine whether the target step"
+    cut = len("Determine whether the target st")
+    prefix_ids = local.tokenizer(prompt[:cut])['input_ids']
+    assert local.tokenizer(prompt)['input_ids'][:len(prefix_ids)] != prefix_ids  # The last prefix token merges
+
+    response = local.generate_response_with_prefix(prompt[:cut], prompt[cut:], max_new_tokens=MAX_NEW_TOKENS)
+    assert response == plain_generate(local, prompt)
+
+
+def test_batched_matches_plain_generate(local):
+    prompts = [generate_user_prompt(sample, 'ERR', 'prefix') for sample in load_samples('ERR')]
+    assert local.generate_responses_batched(prompts, max_new_tokens=MAX_NEW_TOKENS) == \
+        [plain_generate(local, prompt) for prompt in prompts]
+
+
+@pytest.mark.parametrize('bos', [False, True])
+def test_empty_prefix_skips_the_prefill(local, monkeypatch, bos):
+    use_model(local, monkeypatch, tokenizer=build_tokenizer(bos))
+    samples = load_samples('GEN')
+    assert split_user_prompt(samples[0], 'GEN', 'original')[0] == ''
+
+    responses = prefix_generate(local, 'GEN', 'original', samples)
+    assert responses == [plain_generate(local, generate_user_prompt(sample, 'GEN', 'original')) for sample in samples]
+    assert local.prefix_caches[''] == ([local.tokenizer.bos_token_id] if bos else [], None)
+
+
+def test_model_without_croppable_cache_falls_back(local, monkeypatch, capsys):
+    use_model(local, monkeypatch, model=build_mamba(local.tokenizer))
+    samples = load_samples('ERR', 2)
+
+    responses = prefix_generate(local, 'ERR', 'prefix', samples)
+    assert responses == [plain_generate(local, generate_user_prompt(sample, 'ERR', 'prefix')) for sample in samples]
+    assert [cache for _, cache in local.prefix_caches.values()] == [None]
+    assert "Not reusing the prefix KV cache" in capsys.readouterr().out
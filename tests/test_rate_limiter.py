@@ -0,0 +1,92 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket, retry_after_seconds
+
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def test_token_bucket_debt_is_paid_back_at_the_rate():
+    bucket = TokenBucket(rate=2, capacity=4)
+    assert bucket.reserve(4, bucket.updated_at) == 0
+    assert bucket.reserve(3, bucket.updated_at) == pytest.approx(1.5)
+    bucket.refund(3, bucket.updated_at)
+    assert bucket.reserve(1, bucket.updated_at + 1) == 0  # 2 units refilled in one second
+    assert bucket.tokens == pytest.approx(1)
+    bucket.refund(100, bucket.updated_at)
+    assert bucket.tokens == 4  # Never above the capacity
+
+
+def test_rate_limit_halves_the_rate_once_per_backoff_window():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000)
+    delay = limiter.on_error(APIError(429), attempt=0)
+    assert 0 <= delay <= 1
+    assert limiter.fraction == 0.5
+    assert limiter.requests.rate == pytest.approx(5)
+    assert limiter.tokens.rate == pytest.approx(500)
+
+    # A burst of concurrent 429s is a single congestion event
+    limiter.paused_until = time.monotonic() + 60
+    limiter.on_error(APIError(429), attempt=0)
+    assert limiter.fraction == 0.5
+    assert limiter.rate_limited == 2
+
+    limiter.paused_until = 0
+    for _ in range(20):
+        limiter.on_error(APIError(429), attempt=0)
+        limiter.paused_until = 0
+    assert limiter.fraction == limiter.min_fraction
+
+
+def test_successes_increase_the_rate_additively_up_to_the_budget():
+    limiter = RateLimiter(requests_per_minute=600)
+    limiter.on_error(APIError(429), attempt=0)
+    for _ in range(5):
+        limiter.on_success()
+    assert limiter.fraction == pytest.approx(0.5 + 5 * limiter.increase_step)
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.fraction == 1.0
+    assert limiter.requests.rate == pytest.approx(10)
+
+
+def test_retry_after_pauses_every_caller_up_to_max_backoff():
+    limiter = RateLimiter(requests_per_minute=600, max_backoff=10)
+    delay = limiter.on_error(APIError(429, {'retry-after': '120'}), attempt=0)
+    assert 10 <= delay <= 11
+    assert 9 < limiter.reserve() <= 10
+
+    limiter = RateLimiter(requests_per_minute=600)
+    delay = limiter.on_error(APIError(429, {'retry-after-ms': '2500'}), attempt=0)
+    assert 2.5 <= delay <= 3.5
+
+
+def test_other_errors_back_off_without_slowing_down():
+    limiter = RateLimiter(requests_per_minute=600, max_backoff=8)
+    for attempt in range(6):
+        assert min(8, 2 ** attempt) / 2 <= limiter.on_error(APIError(500), attempt) <= min(8, 2 ** attempt)
+    assert limiter.fraction == 1.0
+    assert limiter.rate_limited == 0
+    assert limiter.reserve() == 0
+
+
+def test_token_usage_corrects_the_estimate():
+    limiter = RateLimiter(tokens_per_minute=6000)
+    assert limiter.reserve(tokens=6000) == 0
+    assert limiter.reserve(tokens=100) > 0
+    limiter.on_success(estimated_tokens=6000, used_tokens=1000)  # 5000 tokens were over-reserved
+    assert limiter.reserve(tokens=100) == 0
+
+
+def test_retry_after_seconds_formats():
+    assert retry_after_seconds(APIError(429)) is None
+    assert retry_after_seconds(APIError(429, {'retry-after': '3'})) == 3
+    assert retry_after_seconds(APIError(429, {'retry-after': 'soon'})) is None
+    assert retry_after_seconds(APIError(429, {'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0
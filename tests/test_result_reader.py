@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+import result_reader
+from checkpoint import CheckpointStore
+from result_reader import iter_results
+
+
+def result_items():
+    return [
+        {'id': 'TEST-ORD-000000', 'generated_response': '<think>' + 'x' * 5000 + '</think>[ANSWER_START][1, 0][ANSWER_END]'},
+        {'id': 'TEST-ORD-000001', 'generated_response': 'Ünïcode, "quotes", [brackets] and {braces} \\ \n'},
+        {'id': 'TEST-ORD-000002', 'generated_response': None, 'score': 1.5, 'nested': {'list': [1, [2, []]]}},
+        {'id': 'TEST-ORD-000003'},
+    ]
+
+
+@pytest.mark.parametrize('indent', [None, 4])
+@pytest.mark.parametrize('chunk_size', [7, 1 << 20])
+def test_json_array_matches_json_load(tmp_path, monkeypatch, indent, chunk_size):
+    monkeypatch.setattr(result_reader, 'ijson', None)
+    monkeypatch.setattr(result_reader, 'CHUNK_SIZE', chunk_size)  # Items span many chunks
+    path = str(tmp_path / 'results.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result_items(), f, indent=indent, ensure_ascii=False)
+    with open(path, 'r', encoding='utf-8') as f:
+        assert list(iter_results(path)) == json.load(f)
+
+
+@pytest.mark.parametrize('content', ['[]', '  \n[ ]\n'])
+def test_empty_json_array(tmp_path, content):
+    path = tmp_path / 'results.json'
+    path.write_text(content, encoding='utf-8')
+    assert list(iter_results(str(path))) == []
+
+
+def test_truncated_json_array_is_an_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_reader, 'ijson', None)
+    path = tmp_path / 'results.json'
+    path.write_text(json.dumps(result_items())[:-40], encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_results(str(path)))
+
+
+def test_json_lines(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    path.write_text('\n'.join(json.dumps(item) for item in result_items()) + '\n\n', encoding='utf-8')
+    assert list(iter_results(str(path))) == result_items()
+
+
+def test_parquet_columns_are_joined_from_the_benchmark(tmp_path):
+    pytest.importorskip('pyarrow')
+    with open(os.path.join(result_reader.DATA_DIR, 'ORD_test.json'), 'r', encoding='utf-8') as f:
+        benchmark = json.load(f)[:3]
+    output_file = str(tmp_path / 'ORD_test_mock.parquet')
+    checkpoint = CheckpointStore(output_file)
+    for sample in benchmark:
+        checkpoint.append({**sample, 'generated_response': f"[ANSWER_START]{sample['id']}[ANSWER_END]"})
+    checkpoint.compact()
+
+    items = list(iter_results(output_file, columns=('generated_response', 'correct_steps', 'type')))
+    assert items == [
+        {'id': sample['id'], 'generated_response': f"[ANSWER_START]{sample['id']}[ANSWER_END]",
+         'correct_steps': sample['correct_steps'], 'type': sample['type']}
+        for sample in benchmark
+    ]
+    assert list(iter_results(output_file)) == [
+        {'id': sample['id'], 'generated_response': f"[ANSWER_START]{sample['id']}[ANSWER_END]"} for sample in benchmark
+    ]
@@ -0,0 +1,60 @@
+import json
+import random
+
+import PQA
+from score_store import ScoreStore
+from test_stats import pqa_items
+
+
+def test_scores_persist_per_id_response_and_version(tmp_path):
+    store_dir = str(tmp_path / 'scores')
+    item = {'id': 'TEST-PQA-000000', 'generated_response': 'A & 90', 'answer': 'A'}
+    store = ScoreStore(store_dir, 'PQA', '1', ('generated_response', 'answer'))
+    key = store.key(item)
+    assert store.get(key) is None
+    store.put(key, {'correct': 1.0})
+    store.close()
+
+    store = ScoreStore(store_dir, 'PQA', '1', ('generated_response', 'answer'))
+    assert store.get(key) == {'correct': 1.0}
+    assert store.get(store.key({**item, 'generated_response': 'B & 90'})) is None  # A regenerated response
+    assert (store.hits, store.misses) == (1, 1)
+    store.close()
+
+    for task, version in (('ERR', '1'), ('PQA', '2')):
+        store = ScoreStore(store_dir, task, version, ('generated_response', 'answer'))
+        assert store.get(key) is None
+        store.close()
+
+
+def test_item_scores_only_score_new_items(tmp_path, monkeypatch):
+    store_dir = str(tmp_path / 'scores')
+    items = pqa_items(random.Random(7), n=50)
+    path = str(tmp_path / 'results.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(items, f)
+    scored = []
+    score_item = PQA.score_item
+
+    def counting_score_item(item):
+        scored.append(item['id'])
+        return score_item(item)
+
+    monkeypatch.setattr(PQA, 'score_item', counting_score_item)
+    first = PQA.item_scores(path, store_dir).point_estimates()
+    assert len(scored) == 50
+
+    items[3]['generated_response'] = '[ANSWER_START]B & 10[ANSWER_END]'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(items, f)
+    scored.clear()
+    second = PQA.item_scores(path, store_dir).point_estimates()
+    assert scored == [items[3]['id']]
+    assert second == PQA.item_scores(path, store_dir=None).point_estimates()
+    assert second != first
+
+    # Bumping the metric version scores every item again
+    monkeypatch.setattr(PQA, 'METRIC_VERSION', PQA.METRIC_VERSION + '.test')
+    scored.clear()
+    assert PQA.item_scores(path, store_dir).point_estimates() == second
+    assert len(scored) == 50
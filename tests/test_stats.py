@@ -0,0 +1,155 @@
+import random
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+import ERR
+import ORD
+import PQA
+from stats import ItemScores, collect_item_scores, paired_test, ratio_of, safe_divide
+
+
+def scores_of(module, items):
+    return collect_item_scores(items, module.score_item, module.ITEM_COLUMNS, module.METRICS, group_field=None)
+
+
+def pqa_items(rng, n=200):
+    items = []
+    for i in range(n):
+        if rng.random() < 0.1:
+            response = "no tags"
+        else:
+            response = f"[ANSWER_START]{rng.choice('AB')} & {rng.randint(0, 100)}[ANSWER_END]"
+        items.append({'id': str(i), 'generated_response': response, 'answer': 'A'})
+    return items
+
+
+def err_items(rng, n=200):
+    items = []
+    for i in range(n):
+        response = "maybe" if rng.random() < 0.1 else f"[ANSWER_START]{rng.choice(['True', 'False'])}[ANSWER_END]"
+        items.append({'id': str(i), 'generated_response': response, 'is_correct': rng.random() < 0.5})
+    return items
+
+
+def ord_items(rng, n=200):
+    items = []
+    for i in range(n):
+        steps = [f"step {j}" for j in range(rng.randint(1, 6))]
+        wrong = rng.sample(steps, len(steps))
+        order = rng.sample(range(len(steps)), len(steps))
+        response = "[ANSWER_START][0, 0][ANSWER_END]" if rng.random() < 0.1 else f"[ANSWER_START]{order}[ANSWER_END]"
+        items.append({'id': str(i), 'generated_response': response, 'wrong_steps': wrong, 'correct_steps': steps})
+    return items
+
+
+def test_ratio_of_zero_denominator_is_zero():
+    metric = ratio_of('a', 'b')
+    assert metric({'a': np.array(3.0), 'b': np.array(0.0)}, 5) == 0
+    assert np.array_equal(metric({'a': np.array([1.0, 2.0]), 'b': np.array([0.0, 4.0])}, 5), [0.0, 0.5])
+    assert ratio_of('a')({'a': np.array(0.0)}, 0) == 0
+    assert safe_divide(1, 0) == 0
+
+
+def test_empty_scores_have_zero_metrics():
+    scores = scores_of(PQA, [])
+    assert scores.point_estimates() == {'Accuracy': 0, 'Brier_Score': 0, 'Failed': 0}
+
+
+def test_pqa_point_estimates_match_baseline():
+    items = pqa_items(random.Random(1))
+    accs, cfds, failed = [], [], 0
+    for item in items:
+        try:
+            answer, confidence = PQA.extract_answer_and_confidence(item['generated_response'])
+        except ValueError:
+            failed += 1
+            continue
+        accs.append(int(answer == item['answer']))
+        cfds.append(confidence)
+
+    estimates = scores_of(PQA, items).point_estimates()
+    assert estimates['Accuracy'] == pytest.approx(sum(accs) / len(accs))
+    assert estimates['Brier_Score'] == pytest.approx(np.mean((np.array(cfds) / 100 - np.array(accs)) ** 2))
+    assert estimates['Failed'] == pytest.approx(failed / len(items))
+
+
+def test_err_point_estimates_match_baseline():
+    items = err_items(random.Random(2))
+    preds, gts = [], []
+    for item in items:
+        try:
+            preds.append(ERR.extract_binary_answer(item['generated_response']))
+        except ValueError:
+            continue
+        gts.append(item['is_correct'])
+    tp = sum(p is False and g is False for p, g in zip(preds, gts))
+    fp = sum(p is False and g is True for p, g in zip(preds, gts))
+    fn = sum(p is True and g is False for p, g in zip(preds, gts))
+    precision, recall = tp / (tp + fp), tp / (tp + fn)
+
+    estimates = scores_of(ERR, items).point_estimates()
+    assert estimates['Accuracy'] == pytest.approx(sum(p == g for p, g in zip(preds, gts)) / len(preds))
+    assert estimates['Precision'] == pytest.approx(precision)
+    assert estimates['Recall'] == pytest.approx(recall)
+    assert estimates['F1'] == pytest.approx(2 * precision * recall / (precision + recall))
+
+
+def test_ord_point_estimates_match_baseline():
+    items = ord_items(random.Random(3))
+    exact, concordant, pairs, parsed = 0, 0, 0, 0
+    for item in items:
+        try:
+            pr, gt = ORD.extract_predicted_order(item['generated_response'], item['wrong_steps'], item['correct_steps'])
+        except ValueError:
+            continue
+        parsed += 1
+        exact += int(pr == gt)
+        gt_rank = {step: i for i, step in enumerate(gt)}
+        pr_rank = {step: i for i, step in enumerate(pr)}
+        for a, b in combinations(gt_rank, 2):
+            concordant += int((gt_rank[a] - gt_rank[b]) * (pr_rank[a] - pr_rank[b]) > 0)
+            pairs += 1
+
+    estimates = scores_of(ORD, items).point_estimates()
+    assert parsed < len(items)  # Repeated indices are failures
+    assert estimates['Exact_Match'] == pytest.approx(exact / parsed)
+    assert estimates['Kendall_Tau'] == pytest.approx((2 * concordant - pairs) / pairs)
+    assert estimates['Failed'] == pytest.approx(1 - parsed / len(items))
+
+
+def test_bootstrap_interval_contains_estimate_and_is_reproducible():
+    scores = scores_of(ERR, err_items(random.Random(4)))
+    intervals = scores.bootstrap(n_resamples=2000)
+    assert intervals == scores.bootstrap(n_resamples=2000)
+    for metric, (estimate, low, high) in intervals.items():
+        assert estimate == scores.point_estimates()[metric]
+        assert low <= estimate <= high
+        assert low < high
+
+
+def test_bootstrap_of_constant_column_has_zero_width():
+    scores = ItemScores([str(i) for i in range(50)], {'x': np.ones(50)}, {'Mean': ratio_of('x')})
+    assert scores.bootstrap(n_resamples=500) == {'Mean': (1.0, 1.0, 1.0)}
+
+
+def test_paired_test_of_identical_models():
+    scores = scores_of(PQA, pqa_items(random.Random(5)))
+    for result in paired_test(scores, scores, n_resamples=1000).values():
+        assert result['diff'] == 0
+        assert result['ci_low'] == result['ci_high'] == 0
+        assert result['p_value'] == 1
+
+
+def test_paired_test_aligns_ids_and_detects_a_difference():
+    ids = [str(i) for i in range(100)]
+    metrics = {'Accuracy': ratio_of('correct')}
+    better = ItemScores(ids, {'correct': np.r_[np.ones(80), np.zeros(20)]}, metrics)
+    # B is stored in a different order and has one extra item, which is ignored
+    worse = ItemScores(ids[::-1] + ['extra'], {'correct': np.r_[np.zeros(60), np.ones(41)]}, metrics)
+
+    result = paired_test(better, worse, n_resamples=1000)['Accuracy']
+    assert result['diff'] == pytest.approx(0.8 - 0.4)
+    assert result['ci_low'] > 0
+    assert result['p_value'] < 0.01